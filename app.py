@@ -1,252 +1,419 @@
-import numpy as np
-from flask import Flask, render_template, request, redirect, url_for
-import pandas as pd
-from datetime import datetime
-import matplotlib.pyplot as plt
+from flask import (Blueprint, Flask, current_app, render_template, request, redirect, url_for, send_file,
+                   abort, make_response, jsonify)
+import argparse
 import io
 import base64
+import hashlib
+import json
 import os
+from datetime import datetime, timezone
 
-app = Flask(__name__)
-
-# Terrain adjustment factors (based on terrain type)
-TERRAIN_FACTORS = {
-    "Flat": 1.0,
-    "Inclined": 0.9,
-    "Rocky": 0.8,
-    "Muddy": 0.7
-}
-
-# Function to evaluate TKPH conditions
-def evaluate_conditions(tkph_final, suitable_tkph):
-    if tkph_final >= suitable_tkph * 0.90:
-        return "Normal Condition"
-    elif tkph_final >= suitable_tkph * 0.80:
-        return "Warning Condition"
-    elif tkph_final >= suitable_tkph * 0.70:
-        return "Danger Condition"
-    else:
-        return "Critical Condition"
-
-# Tire wear damage adjustment factors
-def get_tire_damage_factor(wear_percentage):
-    if wear_percentage <= 10:
-        return 1.0  # Minimal Wear
-    elif 10 < wear_percentage <= 25:
-        return 0.95  # Light Wear
-    elif 25 < wear_percentage <= 50:
-        return 0.85  # Moderate Wear
-    elif 50 < wear_percentage <= 75:
-        return 0.7   # Severe Wear
-    else:  # 75 < wear_percentage <= 100
-        return 0.5   # Critical Wear
-
-# Function to remove outliers using the Interquartile Range (IQR) method
-def remove_outliers(data):
-    Q1 = np.percentile(data, 25)
-    Q3 = np.percentile(data, 75)
-    IQR = Q3 - Q1
-    lower_bound = Q1 - 1.5 * IQR
-    upper_bound = Q3 + 1.5 * IQR
-    return [x for x in data if lower_bound <= x <= upper_bound]
-
-# Function to calculate mean tire load
-def calculate_mean_tyre_load(tyre_load_empty, tyre_load_fully_loaded):
-    return (tyre_load_empty + tyre_load_fully_loaded) / 2
-
-# Function to calculate average speed
-def calculate_average_speed(round_trip_distances, cycles_per_shift, total_shift_hours):
-    # Remove outliers from round trip distances
-    round_trip_distances = remove_outliers(round_trip_distances)
-    
-    # Calculate mean of round trip distances
-    mean_distance = np.mean(round_trip_distances)
-    
-    # Calculate average speed
-    average_speed = (mean_distance * cycles_per_shift) / total_shift_hours
-    return average_speed
-
-# Function to calculate TKPH
-def calculate_tkph(distance_loaded, cycle_time, terrain_type, tire_wear_percentage,
-                   tyre_load_empty, tyre_load_fully_loaded, round_trip_distances, 
-                   cycles_per_shift, total_shift_hours):
-    # Calculate mean tire load
-    mean_tyre_load = calculate_mean_tyre_load(tyre_load_empty, tyre_load_fully_loaded)
-    
-    # Calculate average speed
-    average_speed = calculate_average_speed(round_trip_distances, cycles_per_shift, total_shift_hours)
-    
-    # Terrain and wear adjustments
-    terrain_factor = TERRAIN_FACTORS.get(terrain_type, 1.0)
-    tire_damage_factor = get_tire_damage_factor(min(tire_wear_percentage, 100))  # Cap wear percentage at 100
-    
-    # Base TKPH
-    tkph_base = (mean_tyre_load * distance_loaded) / cycle_time
-    
-    # Adjust for terrain and wear
-    tkph_adjusted = tkph_base * terrain_factor * tire_damage_factor
-    
-    # Final TKPH (without unnecessary speed multiplier)
-    tkph_final = tkph_adjusted
-    
-    # Suitable TKPH (base calculation without terrain and wear adjustments)
-    suitable_tkph = tkph_base
-    
-    return tkph_final, suitable_tkph
+from tkph.api import api
+from tkph.bulk import score_readings_file
+from tkph.chart_cache import DEFAULT_MAX_BYTES as DEFAULT_CHART_CACHE_BYTES, ChartCache
+from tkph.charts import CHART_KINDS, RENDERERS as CHART_RENDERERS, trend_chart_json
+from tkph.columnar import ColumnarHistory
+from tkph.core import (TERRAIN_FACTORS, evaluate_conditions, get_tire_damage_factor, remove_outliers,
+                       calculate_mean_tyre_load, calculate_average_speed, calculate_tkph)
+from tkph.fleet import CONDITION_ORDER, fleet_status
+from tkph.forecast import FleetForecast
+from tkph.metrics import Metrics, init_app as init_metrics, stage
+from tkph.rolling_stats import RollingStats
+from tkph.rules import get_rules
+from tkph.snapshot import load_history as load_history_snapshot
+from tkph.store import format_timestamp, get_store
+from tkph.worker import BackgroundWriter
 
-# Function to save TKPH data to Excel
-def save_tkph_data(dumper_id, tyre_position, tkph_final, suitable_tkph):
-    file_path = 'tkph_tracking.xlsx'
-    
-    try:
-        # Check if the file exists
-        if os.path.exists(file_path):
-            # Read existing data
-            df = pd.read_excel(file_path, engine='openpyxl')
-        else:
-            # Create a new DataFrame with appropriate columns
-            df = pd.DataFrame(columns=['Timestamp', 'Dumper ID', 'Tyre Position', 'TKPH Final', 'Suitable TKPH'])
-    
-    except Exception as e:
-        # If any error occurs while reading, create a new DataFrame
-        print(f"Error reading the Excel file: {e}")
-        df = pd.DataFrame(columns=['Timestamp', 'Dumper ID', 'Tyre Position', 'TKPH Final', 'Suitable TKPH'])
-    
-    # Add new row with a more formatted timestamp
-    new_row = {
-        'Timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),  # More readable format
-        'Dumper ID': dumper_id,
-        'Tyre Position': tyre_position,
-        'TKPH Final': tkph_final,
-        'Suitable TKPH': suitable_tkph
+# Pages of the web app; create_app() mounts them together with the JSON API
+web = Blueprint('web', __name__)
+
+# Settings read by create_app(), from the environment unless overridden by
+# the config mapping passed in:
+#   TKPH_STORE_BACKEND / TKPH_STORE_PATH - tracking store (see tkph.store)
+#   TKPH_CHART_MODE    - chart on the result page: 'svg' (built from the
+#                        data, no matplotlib) or 'png' (matplotlib raster)
+#   TKPH_ASYNC_WRITES  - persist readings on the background writer (default)
+#                        or synchronously inside the request ('0')
+#   TKPH_SNAPSHOT_PATH - binary snapshot to seed the in-memory history from
+#   TKPH_CHART_CACHE_BYTES - size of the rendered chart cache
+#   TKPH_RULES_PATH / TKPH_SITE - scoring rules file and site (see tkph.rules)
+#   TKPH_METRICS / TKPH_PROFILE_SAMPLE / TKPH_PROFILE_DIR - request metrics
+#                        and sampled profiling (see tkph.metrics)
+def default_config():
+    return {
+        'TKPH_STORE_BACKEND': os.environ.get('TKPH_STORE_BACKEND'),
+        'TKPH_STORE_PATH': os.environ.get('TKPH_STORE_PATH'),
+        'TKPH_CHART_MODE': os.environ.get('TKPH_CHART_MODE', 'svg'),
+        'TKPH_ASYNC_WRITES': os.environ.get('TKPH_ASYNC_WRITES', '1') != '0',
+        'TKPH_SNAPSHOT_PATH': os.environ.get('TKPH_SNAPSHOT_PATH'),
+        'TKPH_CHART_CACHE_BYTES': DEFAULT_CHART_CACHE_BYTES,
+        'TKPH_RULES_PATH': os.environ.get('TKPH_RULES_PATH'),
+        'TKPH_SITE': os.environ.get('TKPH_SITE'),
+        'TKPH_METRICS': os.environ.get('TKPH_METRICS', '0') == '1',
+        'TKPH_PROFILE_SAMPLE': float(os.environ.get('TKPH_PROFILE_SAMPLE', '0')),
+        'TKPH_PROFILE_DIR': os.environ.get('TKPH_PROFILE_DIR'),
     }
-    
-    # Append the new row to the DataFrame
-    df = pd.concat([df, pd.DataFrame([new_row])], ignore_index=True)
-    
-    # Save updated data back to the Excel file
-    df.to_excel(file_path, index=False, engine='openpyxl')
 
-# Function to generate TKPH trend chart
+
+# Everything an app instance keeps in memory besides the store: the rendered
+# chart cache, rolling statistics, the columnar history and the background
+# writer. One instance per app, and so per worker process: nothing here is
+# shared between workers, which only meet in the tracking store (SQLite
+# serialises their writes; the Excel backend holds a file lock).
+class TrackingState:
+    def __init__(self, config):
+        self.store_backend = config.get('TKPH_STORE_BACKEND')
+        self.store_path = config.get('TKPH_STORE_PATH')
+        self.chart_mode = config['TKPH_CHART_MODE']
+        self.async_writes = config['TKPH_ASYNC_WRITES']
+        self.rules_path = config.get('TKPH_RULES_PATH')
+        self.site = config.get('TKPH_SITE')
+
+        # This app's request metrics (tkph.metrics), recorded only if enabled
+        self.metrics = Metrics(enabled=config['TKPH_METRICS'])
+
+        # Rendered trend charts, keyed by tyre and data version
+        self.chart_cache = ChartCache(config['TKPH_CHART_CACHE_BYTES'])
+
+        # Running per-tyre statistics, caught up incrementally from the store
+        self.rolling_stats = RollingStats()
+
+        # Per-tyre condition trend fits for tyre life forecasts, updated the same way
+        self.forecast = FleetForecast()
+
+        # Compact in-memory copy of the tracking history that chart queries
+        # read from, loaded here at startup so the first chart request does
+        # not pay for it (with gunicorn's preload_app the master loads it once
+        # and the workers inherit it). A snapshot (python -m tkph.snapshot
+        # from-store DIR) seeds it from memory-mapped columns, so only newer
+        # readings are read from the store.
+        self.history = ColumnarHistory()
+        snapshot_path = config.get('TKPH_SNAPSHOT_PATH')
+        if snapshot_path and os.path.exists(snapshot_path):
+            load_history_snapshot(self.history, snapshot_path, self.store())
+        self.history.sync(self.store())
+
+        # Persistence and chart rendering off the request path
+        self.background_writer = BackgroundWriter(self.store, after_write=self.after_readings_saved,
+                                                  metrics=self.metrics)
+
+    def store(self):
+        return get_store(self.store_backend, self.store_path)
+
+    # The site's current scoring rules
+    def rules(self):
+        return get_rules(self.site, self.rules_path)
+
+    # Function to save TKPH data to the tracking store
+    def save_tkph_data(self, dumper_id, tyre_position, tkph_final, suitable_tkph, terrain_type=None,
+                       tire_wear_percentage=None, rule_version=None, speed_multiplier=None):
+        store = self.store()
+        store.append(dumper_id, tyre_position, tkph_final, suitable_tkph, terrain_type=terrain_type,
+                     tire_wear_percentage=tire_wear_percentage, rule_version=rule_version,
+                     speed_multiplier=speed_multiplier)
+        self.rolling_stats.sync(store)
+        self.forecast.sync(store)
+        self.history.sync(store)
+
+    # Function run by the background writer once a batch of readings is stored:
+    # catch up the rolling stats and forecasts and pre-render the changed tyres' charts
+    def after_readings_saved(self, series):
+        store = self.store()
+        self.rolling_stats.sync(store)
+        self.forecast.sync(store)
+        self.history.sync(store)
+        for dumper_id, tyre_position in series:
+            self.get_tkph_trend_chart(dumper_id, tyre_position, self.chart_mode)
+
+    # Function to get one tyre's time-sorted (ts, tkph_final, suitable_tkph)
+    # readings from the in-memory history, after catching up with the store
+    def query_series(self, dumper_id, tyre_position):
+        with stage('history.sync'):
+            self.history.sync(self.store())
+        return self.history.query_series(dumper_id, tyre_position)
+
+    # Function to get a tyre's rendered trend chart ('svg' or 'png'), served
+    # from the chart cache while no new reading has arrived for that tyre.
+    # Returns (chart bytes, version, last_ts).
+    def get_tkph_trend_chart(self, dumper_id, tyre_position, kind='png'):
+        version, last_ts = self.store().series_version(dumper_id, tyre_position)
+        if version == 0:
+            return None, version, last_ts
+
+        chart = self.chart_cache.get(dumper_id, tyre_position, version, kind)
+        self.metrics.inc('tkph_chart_cache_total', kind=kind, result='miss' if chart is None else 'hit')
+        if chart is None:
+            series = self.query_series(dumper_id, tyre_position)
+            with stage(f'chart.render_{kind}'):
+                chart = CHART_RENDERERS[kind](dumper_id, tyre_position, series)
+            self.chart_cache.put(dumper_id, tyre_position, version, chart, kind)
+        return chart, version, last_ts
+
+
+# Build the web app: pages, JSON API, metrics and a fresh TrackingState.
+# `config` overrides default_config(). Serve with gunicorn (settings in
+# gunicorn.conf.py) or `python app.py --serve`.
+def create_app(config=None):
+    app = Flask(__name__)
+    app.config.update(default_config())
+    if config:
+        app.config.update(config)
+    app.register_blueprint(api)
+    app.register_blueprint(web)
+    app.extensions['tkph'] = TrackingState(app.config)
+    init_metrics(app, app.extensions['tkph'].metrics)
+    app.extensions['tkph'].rules()  # fail at startup on a broken rules file
+    return app
+
+def tracking_state():
+    return current_app.extensions['tkph']
+
+# `gunicorn app:app` and other users of the module-level app get one built
+# on first access
+_default_app = None
+
+def __getattr__(name):
+    global _default_app
+    if name == 'app':
+        if _default_app is None:
+            _default_app = create_app()
+        return _default_app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+# Function to save TKPH data to the current app's tracking store
+def save_tkph_data(dumper_id, tyre_position, tkph_final, suitable_tkph, **scoring):
+    tracking_state().save_tkph_data(dumper_id, tyre_position, tkph_final, suitable_tkph, **scoring)
+
+def get_tkph_trend_chart(dumper_id, tyre_position, kind='png'):
+    return tracking_state().get_tkph_trend_chart(dumper_id, tyre_position, kind)
+
+# Function to generate TKPH trend chart (base64 PNG for embedding inline)
 def generate_tkph_trend_chart(dumper_id, tyre_position):
     try:
-        # Ensure the Excel file exists and has the correct path
-        file_path = 'tkph_tracking.xlsx'
-        if not os.path.exists(file_path):
-            # If no tracking file exists, return None
-            return None
-        
-        # Read the Excel file
-        df = pd.read_excel(file_path, engine='openpyxl')
-        
-        # Convert Timestamp column to datetime if not already
-        df['Timestamp'] = pd.to_datetime(df['Timestamp'])
-        
-        # Filter data for specific dumper and tyre position
-        filtered_df = df[(df['Dumper ID'] == dumper_id) & 
-                         (df['Tyre Position'] == tyre_position)]
-        
-        # Check if filtered DataFrame is empty
-        if filtered_df.empty:
+        png, _, _ = get_tkph_trend_chart(dumper_id, tyre_position, 'png')
+        if png is None:
             return None
-        
-        # Sort by timestamp to ensure chronological order
-        filtered_df = filtered_df.sort_values('Timestamp')
-        
-        # Create figure with improved styling
-        plt.figure(figsize=(12, 6))
-        plt.style.use('seaborn')
-        
-        # Plot TKPH Final as a line graph
-        plt.plot(filtered_df['Timestamp'], filtered_df['TKPH Final'], 
-                 label='TKPH Final', color='blue', marker='o', linewidth=2)
-        
-        # Plot Suitable TKPH as a line graph
-        plt.plot(filtered_df['Timestamp'], filtered_df['Suitable TKPH'], 
-                 label='Suitable TKPH', color='green', marker='s', linewidth=2)
-        
-        # Improved title and labels
-        plt.title(f'TKPH Trend for Dumper {dumper_id} - {tyre_position}', fontsize=15)
-        plt.xlabel('Timestamp', fontsize=12)
-        plt.ylabel('TKPH Value', fontsize=12)
-        
-        # Rotate and align the tick labels
-        plt.gcf().autofmt_xdate()
-        
-        # Add grid for better readability
-        plt.grid(True, linestyle='--', linewidth=0.5)
-        
-        # Add legend
-        plt.legend()
-        
-        # Adjust layout
-        plt.tight_layout()
-        
-        # Convert plot to base64 string
-        buffer = io.BytesIO()
-        plt.savefig(buffer, format='png', dpi=300)
-        buffer.seek(0)
-        plot_data = base64.b64encode(buffer.getvalue()).decode()
-        plt.close()
-        
-        return plot_data
+        return base64.b64encode(png).decode()
     except Exception as e:
         print(f"Error generating trend chart: {e}")
         return None
 
+# ETag for a tyre's chart; it only changes when that tyre gets a new reading
+def trend_chart_etag(dumper_id, tyre_position, version, last_ts, kind):
+    key = f"{dumper_id}|{tyre_position}|{version}|{last_ts}|{kind}"
+    return hashlib.sha1(key.encode()).hexdigest()
+
 # Main route for dumper and tyre selection
-@app.route('/')
+@web.route('/')
 def index():
     return render_template('dumper_id.html')
 
-@app.route('/tyre-selection')
+@web.route('/tyre-selection')
 def tyre_selection():
     dumper_id = request.args.get('dumper_id')
     return render_template('tyre_selection.html', dumper_id=dumper_id)
 
-@app.route('/tkph-calculator', methods=['GET', 'POST'])
+# On-demand export of the tracking history in the familiar spreadsheet layout
+@web.route('/export/tkph_tracking.xlsx')
+def export_tracking_workbook():
+    buffer = io.BytesIO()
+    tracking_state().store().export_excel(buffer)
+    buffer.seek(0)
+    return send_file(buffer, as_attachment=True, download_name='tkph_tracking.xlsx',
+                     mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+
+# Bulk scoring of a CSV/Excel file of readings for many dumpers and tyres
+@web.route('/bulk-upload', methods=['GET', 'POST'])
+def bulk_upload():
+    if request.method == 'POST':
+        upload = request.files.get('readings_file')
+        if upload is None or not upload.filename:
+            return render_template('bulk_upload.html', error="Please choose a file to upload."), 400
+        
+        output = io.StringIO()
+        try:
+            state = tracking_state()
+            stats = score_readings_file(upload.stream, upload.filename, output,
+                                        store=state.store(), rules=state.rules())
+        except ValueError as e:
+            return render_template('bulk_upload.html',
+                                   error=f"Invalid input: {str(e)}. Please check your file."), 400
+        
+        response = send_file(io.BytesIO(output.getvalue().encode()), mimetype='text/csv',
+                             as_attachment=True, download_name='tkph_results.csv')
+        response.headers['X-Rows-Scored'] = str(stats['rows'])
+        response.headers['X-Rows-Per-Second'] = f"{stats['rows_per_second']:.0f}"
+        return response
+    
+    return render_template('bulk_upload.html')
+
+# Cacheable trend chart for one tyre: /trend-chart.svg, .png or .json
+@web.route('/trend-chart.<kind>')
+def trend_chart(kind):
+    if kind not in CHART_KINDS:
+        abort(404)
+    dumper_id = request.args.get('dumper_id')
+    tyre_position = request.args.get('tyre_position')
+    
+    state = tracking_state()
+    version, last_ts = state.store().series_version(dumper_id, tyre_position)
+    if version == 0:
+        abort(404)
+    etag = trend_chart_etag(dumper_id, tyre_position, version, last_ts, kind)
+    
+    # Repeat views of an unchanged chart cost no rendering at all
+    if etag in request.if_none_match:
+        response = make_response('', 304)
+    elif kind == 'json':
+        response = jsonify(trend_chart_json(dumper_id, tyre_position,
+                                            state.query_series(dumper_id, tyre_position)))
+    else:
+        chart, _, _ = state.get_tkph_trend_chart(dumper_id, tyre_position, kind)
+        response = make_response(chart)
+        response.mimetype = CHART_KINDS[kind]
+    response.set_etag(etag)
+    response.last_modified = datetime.fromtimestamp(last_ts, timezone.utc)
+    response.cache_control.no_cache = True
+    return response
+
+# Status of a queued reading: queued -> saved -> ready (chart rendered) or failed
+@web.route('/jobs/<job_id>')
+def job_status(job_id):
+    status = tracking_state().background_writer.status(job_id)
+    if status is None:
+        abort(404)
+    return jsonify(status)
+
+# Server-sent event stream that fires once the queued reading is stored and
+# its chart rendered (or after 30 seconds at the latest)
+@web.route('/jobs/<job_id>/events')
+def job_events(job_id):
+    background_writer = tracking_state().background_writer
+    if background_writer.status(job_id) is None:
+        abort(404)
+    
+    def stream():
+        status = background_writer.wait(job_id, timeout=30)
+        yield f"event: status\ndata: {json.dumps(status)}\n\n"
+    
+    response = current_app.response_class(stream(), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+# Rolling statistics for one tyre, read in constant time
+@web.route('/tyre-stats')
+def tyre_stats():
+    dumper_id = request.args.get('dumper_id')
+    tyre_position = request.args.get('tyre_position')
+    
+    state = tracking_state()
+    state.rolling_stats.sync(state.store())
+    stats = state.rolling_stats.get(dumper_id, tyre_position)
+    if stats is None:
+        abort(404)
+    return jsonify(dict(stats.to_dict(), dumper_id=dumper_id, tyre_position=tyre_position))
+
+# When one tyre is forecast to enter the Danger and Critical bands
+@web.route('/tyre-forecast')
+def tyre_forecast():
+    dumper_id = request.args.get('dumper_id')
+    tyre_position = request.args.get('tyre_position')
+    
+    state = tracking_state()
+    state.forecast.sync(state.store())
+    forecast = state.forecast.forecast(dumper_id, tyre_position, state.rules())
+    if forecast is None:
+        abort(404)
+    return jsonify(forecast)
+
+# Next tyres at risk across the fleet, soonest to reach the Danger band first
+@web.route('/fleet-forecast')
+def fleet_forecast():
+    limit = request.args.get('limit', 20, type=int)
+    horizon = request.args.get('horizon_days', type=float)
+    
+    state = tracking_state()
+    state.forecast.sync(state.store())
+    return jsonify(at_risk=state.forecast.at_risk(limit=limit, horizon_days=horizon,
+                                                  rules=state.rules()))
+
+# Fleet condition dashboard: the latest status of every dumper and tyre,
+# read from the store's materialised latest-reading table, and the tyres
+# forecast to reach the Danger band next
+@web.route('/dashboard')
+def dashboard():
+    state = tracking_state()
+    store = state.store()
+    with stage('dashboard.latest_readings'):
+        fleet = fleet_status(store.latest_readings(), state.rules())
+    with stage('dashboard.forecast'):
+        state.forecast.sync(store)
+        at_risk = state.forecast.at_risk(limit=10, rules=state.rules())
+    return render_template('dashboard.html', fleet=fleet, condition_order=CONDITION_ORDER,
+                           at_risk=at_risk, format_timestamp=format_timestamp)
+
+@web.route('/tkph-calculator', methods=['GET', 'POST'])
 def tkph_calculator():
     dumper_id = request.args.get('dumper_id')
     tyre_position = request.args.get('tyre_position')
     
     if request.method == 'POST':
+        state = tracking_state()
         try:
             # Collect input values
-            distance_loaded = float(request.form['distance_loaded'])
-            cycle_time = float(request.form['cycle_time'])
-            terrain_type = request.form['terrain_type']
-            tire_wear_percentage = float(request.form['tire_wear_percentage'])
-            tyre_load_empty = float(request.form['tyre_load_empty'])
-            tyre_load_fully_loaded = float(request.form['tyre_load_fully_loaded'])
-            
-            # Process round trip distances
-            round_trip_distances = [float(x.strip()) for x in request.form['round_trip_distances'].split(',')]
-            cycles_per_shift = int(request.form['cycles_per_shift'])
-            total_shift_hours = float(request.form['total_shift_hours'])
+            with stage('request.parse_form'):
+                distance_loaded = float(request.form['distance_loaded'])
+                cycle_time = float(request.form['cycle_time'])
+                terrain_type = request.form['terrain_type']
+                tire_wear_percentage = float(request.form['tire_wear_percentage'])
+                tyre_load_empty = float(request.form['tyre_load_empty'])
+                tyre_load_fully_loaded = float(request.form['tyre_load_fully_loaded'])
+                
+                # Process round trip distances
+                round_trip_distances = [float(x.strip()) for x in request.form['round_trip_distances'].split(',')]
+                cycles_per_shift = int(request.form['cycles_per_shift'])
+                total_shift_hours = float(request.form['total_shift_hours'])
             
-            # Calculate TKPH
-            tkph_final, suitable_tkph = calculate_tkph(
-                distance_loaded, cycle_time, terrain_type, tire_wear_percentage,
-                tyre_load_empty, tyre_load_fully_loaded, round_trip_distances, 
-                cycles_per_shift, total_shift_hours
-            )
+            # Calculate TKPH under the site's current rules
+            with stage('request.calculate'):
+                rules = state.rules()
+                tkph_final, suitable_tkph = calculate_tkph(
+                    distance_loaded, cycle_time, terrain_type, tire_wear_percentage,
+                    tyre_load_empty, tyre_load_fully_loaded, round_trip_distances, 
+                    cycles_per_shift, total_shift_hours, rules=rules
+                )
+                
+                # Evaluate TKPH conditions
+                condition_status = evaluate_conditions(tkph_final, suitable_tkph, rules)
             
-            # Evaluate TKPH conditions
-            condition_status = evaluate_conditions(tkph_final, suitable_tkph)
+            # Save TKPH data (queued for the background writer unless disabled)
+            # with the inputs and rule version needed to re-score it later
+            scoring = {'terrain_type': terrain_type, 'tire_wear_percentage': tire_wear_percentage,
+                       'rule_version': rules.key, 'speed_multiplier': 1.0}
+            job_id = None
+            if state.async_writes:
+                with stage('request.enqueue'):
+                    job_id = state.background_writer.submit(dumper_id, tyre_position,
+                                                            tkph_final, suitable_tkph, **scoring)
+            else:
+                with stage('request.save'):
+                    state.save_tkph_data(dumper_id, tyre_position, tkph_final, suitable_tkph, **scoring)
+            state.metrics.inc('tkph_calculations_total', condition=condition_status)
             
-            # Save TKPH data
-            save_tkph_data(dumper_id, tyre_position, tkph_final, suitable_tkph)
+            trend_chart_url = url_for('web.trend_chart', kind=state.chart_mode,
+                                      dumper_id=dumper_id, tyre_position=tyre_position)
             
-            # Generate trend chart
-            trend_chart = generate_tkph_trend_chart(dumper_id, tyre_position)
-            
-            return render_template('result.html', 
-                                   tkph_final=round(tkph_final, 2), 
-                                   suitable_tkph=round(suitable_tkph, 2),
-                                   condition_status=condition_status,
-                                   trend_chart=trend_chart,
-                                   dumper_id=dumper_id,
-                                   tyre_position=tyre_position)
+            with stage('request.render_template'):
+                return render_template('result.html', 
+                                       tkph_final=round(tkph_final, 2), 
+                                       suitable_tkph=round(suitable_tkph, 2),
+                                       condition_status=condition_status,
+                                       trend_chart_url=trend_chart_url,
+                                       job_id=job_id,
+                                       tyre_stats=state.rolling_stats.get(dumper_id, tyre_position),
+                                       dumper_id=dumper_id,
+                                       tyre_position=tyre_position)
         
         except ValueError as e:
             error_message = f"Invalid input: {str(e)}. Please check your entries."
@@ -259,5 +426,48 @@ def tkph_calculator():
                            dumper_id=dumper_id, 
                            tyre_position=tyre_position)
 
+
+# Production serving: gunicorn with the settings in gunicorn.conf.py, or
+# Werkzeug's threaded server where gunicorn is not available (Windows)
+def serve(bind=None, workers=None, threads=None):
+    options = {name: value for name, value in
+               (('bind', bind), ('workers', workers), ('threads', threads)) if value}
+    try:
+        from gunicorn.app.base import Application
+    except ImportError:
+        host, _, port = (bind or '127.0.0.1:8000').rpartition(':')
+        print("gunicorn is not available; serving with the threaded development server")
+        create_app().run(host=host or '127.0.0.1', port=int(port), threaded=True)
+        return
+
+    class TKPHApplication(Application):
+        def load_config(self):
+            self.load_config_from_file(
+                os.path.join(os.path.dirname(os.path.abspath(__file__)), 'gunicorn.conf.py'))
+            for name, value in options.items():
+                self.cfg.set(name, value)
+
+        def init(self, parser, opts, args):
+            pass
+
+        def load(self):
+            return create_app()
+
+    TKPHApplication().run()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run the TKPH web app.')
+    parser.add_argument('--serve', action='store_true',
+                        help='production mode: gunicorn workers instead of the debug server')
+    parser.add_argument('--bind', help='host:port to listen on (default from gunicorn.conf.py)')
+    parser.add_argument('--workers', type=int, help='worker processes (default from gunicorn.conf.py)')
+    parser.add_argument('--threads', type=int, help='threads per worker (default from gunicorn.conf.py)')
+    args = parser.parse_args(argv)
+
+    if args.serve:
+        serve(args.bind, args.workers, args.threads)
+    else:
+        create_app().run(debug=True)
+
 if __name__ == '__main__':
-    app.run(debug=True)
\ No newline at end of file
+    main()
\ No newline at end of file
@@ -0,0 +1,194 @@
+import argparse
+import http.client
+import json
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from urllib.parse import urlencode
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from run import TYRE_POSITIONS, synthetic_readings, synthetic_rows
+
+# Throughput of the production server under a mixed workload, for a growing
+# number of gunicorn workers. Every run starts gunicorn with gunicorn.conf.py
+# on a fresh SQLite store seeded with a history, then keeps --concurrency
+# keep-alive clients busy for --duration seconds:
+#
+#   python benchmarks/load_test.py --workers 1 2 4 --concurrency 16
+#
+# Each request is picked at random from WORKLOAD (weight, name). Reports
+# requests per second, median and 95th percentile latency, errors, and the
+# speedup relative to the first worker count.
+
+WORKLOAD = [
+    (4, 'post_calculator'),
+    (3, 'trend_chart'),
+    (2, 'api_tkph'),
+    (1, 'dashboard'),
+]
+N_DUMPERS = 50
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def start_server(workers, threads, port, directory):
+    store_path = os.path.join(directory, 'tkph_tracking.db')
+    env = dict(os.environ, PYTHONPATH=REPO_ROOT, TKPH_STORE_PATH=store_path)
+    command = [sys.executable, '-m', 'gunicorn', '-c', os.path.join(REPO_ROOT, 'gunicorn.conf.py'),
+               '--workers', str(workers), '--threads', str(threads),
+               '--bind', f'127.0.0.1:{port}', 'app:create_app()']
+    return subprocess.Popen(command, cwd=directory, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+def wait_ready(port, process, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f'gunicorn exited with status {process.returncode}')
+        try:
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+            connection.request('GET', '/')
+            if connection.getresponse().status == 200:
+                return
+        except OSError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f'server on port {port} did not answer within {timeout} s')
+
+def stop_server(process):
+    process.terminate()
+    try:
+        process.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+# (method, url, body, headers) for one request of the given kind
+def build_request(kind, rng, reading):
+    dumper_id = f'DT{rng.randrange(N_DUMPERS):03d}'
+    tyre_position = rng.choice(TYRE_POSITIONS)
+    key = urlencode({'dumper_id': dumper_id, 'tyre_position': tyre_position})
+    if kind == 'post_calculator':
+        form = {name: str(value) for name, value in reading.items()}
+        form['round_trip_distances'] = ','.join(map(str, reading['round_trip_distances']))
+        return ('POST', f'/tkph-calculator?{key}', urlencode(form),
+                {'Content-Type': 'application/x-www-form-urlencoded'})
+    if kind == 'trend_chart':
+        return 'GET', f'/trend-chart.svg?{key}', None, {}
+    if kind == 'api_tkph':
+        body = dict(reading, dumper_id=dumper_id, tyre_position=tyre_position)
+        return 'POST', '/api/v1/tkph', json.dumps(body), {'Content-Type': 'application/json'}
+    return 'GET', '/dashboard', None, {}
+
+def client_loop(port, deadline, seed, latencies, errors):
+    rng = random.Random(seed)
+    kinds = [kind for weight, kind in WORKLOAD for _ in range(weight)]
+    readings = list(synthetic_readings(1, 50, seed=seed))
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+    while time.monotonic() < deadline:
+        kind = rng.choice(kinds)
+        method, url, body, headers = build_request(kind, rng, rng.choice(readings))
+        started = time.perf_counter()
+        try:
+            connection.request(method, url, body=body, headers=headers)
+            response = connection.getresponse()
+            response.read()
+            if response.status >= 400:
+                errors.append((kind, response.status))
+                continue
+        except (OSError, http.client.HTTPException) as e:
+            errors.append((kind, type(e).__name__))
+            connection.close()
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+            continue
+        latencies.append((kind, time.perf_counter() - started))
+    connection.close()
+
+def run_load(port, concurrency, duration):
+    latencies, errors = [], []
+    deadline = time.monotonic() + duration
+    clients = [threading.Thread(target=client_loop, args=(port, deadline, seed, latencies, errors))
+               for seed in range(concurrency)]
+    started = time.perf_counter()
+    for client in clients:
+        client.start()
+    for client in clients:
+        client.join()
+    return latencies, errors, time.perf_counter() - started
+
+def summarise(latencies, errors, elapsed):
+    seconds = sorted(latency for _, latency in latencies)
+    if not seconds:
+        return {'requests': 0, 'errors': len(errors), 'rps': 0.0, 'p50_ms': None, 'p95_ms': None}
+    return {
+        'requests': len(seconds),
+        'errors': len(errors),
+        'rps': len(seconds) / elapsed,
+        'p50_ms': statistics.median(seconds) * 1000,
+        'p95_ms': seconds[min(len(seconds) - 1, int(len(seconds) * 0.95))] * 1000,
+        'by_kind': {kind: len([1 for k, _ in latencies if k == kind]) for _, kind in WORKLOAD},
+    }
+
+def benchmark(workers, options):
+    from tkph.store import SQLiteStore
+
+    with tempfile.TemporaryDirectory() as directory:
+        SQLiteStore(os.path.join(directory, 'tkph_tracking.db')).append_many(
+            synthetic_rows(options.history, n_dumpers=N_DUMPERS))
+        port = free_port()
+        process = start_server(workers, options.threads, port, directory)
+        try:
+            wait_ready(port, process)
+            run_load(port, options.concurrency, min(options.duration, 2))  # warm-up
+            return summarise(*run_load(port, options.concurrency, options.duration))
+        finally:
+            stop_server(process)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Load test the TKPH web app under gunicorn.')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4],
+                        help='worker counts to compare (default 1 2 4)')
+    parser.add_argument('--threads', type=int, default=4, help='threads per worker')
+    parser.add_argument('--concurrency', type=int, default=16, help='concurrent client connections')
+    parser.add_argument('--duration', type=float, default=10.0, help='seconds of load per run')
+    parser.add_argument('--history', type=int, default=20000, help='readings seeded into the store')
+    parser.add_argument('--json', action='store_true', help='print results as JSON')
+    options = parser.parse_args(argv)
+
+    try:
+        import gunicorn  # noqa: F401
+    except ImportError:
+        print('gunicorn is not installed (pip install gunicorn); it does not run on Windows.',
+              file=sys.stderr)
+        return 2
+
+    results = {}
+    for workers in options.workers:
+        results[workers] = benchmark(workers, options)
+        result = results[workers]
+        baseline = results[options.workers[0]]['rps']
+        speedup = result['rps'] / baseline if baseline else 0.0
+        result['speedup'] = speedup
+        p50 = f"{result['p50_ms']:8.1f}" if result['p50_ms'] is not None else '       -'
+        p95 = f"{result['p95_ms']:8.1f}" if result['p95_ms'] is not None else '       -'
+        print(f"workers={workers:<3d} {result['rps']:9.1f} req/s  p50 {p50} ms  p95 {p95} ms  "
+              f"errors {result['errors']:<5d} x{speedup:.2f}", file=sys.stderr)
+    if options.json:
+        print(json.dumps({'cpus': os.cpu_count(), 'threads': options.threads,
+                          'concurrency': options.concurrency, 'results': results}, indent=2))
+    return 1 if any(result['errors'] for result in results.values()) else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
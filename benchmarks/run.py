@@ -0,0 +1,307 @@
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+# Benchmarks for the TKPH hot paths. Every case reports the median wall time
+# per operation (seconds) over several repeats, keyed by a stable name such as
+# "store_append[sqlite,history=10000]", so results can be compared against
+# a stored baseline:
+#
+#   python benchmarks/run.py --save baseline.json
+#   python benchmarks/run.py --baseline baseline.json   # exit 1 on regression
+
+TYRE_POSITIONS = ['front-left', 'front-right', 'rear-left-outer', 'rear-left-inner',
+                  'rear-right-inner', 'rear-right-outer']
+TERRAINS = ['Flat', 'Inclined', 'Rocky', 'Muddy']
+
+CASES = []
+
+def case(function):
+    CASES.append(function)
+    return function
+
+
+# Synthetic fleet data: n_dumpers x positions x readings_per_tyre readings,
+# one every 10 minutes, as calculator form inputs plus identifiers
+def synthetic_readings(n_dumpers, readings_per_tyre, positions=TYRE_POSITIONS, seed=0):
+    rng = random.Random(seed)
+    start = int(datetime(2024, 1, 1).timestamp())
+    for step in range(readings_per_tyre):
+        for dumper in range(n_dumpers):
+            for tyre_position in positions:
+                yield {
+                    'timestamp': start + step * 600,
+                    'dumper_id': f'DT{dumper:03d}',
+                    'tyre_position': tyre_position,
+                    'distance_loaded': rng.uniform(1, 15),
+                    'cycle_time': rng.uniform(0.3, 1.5),
+                    'terrain_type': rng.choice(TERRAINS),
+                    'tire_wear_percentage': rng.uniform(0, 100),
+                    'tyre_load_empty': rng.uniform(15, 30),
+                    'tyre_load_fully_loaded': rng.uniform(40, 70),
+                    'round_trip_distances': [rng.uniform(8, 12) for _ in range(12)],
+                    'cycles_per_shift': rng.randint(8, 16),
+                    'total_shift_hours': 12.0,
+                }
+
+# Stored rows (ts, dumper_id, tyre_position, tkph_final, suitable_tkph) for a history of size n
+def synthetic_rows(n, n_dumpers=50, seed=0):
+    readings_per_tyre = -(-n // (n_dumpers * len(TYRE_POSITIONS)))
+    rng = random.Random(seed)
+    rows = []
+    for reading in synthetic_readings(n_dumpers, readings_per_tyre, seed=seed):
+        suitable = rng.uniform(200, 400)
+        rows.append((reading['timestamp'], reading['dumper_id'], reading['tyre_position'],
+                     suitable * rng.uniform(0.6, 1.0), suitable))
+        if len(rows) == n:
+            break
+    return rows
+
+def timed(function, repeat, number=1):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for _ in range(number):
+            function()
+        samples.append((time.perf_counter() - started) / number)
+    return statistics.median(samples)
+
+
+@case
+def calculate_tkph_cases(options):
+    from tkph.batch import calculate_tkph_batch
+    from tkph.core import calculate_tkph
+
+    readings = list(synthetic_readings(10, 100))
+    reading = readings[0]
+    args = [reading[name] for name in ('distance_loaded', 'cycle_time', 'terrain_type',
+                                       'tire_wear_percentage', 'tyre_load_empty',
+                                       'tyre_load_fully_loaded', 'round_trip_distances',
+                                       'cycles_per_shift', 'total_shift_hours')]
+    yield 'calculate_tkph[scalar]', timed(lambda: calculate_tkph(*args), options.repeat, 200)
+
+    columns = {name: [r[name] for r in readings] for name in (
+        'distance_loaded', 'cycle_time', 'terrain_type', 'tire_wear_percentage',
+        'tyre_load_empty', 'tyre_load_fully_loaded')}
+    yield f'calculate_tkph[batch,rows={len(readings)}]', \
+        timed(lambda: calculate_tkph_batch(**columns), options.repeat, 10)
+
+@case
+def sweep_cases(options):
+    from tkph.sweep import SweepGrid, default_axes, run_sweep
+
+    axes = default_axes()
+    if not options.quick:
+        axes['cycle_time'] = [0.3 + 0.05 * i for i in range(25)]
+        axes['distance_loaded'] = [1.0 + 0.5 * i for i in range(29)]
+    grid = SweepGrid(axes)
+    yield f'sweep[points={grid.size}]', timed(lambda: run_sweep(grid), min(options.repeat, 3))
+
+@case
+def remove_outliers_cases(options):
+    from tkph.core import remove_outliers
+    from tkph.outliers import robust_mean
+
+    rng = random.Random(1)
+    for size in (12, 1000, 100000):
+        data = [rng.gauss(10, 1) for _ in range(size)] + [50.0, -20.0]
+        number = 200 if size < 10000 else 5
+        yield f'remove_outliers[n={size}]', timed(lambda: remove_outliers(data), options.repeat, number)
+        yield f'robust_mean[iqr,n={size}]', timed(lambda: robust_mean(data), options.repeat, number)
+
+# One reading appended on top of an existing history of growing size; the
+# legacy Excel backend rewrites the whole workbook, the SQLite store does not
+@case
+def store_append_cases(options):
+    from tkph.store import ExcelStore, SQLiteStore
+
+    sizes = {'sqlite': (1000, 10000, 100000), 'excel': (100, 1000, 5000)}
+    if options.quick:
+        sizes = {'sqlite': (1000, 10000), 'excel': (100, 1000)}
+    with tempfile.TemporaryDirectory() as directory:
+        for backend, store_class, suffix in (('sqlite', SQLiteStore, 'db'), ('excel', ExcelStore, 'xlsx')):
+            for size in sizes[backend]:
+                store = store_class(os.path.join(directory, f'history_{size}.{suffix}'))
+                store.append_many(synthetic_rows(size))
+                seconds = timed(lambda: store.append('DT000', 'front-left', 250.0, 300.0),
+                                options.repeat if backend == 'sqlite' else min(options.repeat, 3))
+                yield f'store_append[{backend},history={size}]', seconds
+
+# Loading the whole history into memory from the workbook, the SQLite store
+# and a memory-mapped binary snapshot
+@case
+def history_load_cases(options):
+    from tkph.columnar import ColumnarHistory
+    from tkph.snapshot import load_snapshot, write_snapshot
+    from tkph.store import SQLiteStore, read_tracking_workbook, write_tracking_workbook
+
+    size = 10000 if options.quick else 100000
+    with tempfile.TemporaryDirectory() as directory:
+        rows = synthetic_rows(size)
+        workbook = os.path.join(directory, 'history.xlsx')
+        write_tracking_workbook(rows, workbook)
+        store = SQLiteStore(os.path.join(directory, 'history.db'))
+        store.append_many(rows)
+        history = ColumnarHistory()
+        history.sync(store)
+        snapshot = os.path.join(directory, 'snapshot')
+        write_snapshot(history, snapshot)
+
+        yield f'history_load[xlsx,rows={size}]', \
+            timed(lambda: list(read_tracking_workbook(workbook)), min(options.repeat, 3))
+        yield f'history_load[sqlite,rows={size}]', \
+            timed(lambda: ColumnarHistory().sync(store), options.repeat)
+        yield f'history_load[snapshot,rows={size}]', \
+            timed(lambda: load_snapshot(snapshot).to_history(), options.repeat)
+
+# Folding a stored history into the per-tyre forecast fits, and ranking the
+# fleet's next tyres at risk from them
+@case
+def forecast_cases(options):
+    from tkph.forecast import FleetForecast
+    from tkph.store import SQLiteStore
+
+    size = 10000 if options.quick else 100000
+    with tempfile.TemporaryDirectory() as directory:
+        store = SQLiteStore(os.path.join(directory, 'history.db'))
+        store.append_many(synthetic_rows(size))
+        forecast = FleetForecast()
+        yield f'forecast_sync[rows={size}]', \
+            timed(lambda: FleetForecast().sync(store), min(options.repeat, 3))
+        forecast.sync(store)
+        yield f'forecast_at_risk[tyres={50 * len(TYRE_POSITIONS)}]', \
+            timed(lambda: forecast.at_risk(limit=20), options.repeat, 20)
+
+# Re-scoring a stored history that records its scoring inputs, from the first
+# reading each time
+@case
+def backfill_cases(options):
+    from tkph.backfill import run_backfill
+    from tkph.store import SQLiteStore
+
+    size = 10000 if options.quick else 100000
+    rng = random.Random(2)
+    with tempfile.TemporaryDirectory() as directory:
+        store = SQLiteStore(os.path.join(directory, 'history.db'))
+        store.append_many(row + (rng.choice(TERRAINS), rng.uniform(0, 100), 'default@1', 1.0)
+                          for row in synthetic_rows(size))
+        yield f'backfill[rows={size}]', \
+            timed(lambda: run_backfill(store, restart=True), min(options.repeat, 3))
+
+@case
+def trend_chart_cases(options):
+    from tkph.charts import render_trend_png, render_trend_svg, trend_chart_json
+
+    for length in (50, 1000):
+        series = [(ts, final, suitable) for ts, _, _, final, suitable in synthetic_rows(length, n_dumpers=1)]
+        series.sort()
+        yield f'trend_chart[svg,points={length}]', \
+            timed(lambda: render_trend_svg('DT000', 'front-left', series), options.repeat, 5)
+        yield f'trend_chart[json,points={length}]', \
+            timed(lambda: trend_chart_json('DT000', 'front-left', series), options.repeat, 5)
+        if not options.quick:
+            yield f'trend_chart[png,points={length}]', \
+                timed(lambda: render_trend_png('DT000', 'front-left', series), min(options.repeat, 3))
+
+# Full form POST through the Flask test client against a store that already
+# holds a history, with synchronous and background persistence
+@case
+def end_to_end_cases(options):
+    with tempfile.TemporaryDirectory() as directory:
+        store_path = os.path.join(directory, 'tkph_tracking.db')
+        previous = os.getcwd()
+        os.chdir(directory)
+        try:
+            from app import create_app
+
+            reading = next(synthetic_readings(1, 1))
+            form = {name: str(value) for name, value in reading.items()}
+            form['round_trip_distances'] = ','.join(map(str, reading['round_trip_distances']))
+            url = '/tkph-calculator?dumper_id=DT000&tyre_position=front-left'
+
+            for mode, async_writes in (('sync', False), ('async', True)):
+                web = create_app({'TKPH_STORE_PATH': store_path, 'TKPH_ASYNC_WRITES': async_writes})
+                state = web.extensions['tkph']
+                if mode == 'sync':
+                    state.store().append_many(synthetic_rows(20000))
+                client = web.test_client()
+                yield f'post_tkph_calculator[{mode},history=20000]', \
+                    timed(lambda: client.post(url, data=form), options.repeat, 5)
+                state.background_writer.shutdown()
+
+            yield 'get_trend_chart[svg,cached]', \
+                timed(lambda: client.get('/trend-chart.svg?dumper_id=DT000&tyre_position=front-left'),
+                      options.repeat, 20)
+        finally:
+            os.chdir(previous)
+
+def run(options):
+    results = {}
+    for function in CASES:
+        if options.only and not any(name in function.__name__ for name in options.only):
+            continue
+        for name, seconds in function(options):
+            results[name] = seconds
+            print(f'{name:55s} {seconds * 1000:12.3f} ms', file=sys.stderr)
+    import numpy
+    return {
+        'meta': {
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'numpy': numpy.__version__,
+            'platform': platform.platform(),
+            'repeat': options.repeat,
+        },
+        'results': results,
+    }
+
+# Names whose time grew by more than tolerance relative to the baseline
+def compare(current, baseline, tolerance):
+    regressions = []
+    for name, seconds in current['results'].items():
+        previous = baseline['results'].get(name)
+        if previous and seconds > previous * (1 + tolerance):
+            regressions.append((name, previous, seconds))
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the TKPH calculation, storage and chart paths.')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--quick', action='store_true', help='smaller sizes, skip PNG rendering')
+    parser.add_argument('--only', nargs='*', help='run only cases whose function name contains one of these')
+    parser.add_argument('--save', help='write results JSON to this file')
+    parser.add_argument('--baseline', help='compare against a results JSON written by --save')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='allowed slowdown relative to the baseline (default 0.25 = 25%%)')
+    options = parser.parse_args(argv)
+
+    current = run(options)
+    output = json.dumps(current, indent=2)
+    if options.save:
+        with open(options.save, 'w') as handle:
+            handle.write(output + '\n')
+    else:
+        print(output)
+
+    if options.baseline:
+        with open(options.baseline) as handle:
+            baseline = json.load(handle)
+        regressions = compare(current, baseline, options.tolerance)
+        for name, previous, seconds in regressions:
+            print(f'REGRESSION {name}: {previous * 1000:.3f} ms -> {seconds * 1000:.3f} ms',
+                  file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
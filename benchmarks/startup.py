@@ -0,0 +1,84 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+# Import-time and cold-start budgets (seconds) for the entry points. Each
+# measurement runs in a fresh interpreter; the median of --repeat runs is
+# compared against the budget.
+#   import      - time spent importing the entry point module
+#   cold_start  - wall time of the whole process, interpreter start included
+ENTRY_POINTS = {
+    'cli': {
+        'code': 'import calculator',
+        'budget': {'import': 0.25, 'cold_start': 0.5},
+    },
+    'app': {
+        'code': 'import app; app.create_app().test_client().get("/")',
+        'budget': {'import': 0.6, 'cold_start': 1.0},
+    },
+}
+
+# Modules that only the persistence and charting paths may import
+LAZY_MODULES = ('pandas', 'matplotlib', 'openpyxl')
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = '''
+import json, sys, time
+started = time.perf_counter()
+{code}
+elapsed = time.perf_counter() - started
+print(json.dumps({{"import": elapsed,
+                  "loaded": [m for m in {lazy!r} if m in sys.modules]}}))
+'''
+
+def measure(code, repeat):
+    imports, cold_starts, loaded = [], [], set()
+    for _ in range(repeat):
+        started = time.perf_counter()
+        output = subprocess.run(
+            [sys.executable, '-c', CHILD.format(code=code, lazy=LAZY_MODULES)],
+            cwd=REPO_ROOT, capture_output=True, text=True, check=True).stdout
+        cold_starts.append(time.perf_counter() - started)
+        child = json.loads(output.strip().splitlines()[-1])
+        imports.append(child['import'])
+        loaded.update(child['loaded'])
+    return {
+        'import': statistics.median(imports),
+        'cold_start': statistics.median(cold_starts),
+        'lazy_modules_loaded': sorted(loaded),
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Check import-time and cold-start budgets.')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--json', action='store_true', help='print results as JSON')
+    args = parser.parse_args(argv)
+
+    results, failures = {}, []
+    for name, entry in ENTRY_POINTS.items():
+        result = measure(entry['code'], args.repeat)
+        result['budget'] = entry['budget']
+        results[name] = result
+        for metric, budget in entry['budget'].items():
+            if result[metric] > budget:
+                failures.append(f"{name}: {metric} {result[metric]:.3f}s over budget {budget:.3f}s")
+        if result['lazy_modules_loaded']:
+            failures.append(f"{name}: imported {', '.join(result['lazy_modules_loaded'])} at startup")
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        for name, result in results.items():
+            print(f"{name:5s} import {result['import']:.3f}s (budget {result['budget']['import']:.2f}s)  "
+                  f"cold start {result['cold_start']:.3f}s (budget {result['budget']['cold_start']:.2f}s)")
+    for failure in failures:
+        print(f"FAIL {failure}", file=sys.stderr)
+    return 1 if failures else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,86 +1,32 @@
-import numpy as np
-
-# Terrain adjustment factors (based on terrain type)
-TERRAIN_FACTORS = {
-    "Flat": 1.0,
-    "Inclined": 0.9,
-    "Rocky": 0.8,
-    "Muddy": 0.7
-}
-
-# Tire wear damage adjustment factors
-def get_tire_damage_factor(wear_percentage):
-    if wear_percentage <= 10:
-        return 1.0  # Minimal Wear
-    elif 10 < wear_percentage <= 25:
-        return 0.95  # Light Wear
-    elif 25 < wear_percentage <= 50:
-        return 0.85  # Moderate Wear
-    elif 50 < wear_percentage <= 75:
-        return 0.7   # Severe Wear
-    elif 75 < wear_percentage <= 100:
-        return 0.5   # Critical Wear
-
-# Function to calculate mean tire load
-def calculate_mean_tyre_load(tyre_load_empty, tyre_load_fully_loaded):
-    return (tyre_load_empty + tyre_load_fully_loaded) / 2
-
-# Function to calculate average speed
-def calculate_average_speed(round_trip_distances, cycles_per_shift, total_shift_hours):
-    # Remove outliers from round trip distances
-    round_trip_distances = remove_outliers(round_trip_distances)
-    
-    # Calculate mean of round trip distances
-    mean_distance = np.mean(round_trip_distances)
-    
-    # Calculate average speed
-    average_speed = (mean_distance * cycles_per_shift) / total_shift_hours
-    return average_speed
-
-# Function to remove outliers using the Interquartile Range (IQR) method
-def remove_outliers(data):
-    Q1 = np.percentile(data, 25)
-    Q3 = np.percentile(data, 75)
-    IQR = Q3 - Q1
-    lower_bound = Q1 - 1.5 * IQR
-    upper_bound = Q3 + 1.5 * IQR
-    return [x for x in data if lower_bound <= x <= upper_bound]
-
-# Function to calculate TKPH
+import argparse
+import csv
+import json
+import sys
+from itertools import islice
+
+from tkph.core import calculate_tkph as core_calculate_tkph, evaluate_conditions
+
+# Reading fields accepted by the non-interactive commands
+FLOAT_FIELDS = ['distance_loaded', 'cycle_time', 'tire_wear_percentage',
+                'tyre_load_empty', 'tyre_load_fully_loaded', 'total_shift_hours']
+READING_FIELDS = FLOAT_FIELDS[:2] + ['terrain_type'] + FLOAT_FIELDS[2:5] + \
+    ['round_trip_distances', 'cycles_per_shift', 'total_shift_hours']
+RESULT_FIELDS = ['tkph_final', 'suitable_tkph', 'condition_status']
+
+STREAM_CHUNKSIZE = 1000
+
+# Function to calculate TKPH (prompts for the tyre load and haul inputs)
 def calculate_tkph(payload_loaded, distance_loaded, cycle_time, terrain_type, tire_wear_percentage):
-    # Calculate mean tire load
     tyre_load_empty = float(input("Enter tire load (empty): "))
     tyre_load_fully_loaded = float(input("Enter tire load (fully loaded): "))
-    mean_tyre_load = calculate_mean_tyre_load(tyre_load_empty, tyre_load_fully_loaded)
-    
-    # Calculate average speed
     round_trip_distances = list(map(float, input("Enter round trip distances (comma-separated): ").split(',')))
     cycles_per_shift = int(input("Enter number of cycles per shift: "))
     total_shift_hours = float(input("Enter total shift hours: "))
-    average_speed = calculate_average_speed(round_trip_distances, cycles_per_shift, total_shift_hours)
-    
-    # Get terrain adjustment factor
-    terrain_factor = TERRAIN_FACTORS.get(terrain_type, 1.0)
     
-    # Get tire wear damage factor
-    tire_damage_factor = get_tire_damage_factor(tire_wear_percentage)
-    
-    # Calculate Base TKPH
-    tkph_base = (mean_tyre_load * distance_loaded) / cycle_time
-    
-    # Apply terrain adjustment
-    tkph_terrain_adjusted = tkph_base * terrain_factor
-    
-    # Apply tire wear damage adjustment
-    tkph_wear_adjusted = tkph_terrain_adjusted * tire_damage_factor
-    
-    # Final TKPH (including average speed influence)
-    tkph_final = tkph_wear_adjusted * (1 + (average_speed * 0.1))  # Adjusting by a factor for speed influence
-    
-    # Calculate suitable TKPH (without terrain and damage adjustments)
-    suitable_tkph = tkph_base * (1 + (average_speed * 0.1))  # Adjusting by speed
-    
-    return tkph_final, suitable_tkph
+    # Final and suitable TKPH, both adjusted by a factor for speed influence
+    return core_calculate_tkph(distance_loaded, cycle_time, terrain_type, tire_wear_percentage,
+                               tyre_load_empty, tyre_load_fully_loaded, round_trip_distances,
+                               cycles_per_shift, total_shift_hours, speed_adjusted=True)
 
 # Main code execution
 def main():
@@ -98,6 +44,152 @@ def main():
     print(f"Calculated TKPH: {tkph_final:.2f}")
     print(f"Suitable TKPH (Ideal conditions): {suitable_tkph:.2f}")
 
+# Function to parse round trip distances given as a list or a comma/semicolon separated string
+def parse_distances(value):
+    if isinstance(value, str):
+        value = value.replace(';', ',').split(',')
+    return [float(x) for x in value]
+
+# Function to score one reading given as a dict of READING_FIELDS
+def score_reading(reading, speed_adjusted=True):
+    tkph_final, suitable_tkph = core_calculate_tkph(
+        float(reading['distance_loaded']), float(reading['cycle_time']), reading['terrain_type'],
+        float(reading['tire_wear_percentage']), float(reading['tyre_load_empty']),
+        float(reading['tyre_load_fully_loaded']), parse_distances(reading['round_trip_distances']),
+        int(reading['cycles_per_shift']), float(reading['total_shift_hours']),
+        speed_adjusted=speed_adjusted)
+    return {
+        'tkph_final': float(tkph_final),
+        'suitable_tkph': float(suitable_tkph),
+        'condition_status': evaluate_conditions(tkph_final, suitable_tkph),
+    }
+
+# Function to score a chunk of (line number, record) pairs. JSON Lines records
+# arrive as raw text so that parsing also happens in the worker processes.
+# Returns (line number, output record or None, error message or None) triples.
+def score_chunk(chunk, speed_adjusted=True):
+    results = []
+    for line_number, record in chunk:
+        try:
+            reading = json.loads(record) if isinstance(record, str) else record
+            results.append((line_number, dict(reading, **score_reading(reading, speed_adjusted)), None))
+        except (ValueError, KeyError, TypeError, IndexError, ZeroDivisionError) as e:
+            results.append((line_number, None, f"{type(e).__name__}: {e}"))
+    return results
+
+def _score_chunk_speed(chunk):
+    return score_chunk(chunk, True)
+
+def _score_chunk_base(chunk):
+    return score_chunk(chunk, False)
+
+# Function to split an iterable into lists of at most size items
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+# Function to score JSON Lines or CSV readings from input to output, optionally
+# across a process pool. Output keeps the input order. Returns (rows, errors).
+def stream_readings(input_stream, output_stream, fmt='jsonl', workers=1, speed_adjusted=True,
+                    chunksize=STREAM_CHUNKSIZE):
+    if fmt == 'csv':
+        reader = csv.DictReader(input_stream)
+        records = enumerate(reader, start=2)
+        writer = None
+    else:
+        records = ((n, line) for n, line in enumerate(input_stream, start=1) if line.strip())
+
+    score = _score_chunk_speed if speed_adjusted else _score_chunk_base
+    chunks = chunked(records, chunksize)
+    if workers > 1:
+        from multiprocessing import Pool
+        pool = Pool(workers)
+        scored_chunks = pool.imap(score, chunks)
+    else:
+        pool = None
+        scored_chunks = map(score, chunks)
+
+    rows = errors = 0
+    try:
+        for results in scored_chunks:
+            for line_number, record, error in results:
+                if error is not None:
+                    errors += 1
+                    print(f"line {line_number}: {error}", file=sys.stderr)
+                    continue
+                rows += 1
+                if fmt == 'csv':
+                    if writer is None:
+                        writer = csv.DictWriter(output_stream, fieldnames=reader.fieldnames + RESULT_FIELDS,
+                                                extrasaction='ignore')
+                        writer.writeheader()
+                    writer.writerow(record)
+                else:
+                    output_stream.write(json.dumps(record, separators=(',', ':')) + '\n')
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    return rows, errors
+
+# Command-line interface; without a subcommand the interactive prompts are used
+def cli(argv=None):
+    parser = argparse.ArgumentParser(description='TKPH calculator')
+    parser.add_argument('--formula', choices=['speed', 'base'],
+                        help="'speed' scales TKPH by average speed (this tool's formula, the "
+                             "default); 'base' matches the web app and is the only one bulk supports")
+    subparsers = parser.add_subparsers(dest='command')
+
+    score_parser = subparsers.add_parser('score', help='score a single reading given as flags')
+    for field in READING_FIELDS:
+        score_parser.add_argument('--' + field.replace('_', '-'), dest=field, required=True)
+    score_parser.add_argument('--json', action='store_true', help='print the result as JSON')
+
+    stream_parser = subparsers.add_parser('stream', help='score readings from stdin to stdout')
+    stream_parser.add_argument('--format', choices=['jsonl', 'csv'], default='jsonl')
+    stream_parser.add_argument('--workers', type=int, default=1, help='number of worker processes')
+    stream_parser.add_argument('--chunksize', type=int, default=STREAM_CHUNKSIZE)
+
+    bulk_parser = subparsers.add_parser('bulk', help='score a CSV/Excel file and record it in the tracking store')
+    bulk_parser.add_argument('bulk_args', nargs=argparse.REMAINDER)
+
+    args = parser.parse_args(argv)
+    speed_adjusted = args.formula != 'base'
+
+    if args.command is None:
+        main()
+        return 0
+
+    if args.command == 'score':
+        try:
+            result = score_reading(vars(args), speed_adjusted)
+        except (ValueError, IndexError, ZeroDivisionError) as e:
+            print(f"Invalid input: {e}", file=sys.stderr)
+            return 1
+        if args.json:
+            print(json.dumps(result))
+        else:
+            print(f"Calculated TKPH: {result['tkph_final']:.2f}")
+            print(f"Suitable TKPH (Ideal conditions): {result['suitable_tkph']:.2f}")
+            print(f"Condition: {result['condition_status']}")
+        return 0
+
+    if args.command == 'stream':
+        rows, errors = stream_readings(sys.stdin, sys.stdout, args.format, args.workers,
+                                       speed_adjusted, args.chunksize)
+        print(f"Scored {rows} readings, {errors} rejected", file=sys.stderr)
+        return 2 if errors else 0
+
+    # Bulk scoring runs on the batch engine, which has the web app's formula only
+    if args.formula == 'speed':
+        parser.error("bulk scores with the web app's formula; --formula speed is not supported")
+    from tkph.bulk import main as bulk_main
+    return bulk_main(args.bulk_args)
+
 # Run the script
 if __name__ == "__main__":
-    main()
+    sys.exit(cli())
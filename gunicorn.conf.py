@@ -0,0 +1,39 @@
+import multiprocessing
+import os
+
+# Production settings for the TKPH web app:
+#
+#   gunicorn 'app:create_app()'          # picks up this file from the working directory
+#   python app.py --serve --workers 4    # same settings, gunicorn started for you
+#
+# Each worker process builds its own app (chart cache, rolling statistics,
+# in-memory history, background writer and matplotlib state are never shared).
+# Workers only meet in the tracking store: SQLite in WAL mode takes one write
+# transaction at a time across processes (BEGIN IMMEDIATE with a busy timeout),
+# and inside each worker a single background writer thread does all writes.
+# The writers also record job progress there, so the result page's status
+# requests can land on any worker, not only the one that queued the reading.
+# The Excel backend serialises workers with a file lock, but every write still
+# rewrites the workbook, so use SQLite when running more than one worker.
+
+bind = os.environ.get('TKPH_BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('TKPH_WORKERS', multiprocessing.cpu_count()))
+# Threads per worker; requests mostly wait on SQLite or the writer queue
+worker_class = 'gthread'
+threads = int(os.environ.get('TKPH_THREADS', 4))
+# Result pages hold an SSE connection for up to 30 s while the chart renders
+timeout = 60
+graceful_timeout = 30
+
+# Import the app once in the master so workers fork with numpy and the app
+# modules already loaded. Store connections and the writer thread check the
+# process id and are opened anew in each worker.
+preload_app = os.environ.get('TKPH_PRELOAD', '1') != '0'
+
+
+# Flush readings still queued for the background writer before a worker exits
+def worker_exit(server, worker):
+    app = getattr(worker, 'wsgi', None)
+    state = getattr(app, 'extensions', {}).get('tkph')
+    if state is not None:
+        state.background_writer.shutdown(timeout=graceful_timeout)
@@ -1,94 +1,27 @@
-import numpy as np
 from flask import Flask, render_template, request, redirect, url_for
-import pandas as pd
 from datetime import datetime
-import matplotlib.pyplot as plt
 import io
+import os
 import base64
 
-app = Flask(__name__)
-
-# Terrain adjustment factors (based on terrain type)
-TERRAIN_FACTORS = {
-    "Flat": 1.0,
-    "Inclined": 0.9,
-    "Rocky": 0.8,
-    "Muddy": 0.7
-}
-
-# Tire wear damage adjustment factors
-def get_tire_damage_factor(wear_percentage):
-    if wear_percentage <= 10:
-        return 1.0  # Minimal Wear
-    elif 10 < wear_percentage <= 25:
-        return 0.95  # Light Wear
-    elif 25 < wear_percentage <= 50:
-        return 0.85  # Moderate Wear
-    elif 50 < wear_percentage <= 75:
-        return 0.7   # Severe Wear
-    else:  # 75 < wear_percentage <= 100
-        return 0.5   # Critical Wear
-
-# Function to remove outliers using the Interquartile Range (IQR) method
-def remove_outliers(data):
-    Q1 = np.percentile(data, 25)
-    Q3 = np.percentile(data, 75)
-    IQR = Q3 - Q1
-    lower_bound = Q1 - 1.5 * IQR
-    upper_bound = Q3 + 1.5 * IQR
-    return [x for x in data if lower_bound <= x <= upper_bound]
-
-# Function to calculate mean tire load
-def calculate_mean_tyre_load(tyre_load_empty, tyre_load_fully_loaded):
-    return (tyre_load_empty + tyre_load_fully_loaded) / 2
+from tkph.core import (TERRAIN_FACTORS, get_tire_damage_factor, remove_outliers,
+                       calculate_mean_tyre_load, calculate_average_speed,
+                       calculate_tkph as core_calculate_tkph)
 
-# Function to calculate average speed
-def calculate_average_speed(round_trip_distances, cycles_per_shift, total_shift_hours):
-    # Remove outliers from round trip distances
-    round_trip_distances = remove_outliers(round_trip_distances)
-    
-    # Calculate mean of round trip distances
-    mean_distance = np.mean(round_trip_distances)
-    
-    # Calculate average speed
-    average_speed = (mean_distance * cycles_per_shift) / total_shift_hours
-    return average_speed
+app = Flask(__name__)
 
-# Function to calculate TKPH
+# Function to calculate TKPH (this variant scales by average speed)
 def calculate_tkph(payload_loaded, distance_loaded, cycle_time, terrain_type, tire_wear_percentage, 
                    tyre_load_empty, tyre_load_fully_loaded, round_trip_distances, 
                    cycles_per_shift, total_shift_hours):
-    # Calculate mean tire load
-    mean_tyre_load = calculate_mean_tyre_load(tyre_load_empty, tyre_load_fully_loaded)
-    
-    # Calculate average speed
-    average_speed = calculate_average_speed(round_trip_distances, cycles_per_shift, total_shift_hours)
-    
-    # Get terrain adjustment factor
-    terrain_factor = TERRAIN_FACTORS.get(terrain_type, 1.0)
-    
-    # Get tire wear damage factor
-    tire_damage_factor = get_tire_damage_factor(tire_wear_percentage)
-    
-    # Calculate Base TKPH
-    tkph_base = (mean_tyre_load * distance_loaded) / cycle_time
-    
-    # Apply terrain adjustment
-    tkph_terrain_adjusted = tkph_base * terrain_factor
-    
-    # Apply tire wear damage adjustment
-    tkph_wear_adjusted = tkph_terrain_adjusted * tire_damage_factor
-    
-    # Final TKPH (including average speed influence)
-    tkph_final = tkph_wear_adjusted * (1 + (average_speed * 0.1))
-    
-    # Calculate suitable TKPH (without terrain and damage adjustments)
-    suitable_tkph = tkph_base * (1 + (average_speed * 0.1))
-    
-    return tkph_final, suitable_tkph
+    return core_calculate_tkph(distance_loaded, cycle_time, terrain_type, tire_wear_percentage,
+                               tyre_load_empty, tyre_load_fully_loaded, round_trip_distances,
+                               cycles_per_shift, total_shift_hours, speed_adjusted=True)
 
 # Function to save TKPH data to Excel
 def save_tkph_data(dumper_id, tyre_position, tkph_final, suitable_tkph):
+    import pandas as pd
+    
     try:
         # Check if file exists
         if not os.path.exists('tkph_tracking.xlsx'):
@@ -119,6 +52,9 @@ def save_tkph_data(dumper_id, tyre_position, tkph_final, suitable_tkph):
 
 # Function to generate TKPH trend bar chart
 def generate_tkph_trend_chart(dumper_id, tyre_position):
+    import pandas as pd
+    import matplotlib.pyplot as plt
+    
     try:
         df = pd.read_excel('tkph_tracking.xlsx')
         
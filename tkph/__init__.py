@@ -0,0 +1,2 @@
+# Shared building blocks for the TKPH calculator (storage, batch scoring, charts).
+# Keep this file free of heavy imports so the CLI and the web app start quickly.
@@ -0,0 +1,294 @@
+import hashlib
+import math
+from datetime import datetime, timezone
+from itertools import repeat
+
+import numpy as np
+from flask import Blueprint, current_app, jsonify, make_response, request
+
+from tkph.batch import INPUT_COLUMNS, calculate_tkph_batch
+from tkph.core import calculate_tkph, evaluate_conditions
+from tkph.fleet import fleet_status
+from tkph.rules import get_rules
+from tkph.store import get_store, parse_timestamp
+from tkph.sweep import SweepGrid, default_axes, run_sweep, sweep_report
+
+# JSON interface for dispatch systems and in-cab tablets, mounted at /api/v1
+api = Blueprint('api', __name__, url_prefix='/api/v1')
+
+# Fields of a single calculation, named as in the calculator form
+FLOAT_FIELDS = ['distance_loaded', 'cycle_time', 'tire_wear_percentage',
+                'tyre_load_empty', 'tyre_load_fully_loaded', 'total_shift_hours']
+BATCH_LIMIT = 10000
+SWEEP_LIMIT = 1000000
+HISTORY_PAGE_SIZE = 100
+HISTORY_PAGE_LIMIT = 1000
+HISTORY_COLUMNS = ['ts', 'tkph_final', 'suitable_tkph']
+
+
+class APIError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+@api.errorhandler(APIError)
+def handle_api_error(e):
+    return jsonify(error=e.message), e.status
+
+
+def _json_body():
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict):
+        raise APIError("Request body must be a JSON object.")
+    return body
+
+# The tracking store configured for the app serving the request
+def _store():
+    return get_store(current_app.config.get('TKPH_STORE_BACKEND'),
+                     current_app.config.get('TKPH_STORE_PATH'))
+
+# The current scoring rules of the site the app serves
+def _rules():
+    return get_rules(current_app.config.get('TKPH_SITE'), current_app.config.get('TKPH_RULES_PATH'))
+
+def _series_key(source):
+    dumper_id = source.get('dumper_id')
+    tyre_position = source.get('tyre_position')
+    if not dumper_id or not tyre_position:
+        raise APIError("dumper_id and tyre_position are required.")
+    return str(dumper_id), str(tyre_position)
+
+# Answer with 304 when the client's ETag still matches; build() is only
+# called when the representation actually has to be sent
+def _conditional(etag, last_ts, build):
+    if etag in request.if_none_match:
+        response = make_response('', 304)
+    else:
+        response = build()
+    response.set_etag(etag)
+    if last_ts is not None:
+        response.last_modified = datetime.fromtimestamp(last_ts, timezone.utc)
+    response.cache_control.no_cache = True
+    return response
+
+def _etag(*parts):
+    return hashlib.sha1('|'.join(map(str, parts)).encode()).hexdigest()
+
+
+# Score one reading (same fields as the calculator form); recorded unless "save" is false
+@api.route('/tkph', methods=['POST'])
+def calculate():
+    body = _json_body()
+    try:
+        values = {name: float(body[name]) for name in FLOAT_FIELDS}
+        distances = body['round_trip_distances']
+        if isinstance(distances, str):
+            distances = distances.split(',')
+        round_trip_distances = [float(x) for x in distances]
+        cycles_per_shift = int(body['cycles_per_shift'])
+        terrain_type = str(body['terrain_type'])
+    except KeyError as e:
+        raise APIError(f"Missing field: {e.args[0]}")
+    except (TypeError, ValueError) as e:
+        raise APIError(f"Invalid input: {e}")
+    for name, value in values.items():
+        if not math.isfinite(value):
+            raise APIError(f"Invalid input: {name} is not a number")
+    timestamp = body.get('timestamp')
+    try:
+        timestamp = None if timestamp is None else parse_timestamp(timestamp)
+    except (TypeError, ValueError, OverflowError) as e:
+        raise APIError(f"Invalid timestamp: {e}")
+
+    rules = _rules()
+    try:
+        tkph_final, suitable_tkph = calculate_tkph(
+            values['distance_loaded'], values['cycle_time'], terrain_type,
+            values['tire_wear_percentage'], values['tyre_load_empty'],
+            values['tyre_load_fully_loaded'], round_trip_distances,
+            cycles_per_shift, values['total_shift_hours'], rules=rules)
+    except (ValueError, IndexError, ZeroDivisionError) as e:
+        raise APIError(f"Invalid input: {e}")
+    condition_status = evaluate_conditions(tkph_final, suitable_tkph, rules)
+
+    if body.get('save', True):
+        dumper_id, tyre_position = _series_key(body)
+        _store().append(dumper_id, tyre_position, tkph_final, suitable_tkph,
+                        timestamp=timestamp, terrain_type=terrain_type,
+                        tire_wear_percentage=values['tire_wear_percentage'], rule_version=rules.key,
+                        speed_multiplier=1.0)
+
+    return jsonify(tkph_final=float(tkph_final), suitable_tkph=float(suitable_tkph),
+                   condition_status=condition_status, rule_version=rules.key)
+
+
+# Score many readings at once with the batch engine. "readings" is either a
+# list of objects or an object of equal-length column lists; fields are those
+# of the bulk upload file. Results come back as columns.
+@api.route('/tkph/batch', methods=['POST'])
+def calculate_batch():
+    body = _json_body()
+    readings = body.get('readings')
+    if isinstance(readings, list):
+        try:
+            columns = {name: [reading[name] for reading in readings]
+                       for name in INPUT_COLUMNS + ['dumper_id', 'tyre_position']
+                       if not readings or name in readings[0]}
+        except (KeyError, TypeError) as e:
+            raise APIError(f"Every reading needs the same fields: {e}")
+    elif isinstance(readings, dict):
+        columns = readings
+    else:
+        raise APIError("'readings' must be a list of objects or an object of columns.")
+
+    missing = [name for name in INPUT_COLUMNS if name not in columns]
+    if missing:
+        raise APIError(f"Missing field(s): {', '.join(missing)}")
+    optional = [name for name in ('dumper_id', 'tyre_position', 'timestamp')
+                if columns.get(name) is not None]
+    for name in INPUT_COLUMNS + optional:
+        if not isinstance(columns[name], list):
+            raise APIError(f"Column '{name}' must be a list.")
+    lengths = {len(columns[name]) for name in INPUT_COLUMNS + optional}
+    if len(lengths) != 1:
+        raise APIError("All columns must have the same length.")
+    count = lengths.pop()
+    if count > BATCH_LIMIT:
+        raise APIError(f"At most {BATCH_LIMIT} readings per batch.", 413)
+
+    try:
+        numeric = {name: np.asarray(columns[name], dtype=np.float64)
+                   for name in INPUT_COLUMNS if name != 'terrain_type'}
+    except (TypeError, ValueError) as e:
+        raise APIError(f"Invalid input: {e}")
+    for name, values in numeric.items():
+        if values.ndim != 1:
+            raise APIError(f"Invalid input: column '{name}' must hold numbers.")
+        # null and strings such as "nan" convert to NaN
+        bad = np.flatnonzero(~np.isfinite(values))
+        if len(bad):
+            raise APIError(f"Invalid input: column '{name}' reading {bad[0]}: not a number")
+    rules = _rules()
+    terrain_type = np.asarray(columns['terrain_type'], dtype=str)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        tkph_final, suitable_tkph, condition_status = calculate_tkph_batch(
+            terrain_type=terrain_type, rules=rules, **numeric)
+    bad = np.flatnonzero(~(np.isfinite(tkph_final) & np.isfinite(suitable_tkph)))
+    if len(bad):
+        raise APIError(f"Invalid input: reading {bad[0]}: TKPH is not a finite number "
+                       f"(is cycle_time 0?)")
+
+    if body.get('save', True) and count:
+        dumper_ids = columns.get('dumper_id')
+        tyre_positions = columns.get('tyre_position')
+        if dumper_ids is None or tyre_positions is None:
+            raise APIError("dumper_id and tyre_position columns are required to save readings.")
+        timestamps = columns.get('timestamp')
+        try:
+            timestamps = [parse_timestamp(ts) for ts in timestamps] if timestamps else \
+                [parse_timestamp(datetime.now())] * count
+        except (TypeError, ValueError, OverflowError) as e:
+            raise APIError(f"Invalid timestamp: {e}")
+        _store().append_many(zip(timestamps, map(str, dumper_ids), map(str, tyre_positions),
+                                 tkph_final.tolist(), suitable_tkph.tolist(), terrain_type.tolist(),
+                                 numeric['tire_wear_percentage'].tolist(), repeat(rules.key),
+                                 repeat(1.0)))
+
+    return jsonify(tkph_final=tkph_final.tolist(), suitable_tkph=suitable_tkph.tolist(),
+                   condition_status=condition_status.tolist(), rule_version=rules.key)
+
+
+# One tyre's history, newest first, paginated with an opaque cursor.
+# Rows are [ts, tkph_final, suitable_tkph] with ts in epoch seconds.
+@api.route('/history')
+def history():
+    dumper_id, tyre_position = _series_key(request.args)
+    limit = request.args.get('limit', HISTORY_PAGE_SIZE, type=int)
+    if not 0 < limit <= HISTORY_PAGE_LIMIT:
+        raise APIError(f"limit must be between 1 and {HISTORY_PAGE_LIMIT}.")
+    cursor = request.args.get('cursor')
+    try:
+        before = tuple(int(part) for part in cursor.split('.')) if cursor else None
+        if before is not None and len(before) != 2:
+            raise ValueError
+    except ValueError:
+        raise APIError("Invalid cursor.")
+
+    store = _store()
+    version, last_ts = store.series_version(dumper_id, tyre_position)
+    if version == 0:
+        raise APIError("No history for this dumper and tyre position.", 404)
+
+    def build():
+        rows = store.page_series(dumper_id, tyre_position, limit, before)
+        next_cursor = f"{rows[-1][1]}.{rows[-1][0]}" if len(rows) == limit else None
+        return jsonify(dumper_id=dumper_id, tyre_position=tyre_position,
+                       columns=HISTORY_COLUMNS, rows=[row[1:] for row in rows],
+                       next_cursor=next_cursor)
+
+    etag = _etag('history', dumper_id, tyre_position, version, last_ts, limit, cursor)
+    return _conditional(etag, last_ts, build)
+
+
+# Current condition of every tyre in the fleet (latest reading per tyre)
+@api.route('/fleet')
+def fleet():
+    return jsonify(fleet_status(_store().latest_readings(), _rules()))
+
+
+# One sweep axis from the request: a list of values or {"start", "stop",
+# "num"}, checked before anything is allocated. Numeric values must be finite
+# and cycle_time must stay clear of 0, or the summary would hold NaN / inf.
+# Returns the axis length and a function building its values.
+def _sweep_axis(name, values):
+    if isinstance(values, dict):
+        start, stop, num = float(values['start']), float(values['stop']), int(values['num'])
+        if not 1 <= num <= SWEEP_LIMIT:
+            raise APIError(f"Invalid sweep: {name} num must be between 1 and {SWEEP_LIMIT}")
+        if not (math.isfinite(start) and math.isfinite(stop)):
+            raise APIError(f"Invalid sweep: {name} start and stop must be finite numbers")
+        if name == 'cycle_time' and min(start, stop) <= 0 <= max(start, stop):
+            raise APIError("Invalid sweep: cycle_time range must not include 0")
+        return num, lambda: np.linspace(start, stop, num).tolist()
+    values = values if isinstance(values, list) else [values]
+    if name != 'terrain_type':
+        values = [float(value) for value in values]
+        if not all(math.isfinite(value) for value in values):
+            raise APIError(f"Invalid sweep: {name} values must be finite numbers")
+        if name == 'cycle_time' and 0 in values:
+            raise APIError("Invalid sweep: cycle_time must not be 0")
+    return len(values), lambda: values
+
+# What-if sweep: "axes" maps input names to a list of values or to
+# {"start", "stop", "num"}; "baseline" fixes the inputs that are not swept.
+# Returns the sensitivity tables and tornado summary (see tkph.sweep).
+@api.route('/sweep', methods=['POST'])
+def sweep():
+    body = _json_body()
+    baseline = body.get('baseline') or {}
+    try:
+        requested = body.get('axes') or {}
+        unknown = [name for name in list(requested) + list(baseline) if name not in INPUT_COLUMNS]
+        if unknown:
+            raise APIError(f"Unknown input(s): {', '.join(unknown)}")
+        for name, value in baseline.items():
+            if name != 'terrain_type' and not math.isfinite(float(value)):
+                raise APIError(f"Invalid sweep: baseline {name} must be a finite number")
+        if float(baseline.get('cycle_time', 1)) == 0:
+            raise APIError("Invalid sweep: baseline cycle_time must not be 0")
+
+        axes = {name: _sweep_axis(name, values) for name, values in requested.items()}
+        if math.prod(size for size, _ in axes.values()) > SWEEP_LIMIT:
+            raise APIError(f"At most {SWEEP_LIMIT} combinations per sweep; "
+                           f"use python -m tkph.sweep for larger grids.", 413)
+        axes = {name: build() for name, (_, build) in axes.items()}
+        rules = _rules()
+        grid = SweepGrid(axes or default_axes(baseline, rules), baseline, rules=rules)
+    except (KeyError, TypeError, ValueError) as e:
+        raise APIError(f"Invalid sweep: {e}")
+    if grid.size > SWEEP_LIMIT:
+        raise APIError(f"At most {SWEEP_LIMIT} combinations per sweep; "
+                       f"use python -m tkph.sweep for larger grids.", 413)
+    return jsonify(sweep_report(grid, run_sweep(grid)))
@@ -0,0 +1,182 @@
+import argparse
+import json
+import sys
+import time
+
+import numpy as np
+
+from tkph.batch import CONDITION_STATUSES, rescore_stored
+from tkph.rules import DEFAULT_RULES, get_rule_book, get_rules
+from tkph.store import SQLiteStore, get_store
+from tkph.sweep import imap_bounded
+
+# Backfill: re-score the stored history under the current formula and rules,
+# i.e. what the web app would record for each reading today. Readings are
+# read in id order, BACKFILL_CHUNKSIZE at a time, and re-scored with the batch
+# engine, optionally over a process pool; each chunk's results are written to
+# tkph_rescored under the target rule version together with a checkpoint, so
+# an interrupted run resumes after the last chunk it committed. The original
+# readings are never modified.
+#
+#   python -m tkph.backfill --workers 4
+#
+# Stored values are first brought back to the base formula by dividing out
+# the speed multiplier the reading records. Readings that record their
+# terrain and wear are re-scored from the suitable TKPH; older readings keep
+# their final value and only have their condition re-evaluated. Readings
+# recording no multiplier are taken to be on the base formula.
+
+BACKFILL_CHUNKSIZE = 50000
+
+_worker_rules = None
+_worker_book = None
+
+
+def _init_worker(rules, book):
+    global _worker_rules, _worker_book
+    _worker_rules = rules
+    _worker_book = book
+
+def _rules_for(book, key):
+    if key is None:
+        return DEFAULT_RULES
+    try:
+        return book.get(key)
+    except ValueError:  # version no longer in the rules file
+        return DEFAULT_RULES
+
+# Re-score one chunk of iter_scored_rows tuples under `rules`. Returns the
+# tkph_rescored rows (reading_id, tkph_final, suitable_tkph, condition_status,
+# from_inputs) and the number of readings whose condition changed from the one
+# their recorded rule version gave them.
+def rescore_rows(chunk, rules, book):
+    (reading_ids, _, _, _, tkph_final, suitable_tkph, terrain_type, wear, rule_version,
+     speed_multiplier) = zip(*chunk)
+    multiplier = np.array([1.0 if m is None else m for m in speed_multiplier], dtype=np.float64)
+    tkph_final = np.array(tkph_final, dtype=np.float64)
+    suitable_tkph = np.array(suitable_tkph, dtype=np.float64)
+
+    before = np.empty(len(chunk), dtype=np.int8)
+    rule_version = np.array(rule_version, dtype=object)
+    for key in set(rule_version.tolist()):
+        scored = rule_version == key
+        before[scored] = _rules_for(book, key).condition_codes(tkph_final[scored],
+                                                                suitable_tkph[scored])
+
+    tkph_final = tkph_final / multiplier
+    suitable_tkph = suitable_tkph / multiplier
+    known = np.array([t is not None and w is not None for t, w in zip(terrain_type, wear)])
+    if known.any():
+        tkph_final[known], _ = rescore_stored(suitable_tkph[known],
+                                              np.array(terrain_type, dtype=object)[known].astype(str),
+                                              np.array(wear, dtype=object)[known].astype(np.float64),
+                                              rules)
+    after = rules.condition_codes(tkph_final, suitable_tkph)
+
+    rows = list(zip(reading_ids, tkph_final.tolist(), suitable_tkph.tolist(),
+                    CONDITION_STATUSES[after].tolist(), known.astype(int).tolist()))
+    return rows, int((before != after).sum())
+
+def _rescore_chunk(chunk):
+    return rescore_rows(chunk, _worker_rules, _worker_book), chunk[-1][0]
+
+# Chunks of stored rows with after_id < id <= until_id, read one at a time
+def _read_chunks(store, after_id, until_id, chunksize):
+    while after_id < until_id:
+        chunk = store.read_scored_rows(after_id, chunksize, until_id)
+        if not chunk:
+            break
+        yield chunk
+        after_id = chunk[-1][0]
+
+# Re-score every reading stored so far under `rules` (default: the configured
+# site's current rules), resuming from the version's checkpoint unless
+# `restart`. progress, if given, is called after each committed chunk with
+# the running stats. Returns {'version', 'rows', 'changed', 'seconds',
+# 'rows_per_second', 'resumed_from', 'last_reading_id', 'until_reading_id',
+# 'rows_done'}, rows_done counting the earlier runs too.
+def run_backfill(store, rules=None, book=None, workers=1, chunksize=BACKFILL_CHUNKSIZE,
+                 restart=False, progress=None):
+    if not isinstance(store, SQLiteStore):
+        raise ValueError('Backfill needs the SQLite store (TKPH_STORE_BACKEND=sqlite)')
+    rules = rules or get_rules()
+    book = book or get_rule_book()
+    version = rules.key
+    if restart:
+        store.reset_backfill(version)
+    checkpoint = store.backfill_progress(version) or {'last_reading_id': 0, 'rows_done': 0}
+    until_id = store.max_reading_id()
+
+    stats = {'version': version, 'rows': 0, 'changed': 0, 'seconds': 0.0, 'rows_per_second': 0.0,
+             'resumed_from': checkpoint['last_reading_id'],
+             'last_reading_id': checkpoint['last_reading_id'], 'until_reading_id': until_id,
+             'rows_done': checkpoint['rows_done']}
+    chunks = _read_chunks(store, checkpoint['last_reading_id'], until_id, chunksize)
+    if workers > 1:
+        from multiprocessing import Pool
+        pool = Pool(workers, initializer=_init_worker, initargs=(rules, book))
+        results = imap_bounded(pool, _rescore_chunk, chunks, 2 * workers)
+    else:
+        pool = None
+        _init_worker(rules, book)
+        results = map(_rescore_chunk, chunks)
+
+    started = time.perf_counter()
+    try:
+        for (rows, changed), last_reading_id in results:
+            store.save_rescored(version, rows, last_reading_id)
+            stats['rows'] += len(rows)
+            stats['rows_done'] += len(rows)
+            stats['changed'] += changed
+            stats['last_reading_id'] = last_reading_id
+            stats['seconds'] = time.perf_counter() - started
+            stats['rows_per_second'] = stats['rows'] / stats['seconds'] if stats['seconds'] else 0.0
+            if progress is not None:
+                progress(stats)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    stats['seconds'] = time.perf_counter() - started
+    stats['rows_per_second'] = stats['rows'] / stats['seconds'] if stats['seconds'] else 0.0
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Re-score the stored TKPH history under the current rules.')
+    parser.add_argument('--rules', help='rules file (default: TKPH_RULES_PATH)')
+    parser.add_argument('--version', help='site@version to re-score under (default: the current rules)')
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--chunksize', type=int, default=BACKFILL_CHUNKSIZE)
+    parser.add_argument('--restart', action='store_true',
+                        help="discard the version's earlier results and start from the first reading")
+    parser.add_argument('--json', action='store_true', help='print the final stats as JSON')
+    args = parser.parse_args(argv)
+
+    def report(stats):
+        span = stats['until_reading_id'] - stats['resumed_from']
+        done = stats['last_reading_id'] - stats['resumed_from']
+        print(f"{stats['version']}: {stats['rows_done']} readings re-scored "
+              f"({100.0 * done / span if span else 100.0:.1f}% of this run), "
+              f"{stats['rows_per_second']:.0f} readings/s", file=sys.stderr)
+
+    try:
+        book = get_rule_book(args.rules)
+        rules = book.get(args.version) if args.version else get_rules(path=args.rules)
+        store = get_store()
+        stats = run_backfill(store, rules, book, args.workers, args.chunksize, args.restart, report)
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+
+    stats['conditions'] = store.rescored_condition_counts(stats['version'])
+    if args.json:
+        print(json.dumps(stats, indent=2))
+    else:
+        print(f"{stats['version']}: {stats['rows']} readings in {stats['seconds']:.1f} s "
+              f"({stats['rows_per_second']:.0f}/s), {stats['changed']} changed condition; "
+              f"{stats['rows_done']} re-scored in total, up to reading {stats['last_reading_id']}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,90 @@
+import numpy as np
+
+from tkph.rules import CONDITION_BANDS, CRITICAL_CONDITION, DEFAULT_RULES, get_rules
+
+# Vectorised counterparts of calculate_tkph / get_tire_damage_factor /
+# evaluate_conditions in tkph.core. The lookup tables are compiled from the
+# same rules (tkph.rules.RuleTable); the arithmetic is done in the same order
+# so results match bit for bit. Every function scores with the configured
+# site's current rules unless a RuleTable is passed in.
+
+# Tables of the built-in rules (see RuleTable for what they hold)
+TERRAIN_NAMES = DEFAULT_RULES.terrain_names
+TERRAIN_CODE_FACTORS = DEFAULT_RULES.terrain_code_factors
+WEAR_BAND_EDGES = DEFAULT_RULES.wear_band_edges
+WEAR_BAND_FACTORS = DEFAULT_RULES.wear_band_factors
+
+CONDITION_RATIOS = DEFAULT_RULES.condition_ratios
+CONDITION_LABELS = [status for _, status in CONDITION_BANDS]
+CRITICAL_LABEL = CRITICAL_CONDITION
+CONDITION_STATUSES = np.array(CONDITION_LABELS + [CRITICAL_LABEL])
+
+# Input columns, named after the fields of the calculator form
+INPUT_COLUMNS = ['distance_loaded', 'cycle_time', 'terrain_type', 'tire_wear_percentage',
+                 'tyre_load_empty', 'tyre_load_fully_loaded']
+
+# Map terrain names to int8 codes, -1 for anything the rules do not list
+def encode_terrain(terrain_type, rules=None):
+    return (rules or get_rules()).encode_terrain(terrain_type)
+
+def terrain_factors(terrain_type, rules=None):
+    return (rules or get_rules()).terrain_factor_array(terrain_type)
+
+def tire_damage_factors(wear_percentage, rules=None):
+    return (rules or get_rules()).tire_damage_factor_array(wear_percentage)
+
+# Condition as an index into CONDITION_LABELS + [CRITICAL_LABEL] (0 = Normal)
+def condition_codes(tkph_final, suitable_tkph, rules=None):
+    return (rules or get_rules()).condition_codes(tkph_final, suitable_tkph)
+
+def evaluate_conditions_batch(tkph_final, suitable_tkph, rules=None):
+    return CONDITION_STATUSES[condition_codes(tkph_final, suitable_tkph, rules)]
+
+# (tkph_final, suitable_tkph) for many readings at once. Arguments are arrays
+# (or lists) that broadcast against each other, e.g. equal-length columns.
+def tkph_values(distance_loaded, cycle_time, terrain_type, tire_wear_percentage,
+                tyre_load_empty, tyre_load_fully_loaded, rules=None):
+    rules = rules or get_rules()
+    distance_loaded = np.asarray(distance_loaded, dtype=np.float64)
+    cycle_time = np.asarray(cycle_time, dtype=np.float64)
+    tyre_load_empty = np.asarray(tyre_load_empty, dtype=np.float64)
+    tyre_load_fully_loaded = np.asarray(tyre_load_fully_loaded, dtype=np.float64)
+
+    mean_tyre_load = (tyre_load_empty + tyre_load_fully_loaded) / 2
+    tkph_base = (mean_tyre_load * distance_loaded) / cycle_time
+    tkph_final = tkph_base * rules.terrain_factor_array(terrain_type) * \
+        rules.tire_damage_factor_array(tire_wear_percentage)
+    suitable_tkph = tkph_base
+    return tkph_final, suitable_tkph
+
+# Score many readings at once; every argument is an array (or list) of equal length
+def calculate_tkph_batch(distance_loaded, cycle_time, terrain_type, tire_wear_percentage,
+                         tyre_load_empty, tyre_load_fully_loaded, rules=None):
+    rules = rules or get_rules()
+    tkph_final, suitable_tkph = tkph_values(distance_loaded, cycle_time, terrain_type,
+                                            tire_wear_percentage, tyre_load_empty,
+                                            tyre_load_fully_loaded, rules)
+    return tkph_final, suitable_tkph, evaluate_conditions_batch(tkph_final, suitable_tkph, rules)
+
+# Score a DataFrame (or any mapping of columns) holding INPUT_COLUMNS.
+# A DataFrame comes back as a copy with the result columns added.
+def score_columns(columns, rules=None):
+    tkph_final, suitable_tkph, condition_status = calculate_tkph_batch(
+        *(np.asarray(columns[name]) for name in INPUT_COLUMNS), rules=rules)
+    if hasattr(columns, 'assign'):
+        return columns.assign(**{'TKPH Final': tkph_final,
+                                 'Suitable TKPH': suitable_tkph,
+                                 'Condition Status': condition_status})
+    return {'TKPH Final': tkph_final, 'Suitable TKPH': suitable_tkph,
+            'Condition Status': condition_status}
+
+# Re-score stored readings under other rules from what the store keeps of
+# them: suitable TKPH does not depend on the rules, so the new final value is
+# the suitable value times the new terrain and wear factors. Returns
+# (tkph_final, condition codes).
+def rescore_stored(suitable_tkph, terrain_type, tire_wear_percentage, rules=None):
+    rules = rules or get_rules()
+    suitable_tkph = np.asarray(suitable_tkph, dtype=np.float64)
+    tkph_final = suitable_tkph * rules.terrain_factor_array(terrain_type) * \
+        rules.tire_damage_factor_array(tire_wear_percentage)
+    return tkph_final, rules.condition_codes(tkph_final, suitable_tkph)
@@ -0,0 +1,169 @@
+import argparse
+import csv
+import os
+import pickle
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from tkph.batch import INPUT_COLUMNS, score_columns
+from tkph.rules import get_rules
+from tkph.store import format_timestamp, get_store, parse_timestamp
+
+# Columns a bulk readings file must carry (an optional 'timestamp' column is
+# used as the reading time; otherwise the upload time is recorded)
+ID_COLUMNS = ['dumper_id', 'tyre_position']
+REQUIRED_COLUMNS = ID_COLUMNS + INPUT_COLUMNS
+RESULT_COLUMNS = ['TKPH Final', 'Suitable TKPH', 'Condition Status']
+NUMERIC_COLUMNS = [name for name in INPUT_COLUMNS if name != 'terrain_type']
+
+DEFAULT_CHUNKSIZE = 5000
+
+# Yield DataFrames of at most chunksize rows from a CSV or Excel readings file
+def iter_reading_chunks(source, filename, chunksize=DEFAULT_CHUNKSIZE):
+    import pandas as pd
+
+    text_columns = {name: str for name in ID_COLUMNS + ['terrain_type']}
+    if not filename.lower().endswith(('.xlsx', '.xlsm')):
+        yield from pd.read_csv(source, chunksize=chunksize, skipinitialspace=True,
+                               dtype=dict(text_columns, timestamp=str))
+        return
+
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(source, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = [str(name).strip() if name is not None else '' for name in next(rows, ())]
+        chunk = []
+        for row in rows:
+            if row is None or all(value is None for value in row):
+                continue
+            chunk.append(row)
+            if len(chunk) == chunksize:
+                yield pd.DataFrame(chunk, columns=header).astype(
+                    {k: v for k, v in text_columns.items() if k in header})
+                chunk = []
+        if chunk:
+            yield pd.DataFrame(chunk, columns=header).astype(
+                {k: v for k, v in text_columns.items() if k in header})
+    finally:
+        workbook.close()
+
+def _check_columns(chunk):
+    missing = [name for name in REQUIRED_COLUMNS if name not in chunk.columns]
+    if missing:
+        raise ValueError(f"missing column(s): {', '.join(missing)}")
+
+# Score a readings file chunk by chunk, write one results row per input row to
+# `output` (a text stream, CSV) and persist every reading in a single store
+# transaction: either the whole file is recorded or none of it is. The readings
+# wait in a temporary file until the whole file has been parsed and scored, so
+# the store's write lock is only held for the inserts and the web app's
+# background writers are not kept waiting while a large upload is scored.
+def score_readings_file(source, filename, output, store=None, save=True,
+                        chunksize=DEFAULT_CHUNKSIZE, rules=None):
+    import pandas as pd
+
+    store = store or get_store()
+    rules = rules or get_rules()
+    started = time.perf_counter()
+    rows_scored = 0
+    writer = csv.writer(output)
+    writer.writerow(REQUIRED_COLUMNS + ['timestamp'] + RESULT_COLUMNS)
+
+    with tempfile.TemporaryFile() as spool:
+        for chunk in iter_reading_chunks(source, filename, chunksize):
+            _check_columns(chunk)
+            for name in NUMERIC_COLUMNS:
+                try:
+                    chunk[name] = pd.to_numeric(chunk[name])
+                except (ValueError, TypeError) as e:
+                    raise ValueError(f"column '{name}' near row {rows_scored + 1}: {e}")
+                # Blank cells and the like come through as NaN, which the store cannot hold
+                bad = np.flatnonzero(~np.isfinite(chunk[name].to_numpy(dtype=np.float64)))
+                if len(bad):
+                    raise ValueError(f"column '{name}' row {rows_scored + bad[0] + 1}: not a number")
+            scored = score_columns(chunk, rules)
+            bad = np.flatnonzero(~(np.isfinite(scored['TKPH Final'].to_numpy()) &
+                                   np.isfinite(scored['Suitable TKPH'].to_numpy())))
+            if len(bad):
+                raise ValueError(f"row {rows_scored + bad[0] + 1}: TKPH is not a finite number "
+                                 f"(is cycle_time 0?)")
+
+            now = int(time.time())
+            if 'timestamp' in chunk.columns:
+                timestamps = [now if pd.isna(value) else parse_timestamp(value)
+                              for value in chunk['timestamp']]
+            else:
+                timestamps = [now] * len(chunk)
+
+            dumper_ids = scored['dumper_id'].tolist()
+            tyre_positions = scored['tyre_position'].tolist()
+            tkph_finals = scored['TKPH Final'].tolist()
+            suitable_tkphs = scored['Suitable TKPH'].tolist()
+            if save:
+                pickle.dump(list(zip(timestamps, dumper_ids, tyre_positions, tkph_finals, suitable_tkphs,
+                                     scored['terrain_type'].tolist(),
+                                     scored['tire_wear_percentage'].tolist(),
+                                     [rules.key] * len(chunk), [1.0] * len(chunk))),
+                            spool, pickle.HIGHEST_PROTOCOL)
+
+            inputs = scored[INPUT_COLUMNS].itertuples(index=False, name=None)
+            statuses = scored['Condition Status'].tolist()
+            writer.writerows(
+                [d, t, *values, format_timestamp(ts), f, s, c] for d, t, values, ts, f, s, c in
+                zip(dumper_ids, tyre_positions, inputs, timestamps, tkph_finals,
+                    suitable_tkphs, statuses))
+            rows_scored += len(chunk)
+
+        if save:
+            spool.seek(0)
+            with store.writer() as write:
+                for rows in _iter_spooled(spool):
+                    write(rows)
+
+    seconds = time.perf_counter() - started
+    return {
+        'rows': rows_scored,
+        'seconds': seconds,
+        'rows_per_second': rows_scored / seconds if seconds > 0 else float('inf'),
+    }
+
+# Chunks of rows pickled one after another into a file
+def _iter_spooled(spool):
+    while True:
+        try:
+            yield pickle.load(spool)
+        except EOFError:
+            return
+
+# Command-line mode: python -m tkph.bulk readings.csv -o results.csv
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Score a CSV/Excel file of TKPH readings in bulk.')
+    parser.add_argument('input', help='readings file (.csv or .xlsx)')
+    parser.add_argument('-o', '--output', help='results CSV (default: stdout)')
+    parser.add_argument('--chunksize', type=int, default=DEFAULT_CHUNKSIZE)
+    parser.add_argument('--no-save', action='store_true',
+                        help='score only, do not record readings in the tracking store')
+    args = parser.parse_args(argv)
+
+    output = open(args.output, 'w', newline='') if args.output else sys.stdout
+    try:
+        stats = score_readings_file(args.input, os.path.basename(args.input), output,
+                                    save=not args.no_save, chunksize=args.chunksize)
+    except ValueError as e:
+        print(f"Invalid input: {e}", file=sys.stderr)
+        return 1
+    finally:
+        if args.output:
+            output.close()
+
+    print(f"Scored {stats['rows']} rows in {stats['seconds']:.2f}s "
+          f"({stats['rows_per_second']:.0f} rows/s)", file=sys.stderr)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,54 @@
+import os
+import threading
+from collections import OrderedDict
+
+DEFAULT_MAX_BYTES = int(os.environ.get('TKPH_CHART_CACHE_BYTES', 64 * 1024 * 1024))
+
+# LRU cache of rendered trend charts bounded by total payload size. Entries are
+# keyed by (dumper_id, tyre_position, data version, kind); storing a newer
+# version of a series drops the older ones straight away, so only a new
+# reading for that tyre invalidates its charts.
+class ChartCache:
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, dumper_id, tyre_position, version, kind='png'):
+        key = (dumper_id, tyre_position, version, kind)
+        with self._lock:
+            data = self._entries.get(key)
+            if data is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return data
+
+    def put(self, dumper_id, tyre_position, version, data, kind='png'):
+        if len(data) > self.max_bytes:
+            return
+        key = (dumper_id, tyre_position, version, kind)
+        with self._lock:
+            stale = [k for k in self._entries
+                     if k[0] == dumper_id and k[1] == tyre_position and k[3] == kind and k != key]
+            for k in stale:
+                self.current_bytes -= len(self._entries.pop(k))
+            if key in self._entries:
+                self.current_bytes -= len(self._entries.pop(key))
+            self._entries[key] = data
+            self.current_bytes += len(data)
+            while self.current_bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.current_bytes -= len(evicted)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,160 @@
+import io
+import threading
+from datetime import datetime
+from html import escape
+
+# Trend chart renderers. Each takes a tyre's time-sorted series of
+# (ts, tkph_final, suitable_tkph) rows as returned by the store.
+#
+#   'svg'  - small vector chart built straight from the data, no matplotlib
+#   'json' - the raw series for client-side plotting
+#   'png'  - the original matplotlib raster chart (matplotlib imported lazily)
+
+CHART_KINDS = {
+    'svg': 'image/svg+xml',
+    'json': 'application/json',
+    'png': 'image/png',
+}
+
+# Colours and sizes follow the matplotlib chart so the modes look alike
+SERIES_STYLES = [
+    ('TKPH Final', 'blue', 1),
+    ('Suitable TKPH', 'green', 2),
+]
+SVG_WIDTH, SVG_HEIGHT = 960, 480
+SVG_MARGIN_LEFT, SVG_MARGIN_RIGHT, SVG_MARGIN_TOP, SVG_MARGIN_BOTTOM = 70, 20, 50, 60
+SVG_Y_TICKS = 5
+NO_DATA_TEXT = 'No readings recorded for this tyre yet'
+
+# matplotlib style contexts touch global rcParams, so renders are serialised
+_png_lock = threading.Lock()
+
+def trend_chart_title(dumper_id, tyre_position):
+    return f'TKPH Trend for Dumper {dumper_id} - {tyre_position}'
+
+# Columnar series for client-side plotting (timestamps in epoch seconds)
+def trend_chart_json(dumper_id, tyre_position, series):
+    return {
+        'dumper_id': dumper_id,
+        'tyre_position': tyre_position,
+        'timestamps': [ts for ts, _, _ in series],
+        'tkph_final': [tkph_final for _, tkph_final, _ in series],
+        'suitable_tkph': [suitable_tkph for _, _, suitable_tkph in series],
+    }
+
+# Title and a "no readings" note, for a tyre whose series is empty
+def _empty_trend_svg(dumper_id, tyre_position):
+    return (f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 {SVG_WIDTH} {SVG_HEIGHT}" '
+            f'font-family="sans-serif" font-size="12">'
+            f'<rect width="{SVG_WIDTH}" height="{SVG_HEIGHT}" fill="white"/>'
+            f'<text x="{SVG_WIDTH / 2}" y="28" font-size="18" text-anchor="middle">'
+            f'{escape(trend_chart_title(dumper_id, tyre_position))}</text>'
+            f'<text x="{SVG_WIDTH / 2}" y="{SVG_HEIGHT / 2}" font-size="14" fill="#7f8c8d" '
+            f'text-anchor="middle">{NO_DATA_TEXT}</text></svg>').encode()
+
+def render_trend_svg(dumper_id, tyre_position, series):
+    if not series:
+        return _empty_trend_svg(dumper_id, tyre_position)
+    timestamps = [ts for ts, _, _ in series]
+    values = [row[1:] for row in series]
+    plot_width = SVG_WIDTH - SVG_MARGIN_LEFT - SVG_MARGIN_RIGHT
+    plot_height = SVG_HEIGHT - SVG_MARGIN_TOP - SVG_MARGIN_BOTTOM
+
+    t_min, t_max = timestamps[0], timestamps[-1]
+    y_min = min(min(pair) for pair in values)
+    y_max = max(max(pair) for pair in values)
+    if y_max == y_min:
+        y_min, y_max = y_min - 1, y_max + 1
+    y_pad = (y_max - y_min) * 0.05
+    y_min, y_max = y_min - y_pad, y_max + y_pad
+
+    def x_of(ts):
+        if t_max == t_min:
+            return SVG_MARGIN_LEFT + plot_width / 2
+        return SVG_MARGIN_LEFT + (ts - t_min) / (t_max - t_min) * plot_width
+
+    def y_of(value):
+        return SVG_MARGIN_TOP + (y_max - value) / (y_max - y_min) * plot_height
+
+    parts = [
+        f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 {SVG_WIDTH} {SVG_HEIGHT}" '
+        f'font-family="sans-serif" font-size="12">',
+        f'<rect width="{SVG_WIDTH}" height="{SVG_HEIGHT}" fill="white"/>',
+        f'<text x="{SVG_WIDTH / 2}" y="28" font-size="18" text-anchor="middle">'
+        f'{escape(trend_chart_title(dumper_id, tyre_position))}</text>',
+    ]
+
+    # Grid lines and y-axis labels
+    for i in range(SVG_Y_TICKS + 1):
+        value = y_min + (y_max - y_min) * i / SVG_Y_TICKS
+        y = y_of(value)
+        parts.append(f'<line x1="{SVG_MARGIN_LEFT}" y1="{y:.1f}" x2="{SVG_WIDTH - SVG_MARGIN_RIGHT}" '
+                     f'y2="{y:.1f}" stroke="#ccc" stroke-dasharray="4 3"/>')
+        parts.append(f'<text x="{SVG_MARGIN_LEFT - 8}" y="{y + 4:.1f}" text-anchor="end">{value:.1f}</text>')
+
+    # First and last timestamps on the x axis
+    axis_y = SVG_HEIGHT - SVG_MARGIN_BOTTOM
+    for ts, anchor in ((t_min, 'start'), (t_max, 'end')):
+        label = datetime.fromtimestamp(ts).strftime('%Y-%m-%d %H:%M')
+        parts.append(f'<text x="{x_of(ts):.1f}" y="{axis_y + 20}" text-anchor="{anchor}">{label}</text>')
+    parts.append(f'<text x="{SVG_WIDTH / 2}" y="{SVG_HEIGHT - 12}" text-anchor="middle">Timestamp</text>')
+    parts.append(f'<text x="16" y="{SVG_HEIGHT / 2}" text-anchor="middle" '
+                 f'transform="rotate(-90 16 {SVG_HEIGHT / 2})">TKPH Value</text>')
+
+    # One polyline per series plus point markers
+    for label, colour, column in SERIES_STYLES:
+        points = ' '.join(f'{x_of(row[0]):.1f},{y_of(row[column]):.1f}' for row in series)
+        parts.append(f'<polyline fill="none" stroke="{colour}" stroke-width="2" points="{points}"/>')
+        if len(series) <= 500:
+            parts.extend(f'<circle cx="{x_of(row[0]):.1f}" cy="{y_of(row[column]):.1f}" r="3" fill="{colour}"/>'
+                         for row in series)
+
+    # Legend
+    for i, (label, colour, _) in enumerate(SERIES_STYLES):
+        y = SVG_MARGIN_TOP + 10 + i * 18
+        x = SVG_WIDTH - SVG_MARGIN_RIGHT - 140
+        parts.append(f'<line x1="{x}" y1="{y}" x2="{x + 20}" y2="{y}" stroke="{colour}" stroke-width="2"/>')
+        parts.append(f'<text x="{x + 26}" y="{y + 4}">{label}</text>')
+
+    parts.append('</svg>')
+    return ''.join(parts).encode()
+
+# Raster chart through matplotlib's object API (no pyplot state machine)
+def render_trend_png(dumper_id, tyre_position, series):
+    from matplotlib import style
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    timestamps = [datetime.fromtimestamp(ts) for ts, _, _ in series]
+    tkph_finals = [tkph_final for _, tkph_final, _ in series]
+    suitable_tkphs = [suitable_tkph for _, _, suitable_tkph in series]
+
+    # matplotlib >= 3.6 renamed the seaborn style
+    style_name = 'seaborn-v0_8' if 'seaborn-v0_8' in style.available else 'seaborn'
+    with _png_lock, style.context(style_name):
+        figure = Figure(figsize=(12, 6))
+        FigureCanvasAgg(figure)
+        ax = figure.subplots()
+
+        ax.plot(timestamps, tkph_finals, label='TKPH Final', color='blue', marker='o', linewidth=2)
+        ax.plot(timestamps, suitable_tkphs, label='Suitable TKPH', color='green', marker='s', linewidth=2)
+        if not series:
+            ax.text(0.5, 0.5, NO_DATA_TEXT, transform=ax.transAxes, ha='center', va='center',
+                    fontsize=14, color='#7f8c8d')
+
+        ax.set_title(trend_chart_title(dumper_id, tyre_position), fontsize=15)
+        ax.set_xlabel('Timestamp', fontsize=12)
+        ax.set_ylabel('TKPH Value', fontsize=12)
+        figure.autofmt_xdate()
+        ax.grid(True, linestyle='--', linewidth=0.5)
+        ax.legend()
+        figure.tight_layout()
+
+        buffer = io.BytesIO()
+        figure.savefig(buffer, format='png', dpi=300)
+    return buffer.getvalue()
+
+RENDERERS = {
+    'svg': render_trend_svg,
+    'png': render_trend_png,
+}
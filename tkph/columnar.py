@@ -0,0 +1,213 @@
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+
+import numpy as np
+
+from tkph.store import series_key
+
+# Column arrays of the history, in row order
+COLUMN_NAMES = ('ts', 'dumper_code', 'position_code', 'tkph_final', 'suitable_tkph')
+
+# In-process copy of the tracking history in compact columns: dumper ids and
+# tyre positions are interned to small integer codes, timestamps are int64
+# epoch seconds and TKPH values are float64, each in a typed array. A
+# per-tyre list of row positions in time order answers series queries with a
+# bisect plus O(k) gathering. That comes to about 40 bytes per reading (32 in
+# the columns, 8 in the per-tyre index) instead of a DataFrame row of Python
+# objects. The history is loaded from the store once and
+# then caught up in place with sync(), or bulk-loaded from column arrays such
+# as a memory-mapped snapshot (tkph.snapshot).
+#
+# Bulk-loaded columns are kept as they are given, without copying: a mapped
+# snapshot stays a read-only, file-backed base that the OS pages in on demand
+# and shares between worker processes. Rows appended afterwards go to a small
+# overlay of typed arrays; row positions run on from the base into the overlay.
+class ColumnarHistory:
+    __slots__ = ('last_row_id', 'dumper_names', 'position_names', '_dumper_codes', '_position_codes',
+                 '_base', '_base_rows', 'dumper_code', 'position_code', 'ts', 'tkph_final',
+                 'suitable_tkph', '_series', '_unsorted', '_lock')
+
+    def __init__(self):
+        self.last_row_id = 0
+        self.dumper_names = []
+        self.position_names = []
+        self._dumper_codes = {}
+        self._position_codes = {}
+        # Bulk-loaded columns (NumPy arrays, possibly memory-mapped) and their length
+        self._base = None
+        self._base_rows = 0
+        # Overlay: rows appended after the base
+        self.dumper_code = array('i')
+        self.position_code = array('i')
+        self.ts = array('q')
+        self.tkph_final = array('d')
+        self.suitable_tkph = array('d')
+        self._series = {}
+        self._unsorted = set()
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return self._base_rows + len(self.ts)
+
+    def _intern(self, value, codes, names):
+        code = codes.get(value)
+        if code is None:
+            code = codes[value] = len(names)
+            names.append(value)
+        return code
+
+    def _ts_at(self, row):
+        if row < self._base_rows:
+            return int(self._base['ts'][row])
+        return self.ts[row - self._base_rows]
+
+    def append(self, ts, dumper_id, tyre_position, tkph_final, suitable_tkph):
+        dumper_id, tyre_position = series_key(dumper_id, tyre_position)
+        with self._lock:
+            dumper = self._intern(dumper_id, self._dumper_codes, self.dumper_names)
+            position = self._intern(tyre_position, self._position_codes, self.position_names)
+            row = len(self)
+            self.dumper_code.append(dumper)
+            self.position_code.append(position)
+            self.ts.append(int(ts))
+            self.tkph_final.append(tkph_final)
+            self.suitable_tkph.append(suitable_tkph)
+
+            rows = self._series.get((dumper, position))
+            if rows is None:
+                rows = self._series[(dumper, position)] = array('q')
+            elif self._ts_at(rows[-1]) > ts:
+                self._unsorted.add((dumper, position))
+            rows.append(row)
+
+    # Fold in rows stored since the last sync (by this or any other worker)
+    def sync(self, store):
+        with self._lock:
+            for row_id, ts, dumper_id, tyre_position, tkph_final, suitable_tkph in \
+                    store.iter_rows_after(self.last_row_id):
+                self.append(ts, dumper_id, tyre_position, tkph_final, suitable_tkph)
+                self.last_row_id = row_id
+
+    # Copies of the columns (base and overlay) as NumPy arrays, plus the
+    # interned names and the store row id they are current to
+    def columns(self):
+        with self._lock:
+            columns = {}
+            for name in COLUMN_NAMES:
+                overlay = np.array(getattr(self, name))
+                columns[name] = overlay if self._base is None else \
+                    np.concatenate([self._base[name], overlay])
+            return columns, list(self.dumper_names), list(self.position_names), self.last_row_id
+
+    # Replace the contents with whole columns at once (arrays of equal length,
+    # in store row order). Arrays of the right dtype, such as a mapped
+    # snapshot's, become the base as they are, without a copy; the per-tyre
+    # index is built with a single stable sort instead of row-by-row appends.
+    def load_columns(self, columns, dumper_names, position_names, last_row_id):
+        base = {name: np.asarray(columns[name], dtype=getattr(self, name).typecode)
+                for name in COLUMN_NAMES}
+        if len({len(column) for column in base.values()}) > 1:
+            raise ValueError("All history columns must have the same length.")
+        # Older snapshots may name the readings without ids both None and ''
+        dumper_names, remap = _merge_unnamed(dumper_names)
+        if remap is not None:
+            base['dumper_code'] = remap[base['dumper_code']]
+        position_names, remap = _merge_unnamed(position_names)
+        if remap is not None:
+            base['position_code'] = remap[base['position_code']]
+
+        keys = base['dumper_code'].astype(np.int64) * max(len(position_names), 1) + \
+            base['position_code']
+        order = np.lexsort((base['ts'], keys))
+        bounds = np.flatnonzero(np.diff(keys[order])) + 1
+        series = {}
+        for rows in np.split(order, bounds) if len(order) else ():
+            key = divmod(int(keys[rows[0]]), max(len(position_names), 1))
+            series[key] = array('q', rows.astype(np.int64).tobytes())
+
+        with self._lock:
+            self._base = base
+            self._base_rows = len(base['ts'])
+            for name in COLUMN_NAMES:
+                setattr(self, name, array(getattr(self, name).typecode))
+            self.dumper_names = list(dumper_names)
+            self.position_names = list(position_names)
+            self._dumper_codes = {name: code for code, name in enumerate(self.dumper_names)}
+            self._position_codes = {name: code for code, name in enumerate(self.position_names)}
+            self._series = series
+            self._unsorted = set()
+            self.last_row_id = last_row_id
+
+    # (ts, tkph_final, suitable_tkph) of the given rows, in that order
+    def _gather(self, rows):
+        if not self._base_rows:
+            return [(self.ts[row], self.tkph_final[row], self.suitable_tkph[row]) for row in rows]
+        rows = np.frombuffer(rows, dtype=np.int64)
+        in_base = rows < self._base_rows
+        gathered = []
+        for name in ('ts', 'tkph_final', 'suitable_tkph'):
+            base = self._base[name]
+            values = np.empty(len(rows), dtype=base.dtype)
+            values[in_base] = base[rows[in_base]]
+            if not in_base.all():
+                overlay = np.frombuffer(getattr(self, name), dtype=base.dtype)
+                values[~in_base] = overlay[rows[~in_base] - self._base_rows]
+                del overlay  # release the buffer view so the overlay can grow again
+            gathered.append(values.tolist())
+        return list(zip(*gathered))
+
+    def _rows(self, dumper_id, tyre_position):
+        dumper_id, tyre_position = series_key(dumper_id, tyre_position)
+        dumper = self._dumper_codes.get(dumper_id)
+        position = self._position_codes.get(tyre_position)
+        key = (dumper, position)
+        rows = self._series.get(key)
+        if rows is None:
+            return None
+        if key in self._unsorted:
+            # A reading arrived out of time order; restore order once, stably
+            rows = self._series[key] = array('q', sorted(rows, key=self._ts_at))
+            self._unsorted.discard(key)
+        return rows
+
+    # Time-sorted (ts, tkph_final, suitable_tkph) for one tyre, optionally
+    # limited to start <= ts <= end (epoch seconds); same shape as the store
+    def query_series(self, dumper_id, tyre_position, start=None, end=None):
+        with self._lock:
+            rows = self._rows(dumper_id, tyre_position)
+            if rows is None:
+                return []
+            low = 0 if start is None else bisect_left(rows, start, key=self._ts_at)
+            high = len(rows) if end is None else bisect_right(rows, end, key=self._ts_at)
+            return self._gather(rows[low:high])
+
+    def last_n(self, dumper_id, tyre_position, n):
+        with self._lock:
+            rows = self._rows(dumper_id, tyre_position)
+            if rows is None or n <= 0:
+                return []
+            return self._gather(rows[-n:])
+
+    def series_keys(self):
+        with self._lock:
+            return [(self.dumper_names[d], self.position_names[p]) for d, p in self._series]
+
+    # Approximate bytes held by the columns and series indexes; a mapped base
+    # is counted in full although only the pages read are resident
+    def memory_bytes(self):
+        with self._lock:
+            columns = (self.dumper_code, self.position_code, self.ts, self.tkph_final, self.suitable_tkph)
+            base = sum(column.nbytes for column in self._base.values()) if self._base else 0
+            return base + sum(column.itemsize * len(column) for column in columns) + \
+                sum(rows.itemsize * len(rows) for rows in self._series.values())
+
+
+# Names with None spelled '' (see tkph.store.series_key), and an array mapping
+# old codes to new ones when that made two names one (else None)
+def _merge_unnamed(names):
+    codes = {}
+    remap = [codes.setdefault('' if name is None else name, len(codes)) for name in names]
+    if len(codes) == len(remap):
+        return list(codes), None
+    return list(codes), np.asarray(remap, dtype=np.int32)
@@ -0,0 +1,71 @@
+from tkph.outliers import filter_outliers, robust_mean
+from tkph.rules import (TERRAIN_FACTORS, WEAR_BANDS, CRITICAL_WEAR_FACTOR, CONDITION_BANDS,
+                        CRITICAL_CONDITION, get_rules)
+
+# The TKPH formulas shared by the web app, the CLI and the batch engine.
+# Only the standard library and numpy (through tkph.outliers) are imported
+# here; pandas, openpyxl and matplotlib stay out of this path. Terrain, wear
+# and condition rules come from tkph.rules: the configured site's current
+# table unless a RuleTable is passed in.
+
+# Speed influence used by the original CLI formula (pp.py / calculator.py)
+SPEED_FACTOR = 0.1
+
+# Function to evaluate TKPH conditions
+def evaluate_conditions(tkph_final, suitable_tkph, rules=None):
+    return (rules or get_rules()).evaluate_conditions(tkph_final, suitable_tkph)
+
+# Tire wear damage adjustment factors
+def get_tire_damage_factor(wear_percentage, rules=None):
+    return (rules or get_rules()).tire_damage_factor(wear_percentage)
+
+# Function to remove outliers using the Interquartile Range (IQR) method
+def remove_outliers(data):
+    return filter_outliers(data, 'iqr').tolist()
+
+# Function to calculate mean tire load
+def calculate_mean_tyre_load(tyre_load_empty, tyre_load_fully_loaded):
+    return (tyre_load_empty + tyre_load_fully_loaded) / 2
+
+# Function to calculate average speed
+def calculate_average_speed(round_trip_distances, cycles_per_shift, total_shift_hours):
+    # Mean of round trip distances after removing outliers (IQR method)
+    mean_distance = robust_mean(round_trip_distances, 'iqr')
+
+    # Calculate average speed
+    average_speed = (mean_distance * cycles_per_shift) / total_shift_hours
+    return average_speed
+
+# Function to calculate TKPH. With speed_adjusted=True both values are scaled
+# by (1 + average_speed * SPEED_FACTOR), as the original CLI formula does.
+def calculate_tkph(distance_loaded, cycle_time, terrain_type, tire_wear_percentage,
+                   tyre_load_empty, tyre_load_fully_loaded, round_trip_distances,
+                   cycles_per_shift, total_shift_hours, speed_adjusted=False, rules=None):
+    rules = rules or get_rules()
+
+    # Calculate mean tire load
+    mean_tyre_load = calculate_mean_tyre_load(tyre_load_empty, tyre_load_fully_loaded)
+
+    # Calculate average speed
+    average_speed = calculate_average_speed(round_trip_distances, cycles_per_shift, total_shift_hours)
+
+    # Terrain and wear adjustments
+    terrain_factor = rules.terrain_factor(terrain_type)
+    tire_damage_factor = rules.tire_damage_factor(min(tire_wear_percentage, 100))  # Cap wear percentage at 100
+
+    # Base TKPH
+    tkph_base = (mean_tyre_load * distance_loaded) / cycle_time
+
+    # Adjust for terrain and wear
+    tkph_adjusted = tkph_base * terrain_factor * tire_damage_factor
+
+    # Final TKPH and suitable TKPH (base calculation without terrain and wear adjustments)
+    tkph_final = tkph_adjusted
+    suitable_tkph = tkph_base
+
+    if speed_adjusted:
+        speed_multiplier = 1 + (average_speed * SPEED_FACTOR)
+        tkph_final = tkph_final * speed_multiplier
+        suitable_tkph = suitable_tkph * speed_multiplier
+
+    return tkph_final, suitable_tkph
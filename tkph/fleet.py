@@ -0,0 +1,46 @@
+from tkph.batch import evaluate_conditions_batch
+from tkph.core import CONDITION_BANDS, CRITICAL_CONDITION
+
+# Condition statuses from best to worst
+CONDITION_ORDER = [status for _, status in CONDITION_BANDS] + [CRITICAL_CONDITION]
+# Positions offered by the tyre selection page, shown first and in this order
+TYRE_POSITIONS = ['front-left', 'front-right', 'rear-left', 'rear-right']
+
+
+# Current condition of every tyre in the fleet, from the store's latest
+# readings (one per tyre): statuses are evaluated in one vectorised pass
+# (under `rules`, default the configured site's current rules).
+# Returns {'positions', 'dumpers': [{'dumper_id', 'worst', 'tyres': {position:
+# {...}}}], 'counts': {status: n}}, with the dumpers in most urgent order.
+def fleet_status(latest_readings, rules=None):
+    if not latest_readings:
+        return {'positions': list(TYRE_POSITIONS), 'dumpers': [],
+                'counts': {status: 0 for status in CONDITION_ORDER}}
+
+    dumper_ids, tyre_positions, timestamps, tkph_final, suitable_tkph = zip(*latest_readings)
+    statuses = evaluate_conditions_batch(tkph_final, suitable_tkph, rules).tolist()
+    severity = {status: rank for rank, status in enumerate(CONDITION_ORDER)}
+
+    dumpers = {}
+    counts = {status: 0 for status in CONDITION_ORDER}
+    for dumper_id, tyre_position, ts, final, suitable, status in zip(
+            dumper_ids, tyre_positions, timestamps, tkph_final, suitable_tkph, statuses):
+        counts[status] += 1
+        dumper = dumpers.get(dumper_id)
+        if dumper is None:
+            dumper = dumpers[dumper_id] = {'dumper_id': dumper_id, 'worst': status, 'tyres': {}}
+        elif severity[status] > severity[dumper['worst']]:
+            dumper['worst'] = status
+        dumper['tyres'][tyre_position] = {
+            'ts': ts,
+            'tkph_final': final,
+            'suitable_tkph': suitable,
+            'ratio': final / suitable if suitable else None,
+            'condition_status': status,
+        }
+
+    extra = sorted({position for position in tyre_positions if position not in TYRE_POSITIONS},
+                   key=str)
+    ordered = sorted(dumpers.values(),
+                     key=lambda dumper: (-severity[dumper['worst']], str(dumper['dumper_id'])))
+    return {'positions': TYRE_POSITIONS + extra, 'dumpers': ordered, 'counts': counts}
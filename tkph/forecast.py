@@ -0,0 +1,222 @@
+import argparse
+import json
+import sys
+import threading
+
+import numpy as np
+
+from tkph.batch import evaluate_conditions_batch
+from tkph.rules import CONDITION_BANDS, CRITICAL_CONDITION, get_rules
+
+# Tyre life forecasting. Each tyre's condition ratio (tkph_final / suitable_tkph,
+# the quantity evaluate_conditions bands) is tracked as a straight line over
+# time by recursive least squares: every new reading updates the fit in O(1),
+# nothing is refitted over the history. The ratio is the product of the
+# terrain and wear factors, so its downward drift is the wear progression.
+# Extrapolating the line to the band edges tells when a tyre will enter the
+# Danger and Critical bands.
+
+DANGER_CONDITION = CONDITION_BANDS[-1][1]
+
+# Forgetting factor: older readings weigh less, about 1 / (1 - λ) readings count
+FORGETTING_FACTOR = 0.98
+# Initial parameter covariance (large = first readings dominate the fit)
+INITIAL_COVARIANCE = 1e3
+# Readings needed before a tyre's slope is trusted for a forecast
+MIN_READINGS = 3
+
+SECONDS_PER_DAY = 86400.0
+
+
+# Recursive least squares fit of ratio = level + slope * days, with time
+# measured in days from the tyre's first reading. The 2x2 covariance is kept
+# as its three distinct entries.
+class TyreForecast:
+    __slots__ = ('origin', 'level', 'slope', 'p00', 'p01', 'p11', 'count',
+                 'last_ts', 'last_tkph_final', 'last_suitable_tkph')
+
+    def __init__(self):
+        self.origin = None
+        self.level = 0.0
+        self.slope = 0.0
+        self.p00 = self.p11 = INITIAL_COVARIANCE
+        self.p01 = 0.0
+        self.count = 0
+        self.last_ts = None
+        self.last_tkph_final = None
+        self.last_suitable_tkph = None
+
+    def update(self, ts, tkph_final, suitable_tkph):
+        if not suitable_tkph:
+            return
+        if self.origin is None:
+            self.origin = ts
+        t = (ts - self.origin) / SECONDS_PER_DAY
+        ratio = tkph_final / suitable_tkph
+
+        # Gain k = P x / (λ + xᵀ P x) with x = (1, t)
+        px0 = self.p00 + self.p01 * t
+        px1 = self.p01 + self.p11 * t
+        denominator = FORGETTING_FACTOR + px0 + t * px1
+        k0 = px0 / denominator
+        k1 = px1 / denominator
+
+        error = ratio - (self.level + self.slope * t)
+        self.level += k0 * error
+        self.slope += k1 * error
+        # P = (P - k xᵀ P) / λ
+        self.p00 = (self.p00 - k0 * px0) / FORGETTING_FACTOR
+        self.p01 = (self.p01 - k0 * px1) / FORGETTING_FACTOR
+        self.p11 = (self.p11 - k1 * px1) / FORGETTING_FACTOR
+
+        self.count += 1
+        if self.last_ts is None or ts >= self.last_ts:
+            self.last_ts = ts
+            self.last_tkph_final = tkph_final
+            self.last_suitable_tkph = suitable_tkph
+
+
+# Per-(dumper, tyre) TyreForecast for the whole fleet, caught up from the
+# store the same way as RollingStats: sync() folds in only the rows stored
+# since the last call.
+class FleetForecast:
+    def __init__(self):
+        self.last_row_id = 0
+        self._models = {}
+        self._lock = threading.Lock()
+
+    def update(self, dumper_id, tyre_position, ts, tkph_final, suitable_tkph):
+        key = (dumper_id, tyre_position)
+        model = self._models.get(key)
+        if model is None:
+            model = self._models[key] = TyreForecast()
+        model.update(ts, tkph_final, suitable_tkph)
+
+    def sync(self, store):
+        with self._lock:
+            for row_id, ts, dumper_id, tyre_position, tkph_final, suitable_tkph in \
+                    store.iter_rows_after(self.last_row_id):
+                self.update(dumper_id, tyre_position, ts, tkph_final, suitable_tkph)
+                self.last_row_id = row_id
+
+    def get(self, dumper_id, tyre_position):
+        return self._models.get((dumper_id, tyre_position))
+
+    # Forecast for one tyre, in the same form as the at_risk() entries
+    def forecast(self, dumper_id, tyre_position, rules=None):
+        model = self.get(dumper_id, tyre_position)
+        if model is None or not model.count:
+            return None
+        return rank_at_risk([(dumper_id, tyre_position, model)], limit=None, at_risk_only=False,
+                            rules=rules)[0]
+
+    def at_risk(self, limit=20, horizon_days=None, rules=None):
+        with self._lock:
+            models = [(d, t, model) for (d, t), model in self._models.items() if model.count]
+        return rank_at_risk(models, limit=limit, horizon_days=horizon_days, rules=rules)
+
+
+# Days from the latest reading until the fitted ratio falls below `threshold`:
+# 0 when the tyre is already below it, inf when its ratio is not falling
+def days_until(threshold, last_ratio, level, slope, trusted):
+    falling = trusted & (slope < 0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        days = np.where(falling, np.maximum((threshold - level) / slope, 0.0), np.inf)
+    return np.where(last_ratio < threshold, 0.0, days)
+
+# Ratio below which a tyre enters each band worse than Normal
+def entry_ratios(rules):
+    bands = rules.condition_bands
+    return {status: ratio for (ratio, _), (_, status) in
+            zip(bands, bands[1:] + [(None, CRITICAL_CONDITION)])}
+
+# Fleet-wide "next tyres at risk" from (dumper_id, tyre_position, TyreForecast)
+# triples, computed in one vectorised pass over the fitted parameters. Tyres
+# are ordered by the time left until they enter the Danger band, then the
+# Critical band, as set by `rules` (default: the configured site's current
+# rules); only those already there or heading there (within horizon_days, if
+# given) are returned unless at_risk_only is false.
+def rank_at_risk(models, limit=20, horizon_days=None, at_risk_only=True, rules=None):
+    if not models:
+        return []
+    rules = rules or get_rules()
+    thresholds = entry_ratios(rules)
+    count = len(models)
+    fields = np.array([(m.origin, m.level, m.slope, m.count, m.last_ts, m.last_tkph_final,
+                        m.last_suitable_tkph) for _, _, m in models], dtype=np.float64).reshape(count, 7)
+    origin, level, slope, readings, last_ts, last_final, last_suitable = fields.T
+
+    level = level + slope * (last_ts - origin) / SECONDS_PER_DAY
+    last_ratio = last_final / last_suitable
+    trusted = readings >= MIN_READINGS
+    slope = np.where(trusted, slope, 0.0)
+    to_danger = days_until(thresholds[DANGER_CONDITION], last_ratio, level, slope, trusted)
+    to_critical = days_until(thresholds[CRITICAL_CONDITION], last_ratio, level, slope, trusted)
+    statuses = evaluate_conditions_batch(last_final, last_suitable, rules).tolist()
+
+    selected = np.ones(count, dtype=bool)
+    if at_risk_only:
+        selected = np.isfinite(to_danger)
+        if horizon_days is not None:
+            selected &= to_danger <= horizon_days
+    order = np.flatnonzero(selected)
+    order = order[np.lexsort((slope[order], to_critical[order], to_danger[order]))]
+    if limit is not None:
+        order = order[:limit]
+
+    def eta(days, i):
+        return None if not np.isfinite(days[i]) else int(last_ts[i] + days[i] * SECONDS_PER_DAY)
+
+    def finite(days, i):
+        return float(days[i]) if np.isfinite(days[i]) else None
+
+    return [{
+        'dumper_id': models[i][0],
+        'tyre_position': models[i][1],
+        'condition_status': statuses[i],
+        'readings': int(readings[i]),
+        'last_ts': int(last_ts[i]),
+        'ratio': float(last_ratio[i]),
+        'fitted_ratio': float(level[i]),
+        'slope_per_day': float(slope[i]),
+        'days_to_danger': finite(to_danger, i),
+        'days_to_critical': finite(to_critical, i),
+        'danger_eta': eta(to_danger, i),
+        'critical_eta': eta(to_critical, i),
+    } for i in order.tolist()]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Rank the tyres forecast to reach the Danger or Critical band next.')
+    parser.add_argument('--limit', type=int, default=20, help='number of tyres to list (default 20)')
+    parser.add_argument('--horizon', type=float, help='only tyres reaching Danger within this many days')
+    parser.add_argument('--json', action='store_true', help='print the ranking as JSON')
+    args = parser.parse_args(argv)
+
+    from tkph.store import format_timestamp, get_store
+
+    forecast = FleetForecast()
+    forecast.sync(get_store())
+    ranking = forecast.at_risk(limit=args.limit, horizon_days=args.horizon)
+    if args.json:
+        print(json.dumps(ranking, indent=2))
+        return 0
+
+    def days(value):
+        return '-' if value is None else f'{value:.1f}'
+
+    print(f"{'Dumper':10s} {'Tyre':18s} {'Status':18s} {'Ratio':>6s} {'/day':>8s} "
+          f"{'Danger in':>10s} {'Critical in':>12s}  Last reading")
+    # Ids come back as stored: None for readings saved without them, numbers
+    # for some imported from the legacy workbook
+    def text(value):
+        return '' if value is None else str(value)
+
+    for tyre in ranking:
+        print(f"{text(tyre['dumper_id']):10s} {text(tyre['tyre_position']):18s} {tyre['condition_status']:18s} "
+              f"{tyre['ratio']:6.3f} {tyre['slope_per_day']:8.4f} {days(tyre['days_to_danger']):>10s} "
+              f"{days(tyre['days_to_critical']):>12s}  {format_timestamp(tyre['last_ts'])}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
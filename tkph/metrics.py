@@ -0,0 +1,191 @@
+import contextvars
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+# Opt-in request instrumentation (TKPH_METRICS=1): per-stage timers, counters
+# and latency histograms, exposed in the Prometheus text format at /metrics.
+# With TKPH_PROFILE_SAMPLE set (e.g. 0.01), that fraction of requests is also
+# run under cProfile and dumped as .pstats files into TKPH_PROFILE_DIR.
+# Each app keeps its own registry (TrackingState.metrics, built from the app's
+# config), so apps in one process never switch each other's settings. Code
+# shared between apps records through `metrics` / `stage`, which go to the
+# registry of the app being served: init_app() activates it for each request
+# and the background writer for its thread. Elsewhere nothing is recorded.
+# Metrics are kept per process; with several workers, scrape each of them.
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    __slots__ = ('counts', 'sum', 'count')
+
+    def __init__(self):
+        self.counts = [0] * len(LATENCY_BUCKETS)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.sum += value
+        self.count += 1
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+
+class Metrics:
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self._counters = {}
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name, amount=1, **labels):
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted((k, str(v)) for k, v in labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def observe(self, name, value, **labels):
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted((k, str(v)) for k, v in labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(value)
+
+    # Time a block of work as tkph_stage_seconds{stage=name}
+    @contextmanager
+    def stage(self, name):
+        if not self.enabled:
+            yield
+            return
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe('tkph_stage_seconds', time.perf_counter() - started, stage=name)
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    def render_prometheus(self):
+        lines = []
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted(self._histograms.items())
+
+        seen = set()
+        for (name, labels), value in counters:
+            if name not in seen:
+                lines.append(f'# TYPE {name} counter')
+                seen.add(name)
+            lines.append(f'{name}{_labels(labels)} {value}')
+
+        for (name, labels), histogram in histograms:
+            if name not in seen:
+                lines.append(f'# TYPE {name} histogram')
+                seen.add(name)
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS, histogram.counts):
+                cumulative += count
+                lines.append(f'{name}_bucket{_labels(labels + (("le", repr(bound)),))} {cumulative}')
+            lines.append(f'{name}_bucket{_labels(labels + (("le", "+Inf"),))} {histogram.count}')
+            lines.append(f'{name}_sum{_labels(labels)} {histogram.sum}')
+            lines.append(f'{name}_count{_labels(labels)} {histogram.count}')
+        return '\n'.join(lines) + '\n'
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    escaped = []
+    for key, value in labels:
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        escaped.append(f'{key}="{value}"')
+    return '{' + ','.join(escaped) + '}'
+
+
+_active = contextvars.ContextVar('tkph_metrics', default=None)
+_inactive = Metrics()
+
+# Make `registry` the one that `metrics` and `stage` record to in the current
+# thread (or context); returns the previously active one
+def activate(registry):
+    previous = _active.get()
+    _active.set(registry)
+    return previous
+
+def active_metrics():
+    return _active.get() or _inactive
+
+# Stands for the active registry wherever code records without knowing its app
+class _ActiveMetrics:
+    def __getattr__(self, name):
+        return getattr(active_metrics(), name)
+
+metrics = _ActiveMetrics()
+
+def stage(name):
+    return active_metrics().stage(name)
+
+DEFAULT_PROFILE_DIR = 'profiles'
+
+
+# Hook request timing, counters, sampled profiling and the /metrics endpoint
+# into a Flask app, recording to `registry`; the profiling settings come from
+# its TKPH_PROFILE_SAMPLE and TKPH_PROFILE_DIR config
+def init_app(app, registry):
+    from flask import Response, abort, g, request
+
+    profile_sample = float(app.config.get('TKPH_PROFILE_SAMPLE') or 0)
+    profile_dir = app.config.get('TKPH_PROFILE_DIR') or DEFAULT_PROFILE_DIR
+
+    @app.before_request
+    def start_request_timer():
+        g.tkph_previous_metrics = activate(registry)
+        g.tkph_request_started = time.perf_counter()
+        if profile_sample > 0 and random.random() < profile_sample:
+            import cProfile
+            g.tkph_profiler = cProfile.Profile()
+            try:
+                g.tkph_profiler.enable()
+            except ValueError:  # another profiler is already active on this thread
+                g.tkph_profiler = None
+
+    @app.after_request
+    def record_request(response):
+        profiler = g.pop('tkph_profiler', None)
+        if profiler is not None:
+            profiler.disable()
+            os.makedirs(profile_dir, exist_ok=True)
+            endpoint = (request.endpoint or 'unknown').replace('.', '_')
+            profiler.dump_stats(os.path.join(
+                profile_dir, f'{endpoint}-{time.time_ns()}-{os.getpid()}.pstats'))
+            registry.inc('tkph_profiles_total', endpoint=request.endpoint or 'unknown')
+
+        started = g.pop('tkph_request_started', None)
+        if started is not None and request.endpoint != 'metrics_endpoint':
+            labels = {'endpoint': request.endpoint or 'unknown', 'method': request.method}
+            registry.observe('tkph_request_seconds', time.perf_counter() - started, **labels)
+            registry.inc('tkph_requests_total', status=response.status_code, **labels)
+        return response
+
+    @app.route('/metrics')
+    def metrics_endpoint():
+        if not registry.enabled:
+            abort(404)
+        return Response(registry.render_prometheus(), mimetype='text/plain; version=0.0.4')
+
+    @app.teardown_request
+    def deactivate_metrics(exc):
+        if 'tkph_previous_metrics' in g:
+            activate(g.pop('tkph_previous_metrics'))
@@ -0,0 +1,44 @@
+import numpy as np
+
+# Array-native outlier filtering for round trip distances. Every method
+# returns a boolean keep-mask over the input array; quantiles are taken in a
+# single np.quantile call (one partition pass) and nothing round-trips
+# through Python lists.
+
+# Interquartile Range (IQR) method: keep Q1 - k*IQR <= x <= Q3 + k*IQR
+def iqr_mask(values, k=1.5):
+    values = np.asarray(values, dtype=np.float64)
+    q1, q3 = np.quantile(values, [0.25, 0.75])
+    iqr = q3 - q1
+    return (values >= q1 - k * iqr) & (values <= q3 + k * iqr)
+
+# Median absolute deviation: keep values whose modified z-score is within
+# threshold. With no spread at all (MAD == 0) every value is kept.
+def mad_mask(values, threshold=3.5):
+    values = np.asarray(values, dtype=np.float64)
+    median = np.median(values)
+    deviations = np.abs(values - median)
+    mad = np.median(deviations)
+    if mad == 0:
+        return np.ones(values.shape, dtype=bool)
+    return 0.6745 * deviations / mad <= threshold
+
+# Trimming: drop the lowest and highest `proportion` of the values
+def trimmed_mask(values, proportion=0.1):
+    values = np.asarray(values, dtype=np.float64)
+    low, high = np.quantile(values, [proportion, 1 - proportion])
+    return (values >= low) & (values <= high)
+
+OUTLIER_METHODS = {
+    'iqr': iqr_mask,
+    'mad': mad_mask,
+    'trimmed': trimmed_mask,
+}
+
+def filter_outliers(values, method='iqr', **options):
+    values = np.asarray(values, dtype=np.float64)
+    return values[OUTLIER_METHODS[method](values, **options)]
+
+# Mean of the values left after outlier filtering
+def robust_mean(values, method='iqr', **options):
+    return float(np.mean(filter_outliers(values, method, **options)))
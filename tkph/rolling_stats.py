@@ -0,0 +1,153 @@
+import threading
+
+# Smoothing factor for the exponentially weighted moving average of TKPH final
+EWMA_ALPHA = 0.2
+# Quantiles of TKPH final tracked per tyre
+TRACKED_QUANTILES = (0.5, 0.9)
+
+# Streaming quantile estimate in O(1) memory (Jain & Chlamtac's P-squared
+# algorithm): five markers are nudged towards their ideal positions as
+# observations arrive; no observations are kept beyond the first five.
+class P2Quantile:
+    __slots__ = ('p', 'heights', 'positions', 'desired', 'increments')
+
+    def __init__(self, p):
+        self.p = p
+        self.heights = []
+        self.positions = [0, 1, 2, 3, 4]
+        self.desired = [0, 2 * p, 4 * p, 2 + 2 * p, 4]
+        self.increments = [0, p / 2, p, (1 + p) / 2, 1]
+
+    def add(self, x):
+        q = self.heights
+        if len(q) < 5:
+            q.append(x)
+            q.sort()
+            return
+
+        n = self.positions
+        if x < q[0]:
+            q[0] = x
+            k = 0
+        elif x >= q[4]:
+            q[4] = x
+            k = 3
+        else:
+            k = 0
+            while x >= q[k + 1]:
+                k += 1
+        for i in range(k + 1, 5):
+            n[i] += 1
+        for i in range(5):
+            self.desired[i] += self.increments[i]
+
+        for i in (1, 2, 3):
+            d = self.desired[i] - n[i]
+            if (d >= 1 and n[i + 1] - n[i] > 1) or (d <= -1 and n[i - 1] - n[i] < -1):
+                d = 1 if d > 0 else -1
+                estimate = self._parabolic(i, d)
+                if not q[i - 1] < estimate < q[i + 1]:
+                    estimate = q[i] + d * (q[i + d] - q[i]) / (n[i + d] - n[i])
+                q[i] = estimate
+                n[i] += d
+
+    def _parabolic(self, i, d):
+        q, n = self.heights, self.positions
+        return q[i] + d / (n[i + 1] - n[i - 1]) * (
+            (n[i] - n[i - 1] + d) * (q[i + 1] - q[i]) / (n[i + 1] - n[i])
+            + (n[i + 1] - n[i] - d) * (q[i] - q[i - 1]) / (n[i] - n[i - 1]))
+
+    def value(self):
+        q = self.heights
+        if not q:
+            return None
+        if len(q) < 5:
+            # Exact (linearly interpolated) quantile of the few values seen so far
+            rank = self.p * (len(q) - 1)
+            lower = int(rank)
+            upper = min(lower + 1, len(q) - 1)
+            return q[lower] + (q[upper] - q[lower]) * (rank - lower)
+        return q[2]
+
+
+# Running aggregates of one tyre's TKPH final readings: count, mean and
+# variance (Welford), EWMA, min/max and streaming quantiles
+class TyreStats:
+    __slots__ = ('count', 'mean', 'm2', 'ewma', 'min', 'max', 'last_tkph_final',
+                 'last_suitable_tkph', 'last_ts', 'quantiles')
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.ewma = None
+        self.min = None
+        self.max = None
+        self.last_tkph_final = None
+        self.last_suitable_tkph = None
+        self.last_ts = None
+        self.quantiles = [P2Quantile(p) for p in TRACKED_QUANTILES]
+
+    def update(self, tkph_final, suitable_tkph=None, ts=None):
+        self.count += 1
+        delta = tkph_final - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (tkph_final - self.mean)
+        self.ewma = tkph_final if self.ewma is None else \
+            EWMA_ALPHA * tkph_final + (1 - EWMA_ALPHA) * self.ewma
+        self.min = tkph_final if self.min is None else min(self.min, tkph_final)
+        self.max = tkph_final if self.max is None else max(self.max, tkph_final)
+        self.last_tkph_final = tkph_final
+        self.last_suitable_tkph = suitable_tkph
+        self.last_ts = ts
+        for quantile in self.quantiles:
+            quantile.add(tkph_final)
+
+    @property
+    def variance(self):
+        return self.m2 / (self.count - 1) if self.count > 1 else 0.0
+
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'mean': self.mean,
+            'variance': self.variance,
+            'std': self.variance ** 0.5,
+            'ewma': self.ewma,
+            'min': self.min,
+            'max': self.max,
+            'last_tkph_final': self.last_tkph_final,
+            'last_suitable_tkph': self.last_suitable_tkph,
+            'last_ts': self.last_ts,
+            'quantiles': {str(q.p): q.value() for q in self.quantiles},
+        }
+
+
+# Per-(dumper, tyre) TyreStats for the whole fleet. sync() folds in only the
+# rows stored since the last call (including rows written by other workers),
+# so reads never rescan the full history after the first load.
+class RollingStats:
+    def __init__(self):
+        self.last_row_id = 0
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def update(self, dumper_id, tyre_position, tkph_final, suitable_tkph=None, ts=None):
+        key = (dumper_id, tyre_position)
+        stats = self._stats.get(key)
+        if stats is None:
+            stats = self._stats[key] = TyreStats()
+        stats.update(tkph_final, suitable_tkph, ts)
+
+    def sync(self, store):
+        with self._lock:
+            for row_id, ts, dumper_id, tyre_position, tkph_final, suitable_tkph in \
+                    store.iter_rows_after(self.last_row_id):
+                self.update(dumper_id, tyre_position, tkph_final, suitable_tkph, ts)
+                self.last_row_id = row_id
+
+    def get(self, dumper_id, tyre_position):
+        return self._stats.get((dumper_id, tyre_position))
+
+    def items(self):
+        return list(self._stats.items())
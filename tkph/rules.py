@@ -0,0 +1,313 @@
+import argparse
+import bisect
+import itertools
+import json
+import os
+import sys
+import threading
+
+import numpy as np
+
+# Scoring rules: terrain factors, tyre wear bands and condition thresholds.
+# The tables below are the built-in rules (site "default", version 1). Sites
+# whose tyre OEM guidance differs describe their own versioned tables in a
+# JSON file named by TKPH_RULES_PATH; TKPH_SITE picks the site. Each table is
+# compiled once when loaded into the lookups the scalar path (dict, bisect)
+# and the batch engine (sorted name and edge arrays for searchsorted/digitize)
+# use, and every stored reading records the version that scored it.
+
+# Terrain adjustment factors (based on terrain type)
+TERRAIN_FACTORS = {
+    "Flat": 1.0,
+    "Inclined": 0.9,
+    "Rocky": 0.8,
+    "Muddy": 0.7
+}
+# Factor for terrain types a table does not list
+DEFAULT_TERRAIN_FACTOR = 1.0
+
+# Tire wear bands as (upper wear percentage, factor), upper bounds inclusive
+WEAR_BANDS = [
+    (10, 1.0),   # Minimal Wear
+    (25, 0.95),  # Light Wear
+    (50, 0.85),  # Moderate Wear
+    (75, 0.7),   # Severe Wear
+]
+CRITICAL_WEAR_FACTOR = 0.5  # 75 < wear_percentage <= 100
+
+# Condition bands as (minimum share of suitable TKPH, status), checked in order
+CONDITION_BANDS = [
+    (0.90, "Normal Condition"),
+    (0.80, "Warning Condition"),
+    (0.70, "Danger Condition"),
+]
+CRITICAL_CONDITION = "Critical Condition"
+
+DEFAULT_SITE = 'default'
+DEFAULT_VERSION = 1
+
+
+# One version of one site's rules, compiled for lookups. Identified in the
+# store by its key, "site@version".
+class RuleTable:
+    def __init__(self, site=DEFAULT_SITE, version=DEFAULT_VERSION, terrain_factors=None,
+                 wear_bands=None, critical_wear_factor=None, condition_ratios=None):
+        self.site = str(site)
+        self.version = int(version)
+        self.key = f'{self.site}@{self.version}'
+
+        self.terrain_factors_by_name = dict(TERRAIN_FACTORS if terrain_factors is None
+                                            else {str(k): float(v) for k, v in terrain_factors.items()})
+        wear_bands = WEAR_BANDS if wear_bands is None else [(float(u), float(f)) for u, f in wear_bands]
+        self.wear_bands = list(wear_bands)
+        self.critical_wear_factor = float(CRITICAL_WEAR_FACTOR if critical_wear_factor is None
+                                          else critical_wear_factor)
+        ratios = dict((status, ratio) for ratio, status in CONDITION_BANDS)
+        if condition_ratios is not None:
+            unknown = set(condition_ratios) - set(ratios)
+            if unknown:
+                raise ValueError(f"{self.key}: unknown condition status {sorted(unknown)[0]!r}; "
+                                 f"expected one of {', '.join(ratios)}")
+            ratios.update((status, float(ratio)) for status, ratio in condition_ratios.items())
+        self.condition_bands = [(ratios[status], status) for _, status in CONDITION_BANDS]
+
+        edges = [upper for upper, _ in self.wear_bands]
+        if not edges or any(a >= b for a, b in zip(edges, edges[1:])):
+            raise ValueError(f"{self.key}: wear band upper bounds must be increasing")
+        condition_ratios = [ratio for ratio, _ in self.condition_bands]
+        if any(a <= b for a, b in zip(condition_ratios, condition_ratios[1:])):
+            raise ValueError(f"{self.key}: condition ratios must decrease from Normal to Danger")
+
+        # Scalar lookups: bisect over the band edges
+        self.wear_edges = tuple(edges)
+        self.wear_factors = tuple(factor for _, factor in self.wear_bands) + (self.critical_wear_factor,)
+
+        # Batch lookups: terrain names as sorted codes (code -1 = unknown
+        # terrain, the last entry of terrain_code_factors) and right-closed
+        # wear bands (-inf, e0], (e0, e1], ... (en, inf) for np.digitize
+        self.terrain_names = np.array(sorted(self.terrain_factors_by_name))
+        self.terrain_code_factors = np.array(
+            [self.terrain_factors_by_name[name] for name in self.terrain_names] + [DEFAULT_TERRAIN_FACTOR])
+        self.wear_band_edges = np.array(self.wear_edges)
+        self.wear_band_factors = np.array(self.wear_factors)
+        self.condition_ratios = condition_ratios
+
+    def __repr__(self):
+        return f'<RuleTable {self.key}>'
+
+    def terrain_factor(self, terrain_type):
+        return self.terrain_factors_by_name.get(terrain_type, DEFAULT_TERRAIN_FACTOR)
+
+    def tire_damage_factor(self, wear_percentage):
+        if not wear_percentage <= self.wear_edges[-1]:
+            return self.critical_wear_factor
+        return self.wear_factors[bisect.bisect_left(self.wear_edges, wear_percentage)]
+
+    def evaluate_conditions(self, tkph_final, suitable_tkph):
+        for ratio, status in self.condition_bands:
+            if tkph_final >= suitable_tkph * ratio:
+                return status
+        return CRITICAL_CONDITION
+
+    # Map terrain names to int8 codes, -1 for anything not in terrain_names
+    def encode_terrain(self, terrain_type):
+        values = np.asarray(terrain_type).astype(str)
+        codes = np.searchsorted(self.terrain_names, values)
+        codes = np.minimum(codes, len(self.terrain_names) - 1)
+        return np.where(self.terrain_names[codes] == values, codes, -1).astype(np.int8)
+
+    def terrain_factor_array(self, terrain_type):
+        return self.terrain_code_factors[self.encode_terrain(terrain_type)]
+
+    def tire_damage_factor_array(self, wear_percentage):
+        wear = np.minimum(np.asarray(wear_percentage, dtype=np.float64), 100)
+        return self.wear_band_factors[np.digitize(wear, self.wear_band_edges, right=True)]
+
+    # Condition as an index into the statuses, Normal first (0) to Critical
+    def condition_codes(self, tkph_final, suitable_tkph):
+        tkph_final = np.asarray(tkph_final, dtype=np.float64)
+        suitable_tkph = np.asarray(suitable_tkph, dtype=np.float64)
+        conditions = [tkph_final >= suitable_tkph * ratio for ratio in self.condition_ratios]
+        return np.select(conditions, range(len(conditions)), default=len(conditions)).astype(np.int8)
+
+    def to_dict(self):
+        return {
+            'site': self.site,
+            'version': self.version,
+            'key': self.key,
+            'terrain_factors': dict(self.terrain_factors_by_name),
+            'wear_bands': [list(band) for band in self.wear_bands],
+            'critical_wear_factor': self.critical_wear_factor,
+            'condition_ratios': {status: ratio for ratio, status in self.condition_bands},
+        }
+
+
+DEFAULT_RULES = RuleTable()
+# Fields of one rule table in a rules file
+RULE_FIELDS = {'version', 'terrain_factors', 'wear_bands', 'critical_wear_factor', 'condition_ratios'}
+
+
+# Every site's rule versions from one rules file:
+#
+#   {"sites": {"north-pit": [
+#       {"version": 1, "terrain_factors": {"Flat": 1.0, "Rocky": 0.75, ...},
+#        "wear_bands": [[10, 1.0], [30, 0.9], [60, 0.8], [80, 0.65]],
+#        "critical_wear_factor": 0.45,
+#        "condition_ratios": {"Normal Condition": 0.92, ...}},
+#       {"version": 2, ...}]}}
+#
+# Fields left out fall back to the built-in rules. A site's newest version
+# scores new readings; older ones are kept to re-score what they scored.
+class RuleBook:
+    def __init__(self, tables=()):
+        self._tables = {DEFAULT_RULES.key: DEFAULT_RULES}
+        for table in tables:
+            if table.key in self._tables and table.key != DEFAULT_RULES.key:
+                raise ValueError(f"Rule version {table.key} is defined twice")
+            self._tables[table.key] = table
+        self._current = {}
+        for table in self._tables.values():
+            if table.version >= self._current.get(table.site, table).version:
+                self._current[table.site] = table
+
+    @classmethod
+    def from_file(cls, path):
+        with open(path) as handle:
+            config = json.load(handle)
+        tables = []
+        for site, versions in config.get('sites', {}).items():
+            for entry in versions:
+                if 'version' not in entry:
+                    raise ValueError(f"A rule table for site {site!r} has no version")
+                unknown = set(entry) - RULE_FIELDS
+                if unknown:
+                    raise ValueError(f"Unknown field {sorted(unknown)[0]!r} in the rules for site {site!r}")
+                tables.append(RuleTable(site=site, **entry))
+        return cls(tables)
+
+    def sites(self):
+        return sorted({table.site for table in self._tables.values()})
+
+    def versions(self, site):
+        return sorted((table for table in self._tables.values() if table.site == site),
+                      key=lambda table: table.version)
+
+    # The newest version for a site
+    def current(self, site=None):
+        table = self._current.get(site or DEFAULT_SITE)
+        if table is None:
+            raise ValueError(f"No scoring rules for site {site!r}")
+        return table
+
+    # A table by its key ("site@version")
+    def get(self, key):
+        table = self._tables.get(key)
+        if table is None:
+            raise ValueError(f"Unknown rule version {key!r}")
+        return table
+
+
+_rule_books = {}
+_rule_books_lock = threading.Lock()
+
+# The rule tables in TKPH_RULES_PATH (or `path`), loaded and compiled once per
+# process. Without a rules file only the built-in rules exist.
+def get_rule_book(path=None):
+    path = path or os.environ.get('TKPH_RULES_PATH') or None
+    book = _rule_books.get(path)
+    if book is None:
+        with _rule_books_lock:
+            book = _rule_books.get(path)
+            if book is None:
+                book = _rule_books[path] = RuleBook.from_file(path) if path else RuleBook()
+    return book
+
+# The rules new readings are scored with: the newest version for TKPH_SITE
+# (or `site`) in the configured rules file
+def get_rules(site=None, path=None):
+    return get_rule_book(path).current(site or os.environ.get('TKPH_SITE'))
+
+
+# Condition changes if every stored reading were scored with `target`
+# (default: the current rules), read from the store in chunks. Readings that
+# recorded their terrain and wear are re-scored in full; older ones only have
+# their condition re-evaluated. Nothing is written.
+def rescore_report(store, target=None, book=None, chunksize=100000):
+    from tkph.batch import CONDITION_STATUSES, rescore_stored
+
+    book = book or get_rule_book()
+    target = target or get_rules()
+    statuses = CONDITION_STATUSES.tolist()
+    transitions = np.zeros((len(statuses), len(statuses)), dtype=np.int64)
+    versions = {}
+    rows = store.iter_scored_rows()
+    while True:
+        chunk = list(itertools.islice(rows, chunksize))
+        if not chunk:
+            break
+        _, _, _, _, tkph_final, suitable_tkph, terrain_type, wear, rule_version, _ = zip(*chunk)
+        tkph_final = np.array(tkph_final, dtype=np.float64)
+        suitable_tkph = np.array(suitable_tkph, dtype=np.float64)
+        rule_version = np.array(rule_version, dtype=object)
+
+        before = np.empty(len(chunk), dtype=np.int8)
+        for key in set(rule_version.tolist()):
+            rows_scored = rule_version == key
+            versions[key] = versions.get(key, 0) + int(rows_scored.sum())
+            table = book.get(key) if key is not None else DEFAULT_RULES
+            before[rows_scored] = table.condition_codes(tkph_final[rows_scored], suitable_tkph[rows_scored])
+
+        known = np.array([t is not None and w is not None for t, w in zip(terrain_type, wear)])
+        after = target.condition_codes(tkph_final, suitable_tkph)
+        if known.any():
+            _, after[known] = rescore_stored(suitable_tkph[known],
+                                             np.array(terrain_type, dtype=object)[known].astype(str),
+                                             np.array(wear, dtype=object)[known].astype(np.float64),
+                                             target)
+        np.add.at(transitions, (before, after), 1)
+
+    return {
+        'target': target.key,
+        'readings': int(transitions.sum()),
+        'by_rule_version': {str(key): n for key, n in versions.items()},
+        'changed': int(transitions.sum() - np.trace(transitions)),
+        'transitions': {f'{statuses[i]} -> {statuses[j]}': int(transitions[i, j])
+                        for i in range(len(statuses)) for j in range(len(statuses))
+                        if i != j and transitions[i, j]},
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Inspect the configured TKPH scoring rules.')
+    parser.add_argument('--rules', help='rules file (default: TKPH_RULES_PATH)')
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('list', help='list every site and rule version')
+    show = commands.add_parser('show', help='print one rule table as JSON')
+    show.add_argument('key', nargs='?', help='site@version (default: the current rules)')
+    rescore = commands.add_parser('rescore', help='report how stored conditions would change '
+                                                  'under other rules (dry run)')
+    rescore.add_argument('key', nargs='?', help='site@version (default: the current rules)')
+    args = parser.parse_args(argv)
+
+    try:
+        book = get_rule_book(args.rules)
+        if args.command == 'list':
+            current = get_rules(path=args.rules).key
+            for site in book.sites():
+                for table in book.versions(site):
+                    print(table.key + ('  (current)' if table.key == current else ''))
+            return 0
+        table = book.get(args.key) if args.key else get_rules(path=args.rules)
+        if args.command == 'show':
+            print(json.dumps(table.to_dict(), indent=2))
+        else:
+            from tkph.store import get_store
+
+            print(json.dumps(rescore_report(get_store(), table, book), indent=2))
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,191 @@
+import argparse
+import json
+import os
+import sys
+
+import numpy as np
+
+from tkph.columnar import COLUMN_NAMES, ColumnarHistory
+from tkph.store import read_tracking_workbook, series_key, write_tracking_workbook
+
+# Binary snapshot of the tracking history: one .npy file per column (int64
+# epoch timestamps, int32 dumper / tyre position codes, float64 TKPH values)
+# plus manifest.json holding the code -> name tables and the store row id the
+# snapshot is current to. np.load(mmap_mode='r') maps the columns without
+# parsing anything, so opening a snapshot of millions of readings takes
+# milliseconds where reading the .xlsx takes minutes.
+#
+#   python -m tkph.snapshot from-store snapshot/         # configured store
+#   python -m tkph.snapshot from-xlsx tkph_tracking.xlsx snapshot/
+#   python -m tkph.snapshot to-xlsx snapshot/ tkph_tracking.xlsx
+#   python -m tkph.snapshot info snapshot/
+#
+# Every write uses fresh column file names and replaces the manifest last, so
+# readers never see a half-written snapshot and existing maps stay valid.
+
+SNAPSHOT_FORMAT = 'tkph-snapshot'
+SNAPSHOT_VERSION = 1
+MANIFEST_NAME = 'manifest.json'
+
+
+class Snapshot:
+    def __init__(self, columns, dumper_names, position_names, last_row_id):
+        self.columns = columns
+        self.dumper_names = dumper_names
+        self.position_names = position_names
+        self.last_row_id = last_row_id
+
+    def __len__(self):
+        return len(self.columns['ts'])
+
+    # Rows as (ts, dumper_id, tyre_position, tkph_final, suitable_tkph), the store's layout
+    def iter_rows(self, batch_size=10000):
+        dumper_names = np.asarray(self.dumper_names, dtype=object)
+        position_names = np.asarray(self.position_names, dtype=object)
+        for start in range(0, len(self), batch_size):
+            chunk = slice(start, start + batch_size)
+            yield from zip(self.columns['ts'][chunk].tolist(),
+                           dumper_names[self.columns['dumper_code'][chunk]].tolist(),
+                           position_names[self.columns['position_code'][chunk]].tolist(),
+                           self.columns['tkph_final'][chunk].tolist(),
+                           self.columns['suitable_tkph'][chunk].tolist())
+
+    def last_row(self):
+        if not len(self):
+            return None
+        columns = {name: column[-1].item() for name, column in self.columns.items()}
+        return (columns['ts'], self.dumper_names[columns['dumper_code']],
+                self.position_names[columns['position_code']],
+                columns['tkph_final'], columns['suitable_tkph'])
+
+    # A ColumnarHistory holding the snapshot, ready to be caught up with sync()
+    def to_history(self):
+        history = ColumnarHistory()
+        history.load_columns(self.columns, self.dumper_names, self.position_names, self.last_row_id)
+        return history
+
+
+def write_snapshot(history, directory):
+    columns, dumper_names, position_names, last_row_id = history.columns()
+    os.makedirs(directory, exist_ok=True)
+    previous = _read_manifest(directory) if os.path.exists(os.path.join(directory, MANIFEST_NAME)) \
+        else None
+    generation = previous['generation'] + 1 if previous else 1
+
+    files = {}
+    for name in COLUMN_NAMES:
+        files[name] = f'{name}-{generation}.npy'
+        np.save(os.path.join(directory, files[name]), columns[name])
+    manifest = {
+        'format': SNAPSHOT_FORMAT,
+        'version': SNAPSHOT_VERSION,
+        'generation': generation,
+        'rows': len(columns['ts']),
+        'last_row_id': last_row_id,
+        'dumper_names': dumper_names,
+        'position_names': position_names,
+        'columns': files,
+    }
+    temporary = os.path.join(directory, f'{MANIFEST_NAME}.{os.getpid()}.tmp')
+    with open(temporary, 'w') as handle:
+        json.dump(manifest, handle)
+    os.replace(temporary, os.path.join(directory, MANIFEST_NAME))
+
+    # Maps of the previous generation stay readable after the unlink (POSIX)
+    if previous:
+        for filename in previous['columns'].values():
+            try:
+                os.remove(os.path.join(directory, filename))
+            except OSError:
+                pass
+    return manifest
+
+def _read_manifest(directory):
+    with open(os.path.join(directory, MANIFEST_NAME)) as handle:
+        manifest = json.load(handle)
+    if manifest.get('format') != SNAPSHOT_FORMAT or manifest.get('version') != SNAPSHOT_VERSION:
+        raise ValueError(f"{directory} is not a version {SNAPSHOT_VERSION} TKPH snapshot")
+    return manifest
+
+def load_snapshot(directory, mmap=True):
+    manifest = _read_manifest(directory)
+    columns = {name: np.load(os.path.join(directory, manifest['columns'][name]),
+                             mmap_mode='r' if mmap else None)
+               for name in COLUMN_NAMES}
+    if any(len(column) != manifest['rows'] for column in columns.values()):
+        raise ValueError(f"Snapshot {directory} is inconsistent with its manifest")
+    return Snapshot(columns, manifest['dumper_names'], manifest['position_names'],
+                    manifest['last_row_id'])
+
+
+# True when the store still holds the snapshot's last reading under the same
+# row id, i.e. the snapshot was taken from this store and is a prefix of it
+def matches_store(snapshot, store):
+    if snapshot.last_row_id == 0:
+        return True
+    row = next(iter(store.iter_rows_after(snapshot.last_row_id - 1)), None)
+    if row is None or row[0] != snapshot.last_row_id:
+        return False
+    last = snapshot.last_row()
+    # Histories store readings without ids under '' (see series_key)
+    return (row[1], *series_key(row[2], row[3]), *row[4:]) == \
+        (last[0], *series_key(last[1], last[2]), *last[3:])
+
+# Seed an empty history from a snapshot (if it belongs to this store); sync()
+# then only has to read the readings stored after it
+def load_history(history, directory, store):
+    snapshot = load_snapshot(directory)
+    if not matches_store(snapshot, store):
+        print(f"Ignoring TKPH snapshot {directory}: it does not match the tracking store")
+        return False
+    history.load_columns(snapshot.columns, snapshot.dumper_names, snapshot.position_names,
+                         snapshot.last_row_id)
+    return True
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Convert TKPH tracking history to and from binary snapshots.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    from_store = commands.add_parser('from-store', help='snapshot the configured tracking store')
+    from_store.add_argument('directory')
+    from_xlsx = commands.add_parser('from-xlsx', help='snapshot a tracking workbook')
+    from_xlsx.add_argument('workbook')
+    from_xlsx.add_argument('directory')
+    to_xlsx = commands.add_parser('to-xlsx', help='write a snapshot out as a tracking workbook')
+    to_xlsx.add_argument('directory')
+    to_xlsx.add_argument('workbook')
+    info = commands.add_parser('info', help='describe a snapshot')
+    info.add_argument('directory')
+    args = parser.parse_args(argv)
+
+    try:
+        if args.command == 'from-store':
+            from tkph.store import get_store
+
+            history = ColumnarHistory()
+            history.sync(get_store())
+            manifest = write_snapshot(history, args.directory)
+        elif args.command == 'from-xlsx':
+            history = ColumnarHistory()
+            for row in read_tracking_workbook(args.workbook):
+                history.append(*row)
+            # Workbook rows become store rows 1..n when imported into an empty store
+            history.last_row_id = len(history)
+            manifest = write_snapshot(history, args.directory)
+        elif args.command == 'to-xlsx':
+            snapshot = load_snapshot(args.directory)
+            write_tracking_workbook(snapshot.iter_rows(), args.workbook)
+            manifest = _read_manifest(args.directory)
+        else:
+            manifest = _read_manifest(args.directory)
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+
+    print(f"{manifest['rows']} readings, {len(manifest['dumper_names'])} dumpers, "
+          f"{len(manifest['position_names'])} tyre positions, "
+          f"current to store row {manifest['last_row_id']}", file=sys.stderr)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,671 @@
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+from tkph.metrics import metrics, stage
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+# Column layout of the tracking spreadsheet people already use
+TRACKING_COLUMNS = ['Timestamp', 'Dumper ID', 'Tyre Position', 'TKPH Final', 'Suitable TKPH']
+# Optional trailing fields of a stored row: the inputs the scoring rules act
+# on, the rule version (tkph.rules key, "site@version") that scored it and the
+# speed multiplier applied to both values (1.0 for the web app's formula)
+SCORING_FIELDS = ['terrain_type', 'tire_wear_percentage', 'rule_version', 'speed_multiplier']
+SCORING_FIELD_TYPES = ['TEXT', 'REAL', 'TEXT', 'REAL']
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+DEFAULT_EXCEL_PATH = 'tkph_tracking.xlsx'
+DEFAULT_SQLITE_PATH = 'tkph_tracking.db'
+
+# Seconds a background writer job's progress is kept (see save_job_status)
+JOB_RETENTION = 3600
+
+# Insert triggers that keep the per-tyre tables current. Readings without a
+# dumper id or tyre position are keyed by '' there, since NULL keys never
+# conflict and would add a row per reading.
+SERIES_TRIGGERS = {
+    'trg_tkph_series_version': '''CREATE TRIGGER trg_tkph_series_version AFTER INSERT ON tkph_readings
+            BEGIN
+                INSERT INTO tkph_series (dumper_id, tyre_position, version, last_ts)
+                VALUES (COALESCE(NEW.dumper_id, ''), COALESCE(NEW.tyre_position, ''), 1, NEW.ts)
+                ON CONFLICT (dumper_id, tyre_position)
+                DO UPDATE SET version = version + 1, last_ts = MAX(last_ts, NEW.ts);
+            END''',
+    'trg_tkph_latest': '''CREATE TRIGGER trg_tkph_latest AFTER INSERT ON tkph_readings
+            BEGIN
+                INSERT INTO tkph_latest (dumper_id, tyre_position, reading_id, ts, tkph_final, suitable_tkph)
+                VALUES (COALESCE(NEW.dumper_id, ''), COALESCE(NEW.tyre_position, ''), NEW.id, NEW.ts,
+                        NEW.tkph_final, NEW.suitable_tkph)
+                ON CONFLICT (dumper_id, tyre_position)
+                DO UPDATE SET reading_id = excluded.reading_id, ts = excluded.ts,
+                              tkph_final = excluded.tkph_final, suitable_tkph = excluded.suitable_tkph
+                WHERE excluded.ts >= tkph_latest.ts;
+            END''',
+}
+
+# Readings stored without a dumper id or tyre position form one series keyed
+# by '' (as in SERIES_TRIGGERS): None and '' name the same tyre everywhere
+def series_key(dumper_id, tyre_position):
+    return ('' if dumper_id is None else dumper_id, '' if tyre_position is None else tyre_position)
+
+# WHERE clause and parameters selecting one tyre's readings by series_key()
+def _series_filter(dumper_id, tyre_position):
+    clauses, params = [], []
+    for column, value in zip(('dumper_id', 'tyre_position'), series_key(dumper_id, tyre_position)):
+        if value == '':
+            clauses.append(f"({column} = '' OR {column} IS NULL)")
+        else:
+            clauses.append(f'{column} = ?')
+            params.append(value)
+    return ' AND '.join(clauses), params
+
+# Convert between stored epoch seconds and the spreadsheet timestamp text
+def format_timestamp(ts):
+    return datetime.fromtimestamp(ts).strftime(TIMESTAMP_FORMAT)
+
+def parse_timestamp(value):
+    if isinstance(value, (int, float)):
+        return int(value)
+    if isinstance(value, datetime):
+        return int(value.timestamp())
+    if hasattr(value, 'to_pydatetime'):  # pandas Timestamp
+        return int(value.to_pydatetime().timestamp())
+    return int(datetime.strptime(str(value).strip(), TIMESTAMP_FORMAT).timestamp())
+
+# Hold an exclusive lock on a sidecar file so that several workers never
+# interleave their writes to the same backing file
+@contextmanager
+def file_lock(path):
+    with open(path + '.lock', 'a+') as handle:
+        if fcntl is not None:
+            fcntl.flock(handle, fcntl.LOCK_EX)
+        else:
+            handle.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(handle.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    time.sleep(0.05)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(handle, fcntl.LOCK_UN)
+            else:
+                handle.seek(0)
+                msvcrt.locking(handle.fileno(), msvcrt.LK_UNLCK, 1)
+
+# Write rows to an .xlsx workbook in the tracking layout, streaming them
+# through openpyxl's write-only mode so exports never hold the whole sheet
+def write_tracking_workbook(rows, target):
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    sheet.append(TRACKING_COLUMNS)
+    for ts, dumper_id, tyre_position, tkph_final, suitable_tkph in rows:
+        sheet.append([format_timestamp(ts), dumper_id, tyre_position, tkph_final, suitable_tkph])
+    workbook.save(target)
+
+# Read rows out of an .xlsx workbook in the tracking layout
+def read_tracking_workbook(source):
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(source, read_only=True, data_only=True)
+    try:
+        sheet = workbook.worksheets[0]
+        rows = sheet.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        positions = [list(header).index(column) for column in TRACKING_COLUMNS]
+        for row in rows:
+            if row is None or row[positions[0]] is None:
+                continue
+            values = [row[i] for i in positions]
+            yield (parse_timestamp(values[0]), values[1], values[2],
+                   float(values[3]), float(values[4]))
+    finally:
+        workbook.close()
+
+
+# Append-only store backed by SQLite in WAL mode. Each insert appends a single
+# row, so the cost does not grow with the size of the history,
+# and SQLite's own locking keeps concurrent gunicorn workers from losing rows.
+class SQLiteStore:
+    name = 'sqlite'
+
+    def __init__(self, path=DEFAULT_SQLITE_PATH):
+        self.path = path
+        self._local = threading.local()
+        self._create_schema()
+
+    def _connect(self):
+        connection = getattr(self._local, 'connection', None)
+        # Connections must not be shared across a fork (gunicorn preload)
+        if connection is not None and self._local.pid == os.getpid():
+            return connection
+        connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('PRAGMA synchronous=FULL')
+        connection.execute('PRAGMA busy_timeout=30000')
+        self._local.connection = connection
+        self._local.pid = os.getpid()
+        return connection
+
+    def _create_schema(self):
+        self._connect().executescript('''
+            CREATE TABLE IF NOT EXISTS tkph_readings (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                ts INTEGER NOT NULL,
+                dumper_id TEXT,
+                tyre_position TEXT,
+                tkph_final REAL NOT NULL,
+                suitable_tkph REAL NOT NULL,
+                terrain_type TEXT,
+                tire_wear_percentage REAL,
+                rule_version TEXT,
+                speed_multiplier REAL
+            );
+            CREATE INDEX IF NOT EXISTS idx_tkph_readings_series
+                ON tkph_readings (dumper_id, tyre_position, ts);
+            CREATE TABLE IF NOT EXISTS tkph_series (
+                dumper_id TEXT NOT NULL,
+                tyre_position TEXT NOT NULL,
+                version INTEGER NOT NULL,
+                last_ts INTEGER NOT NULL,
+                PRIMARY KEY (dumper_id, tyre_position)
+            );
+            CREATE TABLE IF NOT EXISTS tkph_latest (
+                dumper_id TEXT NOT NULL,
+                tyre_position TEXT NOT NULL,
+                reading_id INTEGER NOT NULL,
+                ts INTEGER NOT NULL,
+                tkph_final REAL NOT NULL,
+                suitable_tkph REAL NOT NULL,
+                PRIMARY KEY (dumper_id, tyre_position)
+            );
+            CREATE TABLE IF NOT EXISTS tkph_rescored (
+                version TEXT NOT NULL,
+                reading_id INTEGER NOT NULL,
+                tkph_final REAL NOT NULL,
+                suitable_tkph REAL NOT NULL,
+                condition_status TEXT NOT NULL,
+                from_inputs INTEGER NOT NULL,
+                PRIMARY KEY (version, reading_id)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS tkph_backfill (
+                version TEXT PRIMARY KEY,
+                last_reading_id INTEGER NOT NULL,
+                rows_done INTEGER NOT NULL,
+                started_at INTEGER NOT NULL,
+                updated_at INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS tkph_jobs (
+                job_id TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                dumper_id TEXT,
+                tyre_position TEXT,
+                error TEXT,
+                updated_at INTEGER NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_tkph_jobs_updated ON tkph_jobs (updated_at);
+        ''')
+        connection = self._connect()
+        # Databases created before readings recorded their scoring inputs and
+        # rule version: older rows keep NULL there
+        columns = {row[1] for row in connection.execute('PRAGMA table_info(tkph_readings)')}
+        for name, sql_type in zip(SCORING_FIELDS, SCORING_FIELD_TYPES):
+            if name not in columns:
+                connection.execute(f'ALTER TABLE tkph_readings ADD COLUMN {name} {sql_type}')
+        # Install the insert triggers. Databases whose triggers stored NULL ids
+        # in tkph_series / tkph_latest (each such reading added a row there)
+        # get them replaced and both tables rebuilt, in one transaction.
+        if not self._triggers_current(connection):
+            connection.execute('BEGIN IMMEDIATE')
+            try:
+                if not self._triggers_current(connection):
+                    for name in SERIES_TRIGGERS:
+                        connection.execute(f'DROP TRIGGER IF EXISTS {name}')
+                    for sql in SERIES_TRIGGERS.values():
+                        connection.execute(sql)
+                    connection.execute('DELETE FROM tkph_series')
+                    connection.execute('DELETE FROM tkph_latest')
+                    self._seed_series_tables(connection)
+                connection.execute('COMMIT')
+            except BaseException:
+                connection.execute('ROLLBACK')
+                raise
+        # Databases created before tkph_series / tkph_latest existed
+        self._seed_series_tables(connection)
+
+    def _triggers_current(self, connection):
+        triggers = dict(connection.execute(
+            "SELECT name, sql FROM sqlite_master WHERE type = 'trigger'").fetchall())
+        return all(triggers.get(name) == sql for name, sql in SERIES_TRIGGERS.items())
+
+    # Fill tkph_series / tkph_latest from the readings if they are empty,
+    # with one index probe per tyre for tkph_latest
+    def _seed_series_tables(self, connection):
+        if connection.execute('SELECT NOT EXISTS (SELECT 1 FROM tkph_series)').fetchone()[0]:
+            connection.execute('''
+                INSERT OR IGNORE INTO tkph_series (dumper_id, tyre_position, version, last_ts)
+                SELECT COALESCE(dumper_id, ''), COALESCE(tyre_position, ''), COUNT(*), MAX(ts)
+                FROM tkph_readings GROUP BY 1, 2
+            ''')
+        if connection.execute('SELECT NOT EXISTS (SELECT 1 FROM tkph_latest)').fetchone()[0]:
+            connection.execute('''
+                INSERT OR IGNORE INTO tkph_latest
+                    (dumper_id, tyre_position, reading_id, ts, tkph_final, suitable_tkph)
+                SELECT s.dumper_id, s.tyre_position, r.id, r.ts, r.tkph_final, r.suitable_tkph
+                FROM tkph_series s JOIN tkph_readings r ON r.id = (
+                    SELECT id FROM tkph_readings
+                    WHERE (dumper_id = s.dumper_id OR (s.dumper_id = '' AND dumper_id IS NULL))
+                      AND (tyre_position = s.tyre_position
+                           OR (s.tyre_position = '' AND tyre_position IS NULL))
+                    ORDER BY ts DESC, id DESC LIMIT 1)
+            ''')
+
+    # Open one write transaction; every row passed to the yielded callable is
+    # committed together or not at all. Rows are (ts, dumper_id, tyre_position,
+    # tkph_final, suitable_tkph), optionally followed by the SCORING_FIELDS.
+    @contextmanager
+    def writer(self):
+        connection = self._connect()
+        with stage('store.begin'):
+            connection.execute('BEGIN IMMEDIATE')
+
+        def write(rows):
+            width = 5 + len(SCORING_FIELDS)
+            padding = (None,) * len(SCORING_FIELDS)
+            with stage('store.insert'):
+                cursor = connection.executemany(
+                    f'INSERT INTO tkph_readings (ts, dumper_id, tyre_position, tkph_final, suitable_tkph, '
+                    f'{", ".join(SCORING_FIELDS)}) VALUES ({", ".join("?" * width)})',
+                    (row if len(row) == width else (tuple(row) + padding)[:width] for row in rows))
+            metrics.inc('tkph_readings_written_total', cursor.rowcount, backend=self.name)
+
+        try:
+            yield write
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        with stage('store.commit'):
+            connection.execute('COMMIT')
+
+    def append_many(self, rows):
+        with self.writer() as write:
+            write(rows)
+
+    def append(self, dumper_id, tyre_position, tkph_final, suitable_tkph, timestamp=None,
+               terrain_type=None, tire_wear_percentage=None, rule_version=None, speed_multiplier=None):
+        ts = int(time.time()) if timestamp is None else parse_timestamp(timestamp)
+        self.append_many([(ts, dumper_id, tyre_position, float(tkph_final), float(suitable_tkph),
+                           terrain_type, tire_wear_percentage, rule_version, speed_multiplier)])
+
+    def count(self):
+        return self._connect().execute('SELECT COUNT(*) FROM tkph_readings').fetchone()[0]
+
+    # Yield (ts, dumper_id, tyre_position, tkph_final, suitable_tkph) in insertion order
+    def iter_rows(self, batch_size=10000):
+        cursor = self._connect().execute(
+            'SELECT ts, dumper_id, tyre_position, tkph_final, suitable_tkph '
+            'FROM tkph_readings ORDER BY id')
+        while True:
+            batch = cursor.fetchmany(batch_size)
+            if not batch:
+                break
+            yield from batch
+
+    # Yield (id, ts, dumper_id, tyre_position, tkph_final, suitable_tkph) for
+    # rows stored after row id `after_id`, so in-process views of the history
+    # can catch up with writes from other workers without rereading it all
+    def iter_rows_after(self, after_id=0, batch_size=10000):
+        cursor = self._connect().execute(
+            'SELECT id, ts, dumper_id, tyre_position, tkph_final, suitable_tkph '
+            'FROM tkph_readings WHERE id > ? ORDER BY id', (after_id,))
+        while True:
+            batch = cursor.fetchmany(batch_size)
+            if not batch:
+                break
+            yield from batch
+
+    # Like iter_rows_after, with the SCORING_FIELDS appended to every row, for
+    # re-scoring stored readings under other rules
+    def iter_scored_rows(self, after_id=0, batch_size=10000):
+        cursor = self._connect().execute(
+            'SELECT id, ts, dumper_id, tyre_position, tkph_final, suitable_tkph, '
+            f'{", ".join(SCORING_FIELDS)} FROM tkph_readings WHERE id > ? ORDER BY id', (after_id,))
+        while True:
+            batch = cursor.fetchmany(batch_size)
+            if not batch:
+                break
+            yield from batch
+
+    # Up to `limit` rows as iter_scored_rows yields them, with after_id < id <= until_id
+    def read_scored_rows(self, after_id, limit, until_id=None):
+        return self._connect().execute(
+            'SELECT id, ts, dumper_id, tyre_position, tkph_final, suitable_tkph, '
+            f'{", ".join(SCORING_FIELDS)} FROM tkph_readings WHERE id > ? AND id <= ? '
+            'ORDER BY id LIMIT ?', (after_id, until_id or self.max_reading_id(), limit)).fetchall()
+
+    def max_reading_id(self):
+        return self._connect().execute('SELECT COALESCE(MAX(id), 0) FROM tkph_readings').fetchone()[0]
+
+    # Re-scored values are kept per version in tkph_rescored, next to the
+    # original readings; tkph_backfill records how far each version has got.
+    # Rows are (reading_id, tkph_final, suitable_tkph, condition_status,
+    # from_inputs); they and the new checkpoint are committed together.
+    def save_rescored(self, version, rows, last_reading_id):
+        now = int(time.time())
+        connection = self._connect()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            cursor = connection.executemany(
+                'INSERT OR REPLACE INTO tkph_rescored (version, reading_id, tkph_final, suitable_tkph, '
+                'condition_status, from_inputs) VALUES (?, ?, ?, ?, ?, ?)',
+                ((version,) + tuple(row) for row in rows))
+            connection.execute(
+                'INSERT INTO tkph_backfill (version, last_reading_id, rows_done, started_at, updated_at) '
+                'VALUES (?, ?, ?, ?, ?) ON CONFLICT (version) DO UPDATE SET '
+                'last_reading_id = excluded.last_reading_id, '
+                'rows_done = rows_done + excluded.rows_done, updated_at = excluded.updated_at',
+                (version, last_reading_id, cursor.rowcount, now, now))
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+
+    # Checkpoint of a version's backfill: {'last_reading_id', 'rows_done',
+    # 'started_at', 'updated_at'}, or None when it has not started
+    def backfill_progress(self, version):
+        row = self._connect().execute(
+            'SELECT last_reading_id, rows_done, started_at, updated_at FROM tkph_backfill '
+            'WHERE version = ?', (version,)).fetchone()
+        if row is None:
+            return None
+        return dict(zip(('last_reading_id', 'rows_done', 'started_at', 'updated_at'), row))
+
+    # Drop a version's re-scored values and checkpoint
+    def reset_backfill(self, version):
+        connection = self._connect()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            connection.execute('DELETE FROM tkph_rescored WHERE version = ?', (version,))
+            connection.execute('DELETE FROM tkph_backfill WHERE version = ?', (version,))
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+
+    # Number of re-scored readings per condition for a version
+    def rescored_condition_counts(self, version):
+        return dict(self._connect().execute(
+            'SELECT condition_status, COUNT(*) FROM tkph_rescored WHERE version = ? '
+            'GROUP BY condition_status', (version,)).fetchall())
+
+    # Number of readings scored by each rule version (None: not recorded)
+    def rule_version_counts(self):
+        return dict(self._connect().execute(
+            'SELECT rule_version, COUNT(*) FROM tkph_readings GROUP BY rule_version').fetchall())
+
+    # Progress of background writer jobs (tkph.worker), kept here so that any
+    # worker process can answer for a reading queued by another. `jobs` are
+    # (job_id, dumper_id, tyre_position); entries older than JOB_RETENTION
+    # seconds are dropped on the way.
+    def save_job_status(self, jobs, status, error=None):
+        now = int(time.time())
+        connection = self._connect()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            connection.executemany(
+                'INSERT INTO tkph_jobs (job_id, status, dumper_id, tyre_position, error, updated_at) '
+                'VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (job_id) DO UPDATE SET '
+                'status = excluded.status, error = excluded.error, updated_at = excluded.updated_at',
+                ((job_id, status, dumper_id, tyre_position, error, now)
+                 for job_id, dumper_id, tyre_position in jobs))
+            connection.execute('DELETE FROM tkph_jobs WHERE updated_at < ?', (now - JOB_RETENTION,))
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+
+    # {'status', 'dumper_id', 'tyre_position', 'error'} of a job, or None
+    def job_status(self, job_id):
+        row = self._connect().execute(
+            'SELECT status, dumper_id, tyre_position, error FROM tkph_jobs WHERE job_id = ?',
+            (job_id,)).fetchone()
+        if row is None:
+            return None
+        return dict(zip(('status', 'dumper_id', 'tyre_position', 'error'), row))
+
+    # Time-sorted (ts, tkph_final, suitable_tkph) for one tyre, optionally limited
+    # to start <= ts <= end. Served from the series index: O(log n + k).
+    def query_series(self, dumper_id, tyre_position, start=None, end=None):
+        where, params = _series_filter(dumper_id, tyre_position)
+        sql = f'SELECT ts, tkph_final, suitable_tkph FROM tkph_readings WHERE {where}'
+        if start is not None:
+            sql += ' AND ts >= ?'
+            params.append(parse_timestamp(start))
+        if end is not None:
+            sql += ' AND ts <= ?'
+            params.append(parse_timestamp(end))
+        sql += ' ORDER BY ts, id'
+        with stage('store.query_series'):
+            return self._connect().execute(sql, params).fetchall()
+
+    # (version, last_ts) of one tyre's series. The version goes up by one with
+    # every reading stored for that tyre; (0, None) means no history yet.
+    def series_version(self, dumper_id, tyre_position):
+        row = self._connect().execute(
+            'SELECT version, last_ts FROM tkph_series '
+            "WHERE dumper_id = COALESCE(?, '') AND tyre_position = COALESCE(?, '')",
+            (dumper_id, tyre_position)).fetchone()
+        return row if row is not None else (0, None)
+
+    # One page of a tyre's history, newest first, as (id, ts, tkph_final,
+    # suitable_tkph). Pass the (ts, id) of the last row of a page as `before`
+    # to get the next page; the series index keeps every page O(log n + limit).
+    def page_series(self, dumper_id, tyre_position, limit, before=None):
+        where, params = _series_filter(dumper_id, tyre_position)
+        sql = f'SELECT id, ts, tkph_final, suitable_tkph FROM tkph_readings WHERE {where}'
+        if before is not None:
+            sql += ' AND (ts < ? OR (ts = ? AND id < ?))'
+            params.extend([before[0], before[0], before[1]])
+        sql += ' ORDER BY ts DESC, id DESC LIMIT ?'
+        params.append(int(limit))
+        return self._connect().execute(sql, params).fetchall()
+
+    # The most recent n readings for one tyre, oldest first
+    def last_n(self, dumper_id, tyre_position, n):
+        where, params = _series_filter(dumper_id, tyre_position)
+        rows = self._connect().execute(
+            f'SELECT ts, tkph_final, suitable_tkph FROM tkph_readings '
+            f'WHERE {where} ORDER BY ts DESC, id DESC LIMIT ?',
+            params + [int(n)]).fetchall()
+        rows.reverse()
+        return rows
+
+    # Latest reading of every tyre as (dumper_id, tyre_position, ts, tkph_final,
+    # suitable_tkph), sorted by tyre. Read from tkph_latest, which the insert
+    # trigger keeps current, so the cost follows the fleet size, not the history.
+    def latest_readings(self):
+        with stage('store.latest_readings'):
+            return self._connect().execute(
+                'SELECT dumper_id, tyre_position, ts, tkph_final, suitable_tkph FROM tkph_latest '
+                'ORDER BY dumper_id, tyre_position').fetchall()
+
+    def read_dataframe(self):
+        import pandas as pd
+
+        df = pd.DataFrame(list(self.iter_rows()), columns=TRACKING_COLUMNS)
+        df['Timestamp'] = pd.to_datetime(df['Timestamp'].map(datetime.fromtimestamp))
+        return df
+
+    def export_excel(self, target=DEFAULT_EXCEL_PATH):
+        write_tracking_workbook(self.iter_rows(), target)
+
+    def import_excel(self, source=DEFAULT_EXCEL_PATH):
+        self.append_many(read_tracking_workbook(source))
+
+
+# Original spreadsheet backend: the whole workbook is read and rewritten on
+# every write. Kept for sites that still want the .xlsx as the system of
+# record; a file lock now serialises writers across processes.
+class ExcelStore:
+    name = 'excel'
+
+    def __init__(self, path=DEFAULT_EXCEL_PATH):
+        self.path = path
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return []
+        try:
+            with stage('excel.read_workbook'):
+                return list(read_tracking_workbook(self.path))
+        except Exception as e:
+            print(f"Error reading the Excel file: {e}")
+            return []
+
+    # The workbook keeps its five tracking columns; scoring inputs and rule
+    # versions are only recorded by the SQLite store
+    @contextmanager
+    def writer(self):
+        pending = []
+        yield lambda rows: pending.extend(tuple(row)[:5] for row in rows)
+        with file_lock(self.path):
+            rows = self._load()
+            rows.extend(pending)
+            with stage('excel.write_workbook'):
+                write_tracking_workbook(rows, self.path)
+        metrics.inc('tkph_readings_written_total', len(pending), backend=self.name)
+
+    def append_many(self, rows):
+        with self.writer() as write:
+            write(rows)
+
+    def append(self, dumper_id, tyre_position, tkph_final, suitable_tkph, timestamp=None,
+               terrain_type=None, tire_wear_percentage=None, rule_version=None, speed_multiplier=None):
+        ts = int(time.time()) if timestamp is None else parse_timestamp(timestamp)
+        self.append_many([(ts, dumper_id, tyre_position, float(tkph_final), float(suitable_tkph),
+                           terrain_type, tire_wear_percentage, rule_version, speed_multiplier)])
+
+    def count(self):
+        return len(self._load())
+
+    def iter_rows(self, batch_size=None):
+        return iter(self._load())
+
+    # Row ids are 1-based positions in the workbook
+    def iter_rows_after(self, after_id=0, batch_size=None):
+        for row_id, row in enumerate(self._load()[after_id:], start=after_id + 1):
+            yield (row_id,) + tuple(row)
+
+    def iter_scored_rows(self, after_id=0, batch_size=None):
+        padding = (None,) * len(SCORING_FIELDS)
+        for row in self.iter_rows_after(after_id):
+            yield row + padding
+
+    def rule_version_counts(self):
+        count = self.count()
+        return {None: count} if count else {}
+
+    # The workbook keeps no job progress: with this backend (a single worker
+    # process) the background writer's own record is the only one
+    def save_job_status(self, jobs, status, error=None):
+        pass
+
+    def job_status(self, job_id):
+        return None
+
+    # Same contract as SQLiteStore.query_series, answered by a full scan
+    def query_series(self, dumper_id, tyre_position, start=None, end=None):
+        start = None if start is None else parse_timestamp(start)
+        end = None if end is None else parse_timestamp(end)
+        key = series_key(dumper_id, tyre_position)
+        rows = [(ts, tkph_final, suitable_tkph)
+                for ts, d, t, tkph_final, suitable_tkph in self._load()
+                if series_key(d, t) == key
+                and (start is None or ts >= start) and (end is None or ts <= end)]
+        rows.sort(key=lambda row: row[0])
+        return rows
+
+    def series_version(self, dumper_id, tyre_position):
+        series = self.query_series(dumper_id, tyre_position)
+        return (len(series), series[-1][0]) if series else (0, None)
+
+    def page_series(self, dumper_id, tyre_position, limit, before=None):
+        key = series_key(dumper_id, tyre_position)
+        rows = [(row_id, ts, tkph_final, suitable_tkph)
+                for row_id, ts, d, t, tkph_final, suitable_tkph in self.iter_rows_after(0)
+                if series_key(d, t) == key
+                and (before is None or (ts, row_id) < tuple(before))]
+        rows.sort(key=lambda row: (row[1], row[0]), reverse=True)
+        return rows[:int(limit)]
+
+    def last_n(self, dumper_id, tyre_position, n):
+        return self.query_series(dumper_id, tyre_position)[-int(n):] if n > 0 else []
+
+    def latest_readings(self):
+        latest = {}
+        for ts, dumper_id, tyre_position, tkph_final, suitable_tkph in self._load():
+            key = series_key(dumper_id, tyre_position)
+            current = latest.get(key)
+            if current is None or ts >= current[2]:
+                latest[key] = key + (ts, tkph_final, suitable_tkph)
+        return [latest[key] for key in sorted(latest, key=lambda key: (str(key[0]), str(key[1])))]
+
+    def read_dataframe(self):
+        import pandas as pd
+
+        df = pd.DataFrame(self._load(), columns=TRACKING_COLUMNS)
+        df['Timestamp'] = pd.to_datetime(df['Timestamp'].map(datetime.fromtimestamp))
+        return df
+
+    def export_excel(self, target=DEFAULT_EXCEL_PATH):
+        if target == self.path:
+            return
+        write_tracking_workbook(self._load(), target)
+
+    def import_excel(self, source=DEFAULT_EXCEL_PATH):
+        self.append_many(read_tracking_workbook(source))
+
+
+STORE_BACKENDS = {
+    'sqlite': (SQLiteStore, DEFAULT_SQLITE_PATH),
+    'excel': (ExcelStore, DEFAULT_EXCEL_PATH),
+}
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+# Return the configured store (TKPH_STORE_BACKEND / TKPH_STORE_PATH). The first
+# time an empty SQLite store is opened next to an existing tkph_tracking.xlsx,
+# the spreadsheet history is imported so nothing is left behind.
+def get_store(backend=None, path=None):
+    backend = backend or os.environ.get('TKPH_STORE_BACKEND', 'sqlite')
+    if backend not in STORE_BACKENDS:
+        raise ValueError(f"Unknown TKPH store backend: {backend}")
+    store_class, default_path = STORE_BACKENDS[backend]
+    path = path or os.environ.get('TKPH_STORE_PATH', default_path)
+
+    with _stores_lock:
+        store = _stores.get((backend, path))
+        if store is None:
+            store = store_class(path)
+            if backend == 'sqlite' and store.count() == 0 and os.path.exists(DEFAULT_EXCEL_PATH):
+                with file_lock(path):
+                    if store.count() == 0:
+                        store.import_excel(DEFAULT_EXCEL_PATH)
+            _stores[(backend, path)] = store
+        return store
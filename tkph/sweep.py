@@ -0,0 +1,371 @@
+import argparse
+import csv
+import json
+import sys
+from collections import deque
+
+import numpy as np
+
+from tkph.batch import CONDITION_STATUSES, INPUT_COLUMNS, condition_codes, tkph_values
+from tkph.rules import get_rules
+
+# What-if sweeps over the calculator inputs: every combination of the given
+# axis values is scored with the batch engine (same arithmetic as the form),
+# and the results are folded into per-axis sensitivity tables. Large grids are
+# cut into chunks; within a chunk the trailing axes are broadcast against each
+# other rather than materialised, and chunks can be spread over a process
+# pool. Only per-chunk summaries are kept, so memory does not grow with the
+# grid; --output streams every grid point to a CSV file as chunks complete.
+#
+#   python -m tkph.sweep --axis cycle_time=0.4:1.6:25 --axis terrain_type=all \
+#       --axis tire_wear_percentage=bands --axis distance_loaded=2:14:13 --workers 4
+
+SWEEP_CHUNKSIZE = 250000
+
+# Inputs that are not swept are held at these values (a typical haul)
+DEFAULT_BASELINE = {
+    'distance_loaded': 8.0,
+    'cycle_time': 0.8,
+    'terrain_type': 'Flat',
+    'tire_wear_percentage': 30.0,
+    'tyre_load_empty': 20.0,
+    'tyre_load_fully_loaded': 55.0,
+}
+
+# One wear percentage per wear band of the current rules: the midpoint of
+# each band up to 100%
+def wear_band_points(rules=None):
+    bounds = [0.0] + (rules or get_rules()).wear_band_edges.tolist() + [100.0]
+    return [(low + high) / 2 for low, high in zip(bounds, bounds[1:])]
+
+NUMERIC_AXES = [name for name in INPUT_COLUMNS if name != 'terrain_type']
+
+
+# Every terrain, one wear per band (of `rules`, default: the configured
+# site's current rules), and +/-50% around the baseline in 5 steps
+def default_axes(baseline=None, rules=None):
+    rules = rules or get_rules()
+    baseline = dict(DEFAULT_BASELINE, **(baseline or {}))
+    axes = {name: np.linspace(0.5 * baseline[name], 1.5 * baseline[name], 5)
+            for name in NUMERIC_AXES if name != 'tire_wear_percentage'}
+    axes['terrain_type'] = rules.terrain_names.tolist()
+    axes['tire_wear_percentage'] = wear_band_points(rules)
+    return axes
+
+# Parse "name=start:stop:num" (evenly spaced), "name=v1,v2,..." or the
+# shorthands terrain_type=all and tire_wear_percentage=bands (of `rules`)
+def parse_axis(spec, rules=None):
+    name, _, text = spec.partition('=')
+    name = name.strip()
+    text = text.strip()
+    if name not in INPUT_COLUMNS:
+        raise ValueError(f"Unknown input '{name}'; expected one of {', '.join(INPUT_COLUMNS)}")
+    if not text:
+        raise ValueError(f"No values given for {name}")
+    if name == 'terrain_type':
+        return name, (rules or get_rules()).terrain_names.tolist() if text == 'all' else \
+            [value.strip() for value in text.split(',')]
+    if name == 'tire_wear_percentage' and text == 'bands':
+        return name, wear_band_points(rules)
+    if ':' in text:
+        start, stop, num = text.split(':')
+        return name, np.linspace(float(start), float(stop), int(num)).tolist()
+    return name, [float(value) for value in text.split(',')]
+
+def parse_baseline(spec):
+    name, _, value = spec.partition('=')
+    name = name.strip()
+    if name not in INPUT_COLUMNS:
+        raise ValueError(f"Unknown input '{name}'; expected one of {', '.join(INPUT_COLUMNS)}")
+    return name, value.strip() if name == 'terrain_type' else float(value)
+
+
+# The full grid over INPUT_COLUMNS (inputs that are not swept become single-
+# value axes at the baseline), in C order: the last input varies fastest.
+# Chunks cover a block of combinations of the leading ("outer") axes times the
+# whole sub-grid of the trailing ("inner") axes that fits in chunksize. Every
+# point is scored under `rules` (default: the configured site's current
+# rules), which travel with the grid to the worker processes.
+class SweepGrid:
+    def __init__(self, axes, baseline=None, chunksize=SWEEP_CHUNKSIZE, rules=None):
+        self.rules = rules or get_rules()
+        self.baseline = dict(DEFAULT_BASELINE, **(baseline or {}))
+        self.values = []
+        for name in INPUT_COLUMNS:
+            values = axes.get(name, [self.baseline[name]])
+            dtype = str if name == 'terrain_type' else np.float64
+            values = np.asarray(values, dtype=dtype).ravel()
+            if not len(values):
+                raise ValueError(f"No values given for {name}")
+            self.values.append(values)
+        self.shape = tuple(len(values) for values in self.values)
+        self.size = int(np.prod(self.shape))
+
+        self.split = len(self.shape)
+        inner_size = 1
+        while self.split > 0 and inner_size * self.shape[self.split - 1] <= chunksize:
+            self.split -= 1
+            inner_size *= self.shape[self.split]
+        self.inner_shape = self.shape[self.split:]
+        self.outer_shape = self.shape[:self.split]
+        self.outer_size = int(np.prod(self.outer_shape))
+        self.rows_per_chunk = max(1, chunksize // inner_size)
+
+    def swept(self):
+        return [name for name, values in zip(INPUT_COLUMNS, self.values) if len(values) > 1]
+
+    # (start, stop) ranges of outer combinations, one per chunk
+    def chunks(self):
+        for start in range(0, self.outer_size, self.rows_per_chunk):
+            yield start, min(start + self.rows_per_chunk, self.outer_size)
+
+    # Outer axis indices and broadcast input arrays of shape (rows, *inner_shape)
+    def chunk_inputs(self, start, stop):
+        rows = stop - start
+        outer_index = np.unravel_index(np.arange(start, stop), self.outer_shape) \
+            if self.outer_shape else ()
+        inputs = []
+        for j, values in enumerate(self.values):
+            if j < self.split:
+                shape = (rows,) + (1,) * len(self.inner_shape)
+                inputs.append(values[outer_index[j]].reshape(shape))
+            else:
+                shape = [1] * (1 + len(self.inner_shape))
+                shape[1 + j - self.split] = -1
+                inputs.append(values.reshape(shape))
+        return outer_index, inputs
+
+    def evaluate(self, start, stop):
+        outer_index, inputs = self.chunk_inputs(start, stop)
+        full_shape = (stop - start,) + self.inner_shape
+        with np.errstate(divide='ignore', invalid='ignore'):
+            tkph_final, suitable_tkph = tkph_values(*inputs, rules=self.rules)
+        tkph_final = np.broadcast_to(tkph_final, full_shape)
+        suitable_tkph = np.broadcast_to(suitable_tkph, full_shape)
+        return outer_index, inputs, tkph_final, suitable_tkph
+
+
+# Per-axis accumulators for one chunk (or, merged, the whole grid): for every
+# value of every input, the number of grid points, the sum / min / max of TKPH
+# final, the sum of TKPH final / suitable TKPH and the count per condition
+def summarise_chunk(grid, start, stop):
+    outer_index, _, tkph_final, suitable_tkph = grid.evaluate(start, stop)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratio = tkph_final / suitable_tkph
+    codes = condition_codes(tkph_final, suitable_tkph, grid.rules)
+    rows = stop - start
+
+    def by_axis(j, values, reduce, combine_at, initial):
+        if j >= grid.split:
+            axis = 1 + j - grid.split
+            return reduce(values, axis=tuple(a for a in range(values.ndim) if a != axis))
+        row_values = reduce(values.reshape(rows, -1), axis=1)
+        out = np.full(grid.shape[j], initial, dtype=row_values.dtype)
+        combine_at(out, outer_index[j], row_values)
+        return out
+
+    summary = []
+    for j in range(len(grid.shape)):
+        statuses = np.stack([by_axis(j, codes == code, np.sum, np.add.at, 0)
+                             for code in range(len(CONDITION_STATUSES))], axis=1)
+        summary.append({
+            'count': statuses.sum(axis=1),
+            'sum': by_axis(j, tkph_final, np.sum, np.add.at, 0.0),
+            'min': by_axis(j, tkph_final, np.min, np.minimum.at, np.inf),
+            'max': by_axis(j, tkph_final, np.max, np.maximum.at, -np.inf),
+            'ratio_sum': by_axis(j, ratio, np.sum, np.add.at, 0.0),
+            'statuses': statuses,
+        })
+    return summary
+
+def merge_summaries(total, summary):
+    if total is None:
+        return summary
+    for into, part in zip(total, summary):
+        for key in ('count', 'sum', 'ratio_sum', 'statuses'):
+            into[key] = into[key] + part[key]
+        into['min'] = np.minimum(into['min'], part['min'])
+        into['max'] = np.maximum(into['max'], part['max'])
+    return total
+
+# Grid points of one chunk as CSV rows: the inputs, then the results
+def chunk_rows(grid, start, stop):
+    _, inputs, tkph_final, suitable_tkph = grid.evaluate(start, stop)
+    full_shape = tkph_final.shape
+    columns = [np.broadcast_to(values, full_shape).ravel().tolist() for values in inputs]
+    columns.append(tkph_final.ravel().tolist())
+    columns.append(suitable_tkph.ravel().tolist())
+    columns.append(CONDITION_STATUSES[condition_codes(tkph_final, suitable_tkph, grid.rules)]
+                   .ravel().tolist())
+    return list(zip(*columns))
+
+
+_worker_grid = None
+
+def _init_worker(grid):
+    global _worker_grid
+    _worker_grid = grid
+
+def _sweep_chunk(task):
+    start, stop, with_rows = task
+    summary = summarise_chunk(_worker_grid, start, stop)
+    return summary, chunk_rows(_worker_grid, start, stop) if with_rows else None
+
+# Like Pool.imap, but with at most `window` chunks in flight, so finished
+# results never pile up faster than the caller consumes them
+def imap_bounded(pool, function, tasks, window):
+    pending = deque()
+    for task in tasks:
+        pending.append(pool.apply_async(function, (task,)))
+        if len(pending) >= window:
+            yield pending.popleft().get()
+    while pending:
+        yield pending.popleft().get()
+
+# Evaluate the whole grid; returns the merged per-axis summary. on_rows, if
+# given, is called with each chunk's CSV rows in grid order.
+def run_sweep(grid, workers=1, on_rows=None):
+    tasks = ((start, stop, on_rows is not None) for start, stop in grid.chunks())
+    if workers > 1:
+        from multiprocessing import Pool
+        pool = Pool(workers, initializer=_init_worker, initargs=(grid,))
+        results = imap_bounded(pool, _sweep_chunk, tasks, 2 * workers)
+    else:
+        pool = None
+        _init_worker(grid)
+        results = map(_sweep_chunk, tasks)
+
+    total = None
+    try:
+        for summary, rows in results:
+            total = merge_summaries(total, summary)
+            if on_rows is not None:
+                on_rows(rows)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    return total
+
+
+# Sensitivity table: one row per value of every swept input, aggregated over
+# all combinations of the other inputs
+def sensitivity_table(grid, summary):
+    table = []
+    for name, values, axis in zip(INPUT_COLUMNS, grid.values, summary):
+        if len(values) < 2:
+            continue
+        for i, value in enumerate(values.tolist()):
+            count = int(axis['count'][i])
+            table.append({
+                'input': name,
+                'value': value,
+                'points': count,
+                'mean_tkph_final': float(axis['sum'][i] / count),
+                'min_tkph_final': float(axis['min'][i]),
+                'max_tkph_final': float(axis['max'][i]),
+                'mean_ratio': float(axis['ratio_sum'][i] / count),
+                'condition_share': {status: int(n) / count
+                                    for status, n in zip(CONDITION_STATUSES.tolist(), axis['statuses'][i])},
+            })
+    return table
+
+def condition_counts(summary):
+    return dict(zip(CONDITION_STATUSES.tolist(), summary[0]['statuses'].sum(axis=0).tolist()))
+
+# Tornado summary: each swept input moved across its range on its own, with
+# every other input at the baseline; inputs with the widest TKPH swing first
+def tornado(grid):
+    baseline_inputs = [grid.baseline[name] for name in INPUT_COLUMNS]
+    baseline_tkph, _ = tkph_values(*baseline_inputs, rules=grid.rules)
+    bars = []
+    for j, (name, values) in enumerate(zip(INPUT_COLUMNS, grid.values)):
+        if len(values) < 2:
+            continue
+        inputs = list(baseline_inputs)
+        inputs[j] = values
+        with np.errstate(divide='ignore', invalid='ignore'):
+            tkph_final, _ = tkph_values(*inputs, rules=grid.rules)
+        tkph_final = np.broadcast_to(tkph_final, values.shape)
+        low, high = int(np.nanargmin(tkph_final)), int(np.nanargmax(tkph_final))
+        bars.append({
+            'input': name,
+            'low_value': values[low].item(),
+            'high_value': values[high].item(),
+            'low_tkph_final': float(tkph_final[low]),
+            'high_tkph_final': float(tkph_final[high]),
+            'swing': float(tkph_final[high] - tkph_final[low]),
+        })
+    bars.sort(key=lambda bar: -bar['swing'])
+    return {'baseline': dict(grid.baseline), 'baseline_tkph_final': float(baseline_tkph), 'bars': bars}
+
+def sweep_report(grid, summary):
+    return {
+        'points': grid.size,
+        'rule_version': grid.rules.key,
+        'inputs': {name: values.tolist() for name, values in zip(INPUT_COLUMNS, grid.values)},
+        'condition_counts': condition_counts(summary),
+        'sensitivity': sensitivity_table(grid, summary),
+        'tornado': tornado(grid),
+    }
+
+def format_report(report):
+    lines = [f"{report['points']} combinations scored"]
+    lines.append('  '.join(f'{status}: {n}' for status, n in report['condition_counts'].items()))
+    lines.append('')
+    lines.append(f"Tornado (one input at a time, baseline TKPH {report['tornado']['baseline_tkph_final']:.1f})")
+    for bar in report['tornado']['bars']:
+        lines.append(f"  {bar['input']:24s} {bar['low_tkph_final']:10.1f} .. {bar['high_tkph_final']:<10.1f}"
+                     f" swing {bar['swing']:.1f}  ({bar['low_value']} .. {bar['high_value']})")
+    lines.append('')
+    lines.append(f"{'input':24s} {'value':>10s} {'mean':>10s} {'min':>10s} {'max':>10s} "
+                 f"{'ratio':>7s} {'critical':>9s}")
+    for row in report['sensitivity']:
+        value = row['value'] if isinstance(row['value'], str) else f"{row['value']:.4g}"
+        lines.append(f"{row['input']:24s} {value:>10s} {row['mean_tkph_final']:10.1f} "
+                     f"{row['min_tkph_final']:10.1f} {row['max_tkph_final']:10.1f} "
+                     f"{row['mean_ratio']:7.3f} {row['condition_share'][CONDITION_STATUSES[-1]]:9.1%}")
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Sweep TKPH over a grid of input values.')
+    parser.add_argument('--axis', action='append', default=[], metavar='NAME=VALUES',
+                        help='input to sweep: start:stop:num, v1,v2,..., terrain_type=all or '
+                             'tire_wear_percentage=bands (default: every input around the baseline)')
+    parser.add_argument('--baseline', action='append', default=[], metavar='NAME=VALUE',
+                        help='value for an input that is not swept')
+    parser.add_argument('--rules', help='rules file (default: TKPH_RULES_PATH)')
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--chunksize', type=int, default=SWEEP_CHUNKSIZE)
+    parser.add_argument('--output', help='write every grid point to this CSV file')
+    parser.add_argument('--json', action='store_true', help='print the report as JSON')
+    args = parser.parse_args(argv)
+
+    try:
+        rules = get_rules(path=args.rules)
+        baseline = dict(parse_baseline(spec) for spec in args.baseline)
+        axes = dict(parse_axis(spec, rules) for spec in args.axis) or default_axes(baseline, rules)
+        grid = SweepGrid(axes, baseline, args.chunksize, rules)
+    except (OSError, ValueError) as e:
+        print(f"Invalid input: {e}", file=sys.stderr)
+        return 1
+
+    output = open(args.output, 'w', newline='') if args.output else None
+    try:
+        on_rows = None
+        if output is not None:
+            writer = csv.writer(output)
+            writer.writerow(INPUT_COLUMNS + ['tkph_final', 'suitable_tkph', 'condition_status'])
+            on_rows = writer.writerows
+        summary = run_sweep(grid, args.workers, on_rows)
+    finally:
+        if output is not None:
+            output.close()
+
+    report = sweep_report(grid, summary)
+    print(json.dumps(report, indent=2) if args.json else format_report(report))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,314 @@
+import argparse
+import csv
+import json
+import sys
+from datetime import datetime, timedelta
+
+from tkph.core import SPEED_FACTOR, calculate_average_speed, calculate_tkph, evaluate_conditions
+from tkph.rules import get_rules
+from tkph.store import parse_timestamp
+
+# Haul-cycle telemetry -> per-shift TKPH inputs, as a chain of generators, so a
+# log of any size is processed with memory proportional to the number of
+# dumpers, not the number of events:
+#
+#   read_events(stream)        one dict per event, parsed lazily line by line
+#   shift_windows(events)      per dumper and shift: cycles, distances, hours
+#   score_shifts(shifts, ...)  TKPH final / suitable / condition per shift
+#
+# Each event is one finished trip leg:
+#   timestamp    when the leg ended (epoch seconds, ISO 8601 or TIMESTAMP_FORMAT)
+#   dumper_id
+#   trip         'loaded' (face to dump) or 'empty' (dump back to the face)
+#   distance_km  length of the leg
+# Optionally terrain_type, tire_wear_percentage, tyre_load_empty and
+# tyre_load_fully_loaded, which override the defaults for that shift.
+#
+# A loaded leg followed by an empty leg is one haul cycle; the round trip
+# distance is their sum. Cycle time is measured between consecutive cycle ends
+# of the same dumper, so the very first cycle of a dumper is counted but not
+# timed. Events must be in time order per dumper; older ones are skipped.
+#
+#   python -m tkph.telemetry haul_events.jsonl --load-empty 20 --load-loaded 55 --wear 30
+
+TRIP_LOADED = 'loaded'
+TRIP_EMPTY = 'empty'
+PROFILE_FIELDS = ['terrain_type', 'tire_wear_percentage', 'tyre_load_empty', 'tyre_load_fully_loaded']
+SHIFT_FIELDS = ['dumper_id', 'shift_start', 'last_cycle_end', 'cycles_per_shift', 'distance_loaded',
+                'cycle_time', 'total_shift_hours', 'round_trip_distances'] + PROFILE_FIELDS
+RESULT_FIELDS = ['tkph_final', 'suitable_tkph', 'condition_status']
+
+DEFAULT_SHIFT_HOURS = 12
+DEFAULT_SHIFT_START_HOUR = 6
+
+
+def parse_event_time(value):
+    if isinstance(value, (int, float)):
+        return int(value)
+    text = str(value).strip()
+    try:
+        return int(float(text))
+    except ValueError:
+        pass
+    try:
+        return parse_timestamp(text)
+    except ValueError:
+        return int(datetime.fromisoformat(text).timestamp())
+
+# Yield events from a CSV or JSON Lines stream as dicts with a parsed
+# 'timestamp', 'dumper_id', 'trip' and 'distance_km'; bad lines are reported
+# on stderr and skipped
+def read_events(stream, fmt='jsonl'):
+    if fmt == 'csv':
+        records = enumerate(csv.DictReader(stream), start=2)
+    else:
+        records = ((n, line) for n, line in enumerate(stream, start=1) if line.strip())
+    for line_number, record in records:
+        try:
+            if fmt != 'csv':
+                record = json.loads(record)
+            event = {key: value for key, value in record.items() if value not in (None, '')}
+            event['timestamp'] = parse_event_time(event['timestamp'])
+            event['dumper_id'] = str(event['dumper_id'])
+            event['trip'] = str(event['trip']).strip().lower()
+            if event['trip'] not in (TRIP_LOADED, TRIP_EMPTY):
+                raise ValueError(f"trip must be '{TRIP_LOADED}' or '{TRIP_EMPTY}'")
+            event['distance_km'] = float(event['distance_km'])
+        except KeyError as e:
+            print(f"line {line_number}: missing field {e.args[0]}", file=sys.stderr)
+            continue
+        except (TypeError, ValueError) as e:
+            print(f"line {line_number}: {e}", file=sys.stderr)
+            continue
+        yield event
+
+
+# Start (epoch seconds) of the shift containing ts. Shifts are shift_hours
+# long and one of them starts at first_hour:00 local time every day.
+def shift_start(ts, shift_hours=DEFAULT_SHIFT_HOURS, first_hour=DEFAULT_SHIFT_START_HOUR):
+    local = datetime.fromtimestamp(ts)
+    anchor = local.replace(hour=first_hour, minute=0, second=0, microsecond=0)
+    if local < anchor:
+        anchor -= timedelta(days=1)
+    length = timedelta(hours=shift_hours)
+    return int((anchor + ((local - anchor) // length) * length).timestamp())
+
+# Running totals for one dumper and shift
+class ShiftWindow:
+    __slots__ = ('dumper_id', 'shift_start', 'shift_end', 'cycles', 'round_trip_distances',
+                 'last_cycle_end', 'loaded_km', 'cycle_seconds', 'timed_cycles', 'profile')
+
+    def __init__(self, dumper_id, start, end):
+        self.dumper_id = dumper_id
+        self.shift_start = start
+        self.shift_end = end
+        self.cycles = 0
+        self.round_trip_distances = []
+        self.last_cycle_end = None
+        self.loaded_km = 0.0
+        self.cycle_seconds = 0
+        self.timed_cycles = 0
+        self.profile = {}
+
+    def add_cycle(self, ts, loaded_km, empty_km, seconds):
+        self.cycles += 1
+        self.last_cycle_end = ts
+        self.round_trip_distances.append(loaded_km + empty_km)
+        self.loaded_km += loaded_km
+        if seconds is not None:
+            self.cycle_seconds += seconds
+            self.timed_cycles += 1
+
+    # The calculator inputs for this shift. Hours are the time spent cycling
+    # (mean cycle time x cycles); None until at least one cycle was timed.
+    def inputs(self):
+        if not self.timed_cycles:
+            return None
+        cycle_time = self.cycle_seconds / self.timed_cycles / 3600
+        return dict(self.profile, dumper_id=self.dumper_id, shift_start=self.shift_start,
+                    last_cycle_end=self.last_cycle_end, cycles_per_shift=self.cycles,
+                    distance_loaded=self.loaded_km / self.cycles, cycle_time=cycle_time,
+                    total_shift_hours=cycle_time * self.cycles,
+                    round_trip_distances=list(self.round_trip_distances))
+
+# Per dumper: the open shift and the half-finished cycle
+class _DumperState:
+    __slots__ = ('window', 'loaded_km', 'last_cycle_end', 'last_ts')
+
+    def __init__(self):
+        self.window = None
+        self.loaded_km = None
+        self.last_cycle_end = None
+        self.last_ts = None
+
+# Group events into shifts per dumper; yields one ShiftWindow as soon as the
+# dumper's next shift starts (and the rest at the end of the stream). Windows
+# with no complete cycle are not yielded. `counts` (a dict), if given,
+# receives the number of events used and skipped.
+def shift_windows(events, shift_hours=DEFAULT_SHIFT_HOURS, first_hour=DEFAULT_SHIFT_START_HOUR,
+                  counts=None):
+    counts = counts if counts is not None else {}
+    counts.setdefault('events', 0)
+    counts.setdefault('skipped', 0)
+    dumpers = {}
+    for event in events:
+        ts = event['timestamp']
+        state = dumpers.get(event['dumper_id'])
+        if state is None:
+            state = dumpers[event['dumper_id']] = _DumperState()
+        elif ts < state.last_ts:
+            counts['skipped'] += 1
+            continue
+        counts['events'] += 1
+        state.last_ts = ts
+
+        window = state.window
+        if window is None or ts >= window.shift_end:
+            if window is not None and window.cycles:
+                yield window
+            start = shift_start(ts, shift_hours, first_hour)
+            end = int((datetime.fromtimestamp(start) + timedelta(hours=shift_hours)).timestamp())
+            window = state.window = ShiftWindow(event['dumper_id'], start, end)
+
+        for name in PROFILE_FIELDS:
+            if name in event:
+                window.profile[name] = event[name]
+
+        if event['trip'] == TRIP_LOADED:
+            # A loaded leg with no empty leg after it is an incomplete cycle
+            state.loaded_km = event['distance_km']
+        elif state.loaded_km is None:
+            # Empty leg without a loaded one (repositioning, start of log):
+            # nothing hauled, but the next cycle is timed from here
+            state.last_cycle_end = ts
+        else:
+            seconds = ts - state.last_cycle_end if state.last_cycle_end is not None else None
+            window.add_cycle(ts, state.loaded_km, event['distance_km'], seconds)
+            state.loaded_km = None
+            state.last_cycle_end = ts
+
+    for state in dumpers.values():
+        if state.window is not None and state.window.cycles:
+            yield state.window
+
+
+# Score each shift with the TKPH formula; `defaults` supplies the profile
+# fields (terrain, wear, tyre loads) the events did not carry. Yields the
+# shift inputs plus RESULT_FIELDS, or with an 'error' when it cannot be scored.
+def score_shifts(windows, defaults=None, speed_adjusted=True, rules=None):
+    defaults = {name: value for name, value in (defaults or {}).items() if value is not None}
+    rules = rules or get_rules()
+    for window in windows:
+        inputs = window.inputs()
+        if inputs is None:
+            yield {'dumper_id': window.dumper_id, 'shift_start': window.shift_start,
+                   'error': 'no timed haul cycle in this shift'}
+            continue
+        shift = dict(defaults, **inputs)
+        try:
+            missing = [name for name in PROFILE_FIELDS if name not in shift]
+            if missing:
+                raise ValueError(f"no value for {', '.join(missing)}")
+            tkph_final, suitable_tkph = calculate_tkph(
+                float(shift['distance_loaded']), float(shift['cycle_time']), str(shift['terrain_type']),
+                float(shift['tire_wear_percentage']), float(shift['tyre_load_empty']),
+                float(shift['tyre_load_fully_loaded']), shift['round_trip_distances'],
+                shift['cycles_per_shift'], shift['total_shift_hours'], speed_adjusted=speed_adjusted,
+                rules=rules)
+        except (TypeError, ValueError, ZeroDivisionError) as e:
+            shift['error'] = str(e)
+            yield shift
+            continue
+        shift['tkph_final'] = tkph_final
+        shift['suitable_tkph'] = suitable_tkph
+        shift['condition_status'] = evaluate_conditions(tkph_final, suitable_tkph, rules)
+        yield shift
+
+
+def main(argv=None):
+    from tkph.fleet import TYRE_POSITIONS
+
+    parser = argparse.ArgumentParser(description='Turn haul-cycle telemetry into per-shift TKPH readings.')
+    parser.add_argument('input', help='events file (.csv or .jsonl), or - for stdin')
+    parser.add_argument('--format', choices=['jsonl', 'csv'],
+                        help='input format (default: from the file extension, else jsonl)')
+    parser.add_argument('-o', '--output', help='results file (default: stdout)')
+    parser.add_argument('--output-format', choices=['jsonl', 'csv'], default='jsonl')
+    parser.add_argument('--shift-hours', type=float, default=DEFAULT_SHIFT_HOURS)
+    parser.add_argument('--shift-start', type=int, default=DEFAULT_SHIFT_START_HOUR,
+                        help='local hour at which a shift starts (default 6)')
+    parser.add_argument('--terrain', default='Flat', help='terrain type when events carry none')
+    parser.add_argument('--wear', type=float, help='tyre wear percentage when events carry none')
+    parser.add_argument('--load-empty', type=float, help='tyre load (empty) when events carry none')
+    parser.add_argument('--load-loaded', type=float, help='tyre load (fully loaded) when events carry none')
+    parser.add_argument('--formula', choices=['speed', 'base'], default='speed',
+                        help="'speed' scales by average speed (default), 'base' is the web app formula")
+    parser.add_argument('--save', action='store_true',
+                        help='record each shift in the tracking store, once per tyre position')
+    parser.add_argument('--tyre-positions', default=','.join(TYRE_POSITIONS),
+                        help='positions recorded with --save (comma-separated)')
+    args = parser.parse_args(argv)
+
+    fmt = args.format or ('csv' if args.input.lower().endswith('.csv') else 'jsonl')
+    source = sys.stdin if args.input == '-' else open(args.input, newline='' if fmt == 'csv' else None)
+    output = open(args.output, 'w', newline='') if args.output else sys.stdout
+    defaults = {'terrain_type': args.terrain, 'tire_wear_percentage': args.wear,
+                'tyre_load_empty': args.load_empty, 'tyre_load_fully_loaded': args.load_loaded}
+    positions = [position.strip() for position in args.tyre_positions.split(',') if position.strip()]
+    store = None
+    if args.save:
+        from tkph.store import get_store
+        store = get_store()
+
+    rules = get_rules()
+    counts = {}
+    shifts = errors = 0
+    pending = []
+    writer = None
+    try:
+        windows = shift_windows(read_events(source, fmt), args.shift_hours, args.shift_start, counts)
+        for shift in score_shifts(windows, defaults, args.formula == 'speed', rules):
+            if 'error' in shift:
+                errors += 1
+                print(f"{shift['dumper_id']} shift starting {datetime.fromtimestamp(shift['shift_start'])}: "
+                      f"{shift['error']}", file=sys.stderr)
+                continue
+            shifts += 1
+            if args.output_format == 'csv':
+                if writer is None:
+                    writer = csv.DictWriter(output, fieldnames=SHIFT_FIELDS + RESULT_FIELDS)
+                    writer.writeheader()
+                writer.writerow(dict(shift, round_trip_distances=','.join(
+                    f'{d:g}' for d in shift['round_trip_distances'])))
+            else:
+                output.write(json.dumps(shift, separators=(',', ':')) + '\n')
+
+            if store is not None:
+                # Readings are stamped with the end of the shift's last cycle
+                speed_multiplier = 1.0
+                if args.formula == 'speed':
+                    speed_multiplier = 1 + calculate_average_speed(
+                        shift['round_trip_distances'], shift['cycles_per_shift'],
+                        shift['total_shift_hours']) * SPEED_FACTOR
+                pending.extend((shift['last_cycle_end'], shift['dumper_id'], position,
+                                float(shift['tkph_final']), float(shift['suitable_tkph']),
+                                str(shift['terrain_type']), float(shift['tire_wear_percentage']),
+                                rules.key, speed_multiplier)
+                               for position in positions)
+                if len(pending) >= 500:
+                    store.append_many(pending)
+                    pending = []
+        if store is not None and pending:
+            store.append_many(pending)
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if args.output:
+            output.close()
+
+    print(f"{counts.get('events', 0)} events ({counts.get('skipped', 0)} out of order, skipped) -> "
+          f"{shifts} shifts scored, {errors} not scored", file=sys.stderr)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,183 @@
+import atexit
+import os
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from tkph.metrics import activate as activate_metrics, metrics, stage
+
+# Job states, in order
+QUEUED = 'queued'
+SAVED = 'saved'
+READY = 'ready'
+FAILED = 'failed'
+FINISHED_STATES = (READY, FAILED)
+
+# A batch that fails to write (e.g. store locked) is retried with backoff
+WRITE_ATTEMPTS = 3
+# Seconds between store lookups while waiting on another process's job
+JOB_POLL_INTERVAL = 0.1
+
+# Background writer: readings submitted from request handlers are queued and
+# a single thread per process persists them in batches (one store transaction
+# per batch), then runs the after-write hook (chart rendering, stats) for the
+# tyres that changed. Anything still queued is flushed on interpreter exit.
+# Job progress past 'queued' is also recorded in the store, so a status
+# request that reaches another worker process can still be answered.
+class BackgroundWriter:
+    def __init__(self, get_store, after_write=None, max_batch=500, flush_interval=0.05,
+                 max_jobs=10000, metrics=None):
+        self.get_store = get_store
+        self.after_write = after_write
+        # Registry (tkph.metrics) the writer thread records to
+        self.metrics = metrics
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.max_jobs = max_jobs
+        self.batches_written = 0
+        self.rows_written = 0
+        self._queue = queue.Queue()
+        self._jobs = OrderedDict()
+        self._changed = threading.Condition()
+        self._start_lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self._stopped = False
+        atexit.register(self.shutdown)
+
+    def _ensure_started(self):
+        # Threads do not survive a fork, so each worker process starts its own
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._thread is None or self._pid != os.getpid():
+                self._queue = queue.Queue()
+                self._thread = threading.Thread(target=self._run, name='tkph-writer', daemon=True)
+                self._pid = os.getpid()
+                self._stopped = False
+                self._thread.start()
+
+    # Queue one reading, optionally with its scoring inputs and rule version
+    # (see tkph.store.SCORING_FIELDS); returns a job id for status() / wait()
+    def submit(self, dumper_id, tyre_position, tkph_final, suitable_tkph, terrain_type=None,
+               tire_wear_percentage=None, rule_version=None, speed_multiplier=None):
+        if self._stopped:
+            raise RuntimeError("Background writer has been shut down")
+        self._ensure_started()
+        job_id = uuid.uuid4().hex
+        with self._changed:
+            self._jobs[job_id] = {'status': QUEUED, 'dumper_id': dumper_id,
+                                  'tyre_position': tyre_position, 'error': None}
+            while len(self._jobs) > self.max_jobs:
+                self._jobs.popitem(last=False)
+        row = (int(time.time()), dumper_id, tyre_position, float(tkph_final), float(suitable_tkph),
+               terrain_type, tire_wear_percentage, rule_version, speed_multiplier)
+        self._queue.put((job_id, row))
+        return job_id
+
+    # Latest status of a job; one submitted in another process is looked up
+    # in the store (None until its batch has been written)
+    def status(self, job_id):
+        with self._changed:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                return dict(job)
+        return self.get_store().job_status(job_id)
+
+    # Block until the job is finished (or timeout); returns its latest status
+    def wait(self, job_id, timeout=None):
+        with self._changed:
+            if job_id in self._jobs:
+                self._changed.wait_for(
+                    lambda: self._jobs.get(job_id, {'status': FAILED})['status'] in FINISHED_STATES,
+                    timeout)
+                job = self._jobs.get(job_id)
+                return dict(job) if job is not None else None
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            status = self.get_store().job_status(job_id)
+            if status is not None and status['status'] in FINISHED_STATES:
+                return status
+            if deadline is not None and time.monotonic() >= deadline:
+                return status
+            time.sleep(JOB_POLL_INTERVAL)
+
+    def _set_status(self, jobs, status, error=None):
+        with self._changed:
+            for job_id, _ in jobs:
+                job = self._jobs.get(job_id)
+                if job is not None:
+                    job['status'] = status
+                    job['error'] = error
+            self._changed.notify_all()
+        try:
+            self.get_store().save_job_status([(job_id, row[1], row[2]) for job_id, row in jobs],
+                                             status, error)
+        except Exception as e:
+            print(f"Error recording TKPH job status: {e}")
+
+    def _next_batch(self):
+        item = self._queue.get()
+        batch = [item]
+        deadline = time.monotonic() + self.flush_interval
+        while item is not None and len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=max(remaining, 0)) if remaining > 0 \
+                    else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        if self.metrics is not None:
+            activate_metrics(self.metrics)
+        while True:
+            batch = self._next_batch()
+            stop = batch[-1] is None
+            jobs = [item for item in batch if item is not None]
+            if jobs:
+                self._write(jobs)
+            if stop:
+                return
+
+    def _write(self, jobs):
+        for attempt in range(WRITE_ATTEMPTS):
+            try:
+                with stage('writer.save_batch'):
+                    self.get_store().append_many([row for _, row in jobs])
+                break
+            except Exception as e:
+                print(f"Error saving TKPH readings (attempt {attempt + 1}): {e}")
+                if attempt + 1 == WRITE_ATTEMPTS:
+                    self._set_status(jobs, FAILED, str(e))
+                    return
+                time.sleep(0.5 * 2 ** attempt)
+        self.batches_written += 1
+        self.rows_written += len(jobs)
+        metrics.inc('tkph_writer_batches_total')
+        self._set_status(jobs, SAVED)
+
+        if self.after_write is not None:
+            series = {(row[1], row[2]) for _, row in jobs}
+            try:
+                with stage('writer.after_write'):
+                    self.after_write(series)
+            except Exception as e:
+                print(f"Error after saving TKPH readings: {e}")
+        self._set_status(jobs, READY)
+
+    # Flush everything queued so far and stop the writer thread
+    def shutdown(self, timeout=None):
+        if self._thread is None or self._pid != os.getpid() or self._stopped:
+            return
+        self._stopped = True
+        self._queue.put(None)
+        self._thread.join(timeout)
+
+    def pending(self):
+        return self._queue.qsize()